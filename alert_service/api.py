@@ -8,13 +8,15 @@ from dataclasses import dataclass, field
 from datetime import datetime, timedelta, timezone
 from enum import Enum
 from typing import Dict, Any, List, Optional
+from urllib.parse import urljoin
 
 import httpx
-from fastapi import APIRouter, BackgroundTasks, HTTPException, status
+from fastapi import APIRouter, BackgroundTasks, HTTPException, WebSocket, WebSocketDisconnect, status
 from pydantic import BaseModel, Field
 
 # Import data gateway from main project
 from src.agent.data_gateway import EigenFlowAPI
+from alert_service.realtime import realtime_hub, serve_connection
 
 logger = logging.getLogger(__name__)
 router = APIRouter(prefix="/alert", tags=["alert"])
@@ -29,6 +31,8 @@ NOTIFICATION_COOLDOWN_FREQUENCY = int(os.getenv("ALERT_COOLDOWN_FREQUENCY_SECOND
 MARGIN_CHECK_URL = os.getenv("MARGIN_CHECK_URL", "http://0.0.0.0:8001/agent/margin-check")
 MARGIN_RECHECK_URL = os.getenv("MARGIN_RECHECK_URL", "http://0.0.0.0:8001/agent/margin-check/recheck")
 MARGIN_ENDPOINT_TIMEOUT = float(os.getenv("MARGIN_ENDPOINT_TIMEOUT", "100"))
+MARGIN_USE_JOBS = os.getenv("MARGIN_USE_JOBS", "true").lower() == "true"  # submit as agent jobs and long-poll the result
+MARGIN_JOB_POLL_SECONDS = float(os.getenv("MARGIN_JOB_POLL_SECONDS", "25"))
 
 class AlertStatus(str, Enum):
     """Enumeration of alert card lifecycle states."""
@@ -96,6 +100,31 @@ class AlertCard:
         self.status = status
         self.updated_at = datetime.utcnow()
 
+    def fingerprint(self) -> tuple:
+        """Cheap summary that changes whenever to_dict() would."""
+        return (
+            self.status, self.margin_level, self.updated_at, len(self.history), len(self.reports),
+            self.thread_id, self.ignore_until, self.notifications_sent, id(self.last_margin_snapshot),
+        )
+
+
+class CardChangeLock:
+    """card_lock that pushes the cards changed while it was held to WebSocket subscribers on release."""
+
+    def __init__(self, service: "MonitoringService"):
+        self._lock = asyncio.Lock()
+        self._service = service
+
+    async def __aenter__(self) -> "CardChangeLock":
+        await self._lock.acquire()
+        return self
+
+    async def __aexit__(self, *exc_info) -> None:
+        try:
+            self._service.publish_card_changes()
+        finally:
+            self._lock.release()
+
 
 class MonitoringService:
     """LP margin monitoring service with alert card lifecycle management."""
@@ -106,7 +135,11 @@ class MonitoringService:
         self.last_alerts = {}  # Track last alert time for logging/compatibility
         self.cards: Dict[str, AlertCard] = {}
         self.lp_to_card: Dict[str, str] = {}
-        self.card_lock = asyncio.Lock()
+        self.card_lock = CardChangeLock(self)
+        self._card_fingerprints: Dict[str, tuple] = {}
+        self.last_cycle_at: Optional[datetime] = None
+        self.last_cycle_accounts = 0
+        self.last_cycle_error: Optional[str] = None
     
     async def monitor_margins(self):
         """Monitor LP margins, manage alert cards, and orchestrate notifications."""
@@ -124,10 +157,14 @@ class MonitoringService:
                 await self._process_accounts(accounts, now)
                 await self._process_notifications(now)
 
+                self.last_cycle_at, self.last_cycle_accounts, self.last_cycle_error = now, len(accounts), None
+                realtime_hub.publish_heartbeat(self.heartbeat())
                 await asyncio.sleep(MONITORING_INTERVAL)
 
             except Exception as exc:
                 logger.error(f"Error in monitoring loop: {exc}")
+                self.last_cycle_at, self.last_cycle_error = datetime.utcnow(), str(exc)
+                realtime_hub.publish_heartbeat(self.heartbeat())
                 await asyncio.sleep(MONITORING_INTERVAL)
     
     async def fetch_lp_data(self) -> List[Dict[str, Any]]:
@@ -149,6 +186,30 @@ class MonitoringService:
             return []
     
     
+    def heartbeat(self) -> Dict[str, Any]:
+        """Monitoring loop status pushed to heartbeat subscribers."""
+        by_status: Dict[str, int] = {}
+        for card in self.cards.values():
+            by_status[card.status.value] = by_status.get(card.status.value, 0) + 1
+        return {
+            "running": self.is_running,
+            "interval": MONITORING_INTERVAL,
+            "last_cycle_at": self.last_cycle_at.isoformat() + "Z" if self.last_cycle_at else None,
+            "accounts": self.last_cycle_accounts,
+            "error": self.last_cycle_error,
+            "cards_by_status": by_status,
+        }
+
+    def publish_card_changes(self) -> None:
+        """Push cards changed since the last call to realtime subscribers (card_lock held)."""
+        publish = realtime_hub.has_card_subscribers()
+        for card in self.cards.values():
+            fingerprint = card.fingerprint()
+            if self._card_fingerprints.get(card.id) != fingerprint:
+                self._card_fingerprints[card.id] = fingerprint
+                if publish:
+                    realtime_hub.publish_card(card.to_dict())
+
     def stop_monitoring(self):
         """Stop the monitoring service."""
         self.is_running = False
@@ -303,8 +364,12 @@ class MonitoringService:
             if not card:
                 return
             lp_name = card.lp_name
+            # Known before the report runs, so dashboards can follow its live token stream
+            card.thread_id = f"margin_alert_{card_id}"
+            thread_id = card.thread_id
 
         payload = {
+            "thread_id": thread_id,
             "eventType": "MARGIN_ALERT",
             "payload": {
                 "lp": lp_name,
@@ -327,7 +392,8 @@ class MonitoringService:
                 "response": response,
             }
             card.reports.append(report_entry)
-            card.thread_id = response.get("thread_id") or card.thread_id
+            # A call that never reached the agent leaves no thread to recheck
+            card.thread_id = response.get("thread_id") or (None if response.get("status") == "error" else card.thread_id)
             if response.get("status") == "error":
                 card.add_history(
                     actor="system",
@@ -407,7 +473,11 @@ class MonitoringService:
         """Call external margin endpoints safely with consistent error handling."""
         try:
             async with httpx.AsyncClient(timeout=MARGIN_ENDPOINT_TIMEOUT) as client:
-                response = await client.post(url, json=payload)
+                # Tell the agent how long we wait so it can degrade instead of timing out
+                headers = {"X-Request-Timeout": str(MARGIN_ENDPOINT_TIMEOUT)}
+                if MARGIN_USE_JOBS:
+                    return await self._await_margin_job(client, url, payload, headers)
+                response = await client.post(url, json=payload, headers=headers)
                 response.raise_for_status()
                 print("Margin endpoint response:", response.json())
                 return response.json()
@@ -419,6 +489,25 @@ class MonitoringService:
                 "error": str(exc),
             }
 
+    async def _await_margin_job(
+        self, client: httpx.AsyncClient, url: str, payload: Dict[str, Any], headers: Dict[str, str]
+    ) -> Dict[str, Any]:
+        """Submit a margin endpoint call as an agent job and long-poll its result."""
+        response = await client.post(url, params={"job": "true"}, json=payload, headers=headers)
+        response.raise_for_status()
+        job = response.json()
+        status_url = urljoin(url, job["status_url"])
+        deadline = asyncio.get_running_loop().time() + MARGIN_ENDPOINT_TIMEOUT
+        # Each poll returns as soon as the job finishes, so no connection is held for the whole run
+        while job.get("result") is None and asyncio.get_running_loop().time() < deadline:
+            response = await client.get(status_url, params={"wait": MARGIN_JOB_POLL_SECONDS})
+            response.raise_for_status()
+            job = response.json()
+        if job.get("result") is None:
+            raise TimeoutError(f"margin job {job['job_id']} still {job['status']} after {MARGIN_ENDPOINT_TIMEOUT}s")
+        logger.debug("Margin job %s finished: %s", job["job_id"], job["result"])
+        return job["result"]
+
     def _schedule_task(self, coro, task_name: str) -> None:
         """Schedule a background coroutine and surface exceptions via logging."""
         task = asyncio.create_task(coro, name=task_name)
@@ -470,7 +559,8 @@ class MonitoringService:
             if not card:
                 raise HTTPException(status_code=status.HTTP_404_NOT_FOUND, detail="Alert card not found")
 
-            if not card.thread_id:
+            # thread_id is assigned when the initial report starts; it can be rechecked once that report is in
+            if not card.thread_id or not card.reports:
                 card.add_history(
                     actor="system",
                     action="recheck_skipped",
@@ -605,9 +695,20 @@ async def get_monitoring_status():
             "total": len(cards),
             "by_status": status_counts,
         },
+        "realtime": realtime_hub.snapshot(),
     }
 
 
+@router.websocket("/ws")
+async def alert_websocket(websocket: WebSocket):
+    """Multiplexed card changes, agent thread streams and monitor heartbeats over one connection."""
+    await websocket.accept()
+    try:
+        await serve_connection(websocket, realtime_hub, monitoring_service.list_cards, monitoring_service.heartbeat)
+    except WebSocketDisconnect:
+        pass
+
+
 @router.get("/cards")
 async def list_alert_cards(status: Optional[str] = None, lp: Optional[str] = None):
     """List alert cards with optional status or LP filters."""
@@ -0,0 +1,394 @@
+"""Multiplexed WebSocket channel for alert dashboards.
+
+Dashboards used to poll ``/alert/cards`` and open one SSE connection per
+margin check. ``/alert/ws`` carries everything over one connection; the
+client subscribes to channels and the server pushes:
+
+- ``cards``: a snapshot of matching cards, then every change, filtered by LP
+  and/or status
+- ``agent``: graph events (``token``, ``interrupt``, ``complete``, ...) of a
+  thread_id, relayed from the agent's ``/agent/threads/{thread_id}/events``
+  through one shared upstream connection per thread
+- ``heartbeat``: the monitoring loop's status after every cycle
+
+Each connection has a bounded outbound buffer (``ALERT_WS_QUEUE_SIZE``).
+When a client reads slower than events arrive, the subscription's drop
+policy decides what is lost:
+
+- ``latest``: keep only the newest pending update per card (default for cards)
+- ``drop_oldest``: evict the oldest pending event (default for agent streams)
+- ``drop_newest``: discard the incoming event (default for heartbeats)
+- ``disconnect``: close the connection (code 1013) so the client resyncs
+
+Subscription acknowledgements, errors and terminal agent events are never
+dropped. Every delivered event carries the number of events its
+subscription lost since the previous delivery.
+
+Client messages::
+
+    {"op": "subscribe", "id": "c1", "channel": "cards", "lp": ["CFH"], "status": ["awaiting_hitl"]}
+    {"op": "subscribe", "id": "a1", "channel": "agent", "thread_id": "...", "policy": "drop_oldest"}
+    {"op": "subscribe", "id": "h1", "channel": "heartbeat"}
+    {"op": "unsubscribe", "id": "c1"}
+    {"op": "ping"}
+
+Server messages have ``type`` ``subscribed``, ``unsubscribed``, ``event``,
+``error``, ``pong`` or ``keepalive``.
+"""
+
+import asyncio
+import itertools
+import json
+import logging
+import os
+from collections import OrderedDict
+from contextlib import suppress
+from typing import Any, AsyncIterator, Callable, Dict, Iterable, Optional, Set, Tuple
+
+import httpx
+
+logger = logging.getLogger(__name__)
+
+# Configuration
+WS_QUEUE_SIZE = int(os.getenv("ALERT_WS_QUEUE_SIZE", "256"))  # pending messages per connection
+WS_KEEPALIVE_SECONDS = float(os.getenv("ALERT_WS_KEEPALIVE_SECONDS", "20"))  # idle keepalive interval
+WS_MAX_SUBSCRIPTIONS = int(os.getenv("ALERT_WS_MAX_SUBSCRIPTIONS", "64"))  # per connection
+AGENT_THREAD_EVENTS_URL = os.getenv(
+    "AGENT_THREAD_EVENTS_URL", "http://0.0.0.0:8001/agent/threads/{thread_id}/events"
+)
+AGENT_RELAY_RETRY_SECONDS = float(os.getenv("AGENT_RELAY_RETRY_SECONDS", "2"))
+
+CHANNELS = ("cards", "agent", "heartbeat")
+DROP_POLICIES = ("latest", "drop_oldest", "drop_newest", "disconnect")
+DEFAULT_POLICIES = {"cards": "latest", "agent": "drop_oldest", "heartbeat": "drop_newest"}
+
+# Agent events that end a run; never dropped
+ESSENTIAL_AGENT_EVENTS = ("interrupt", "complete", "error", "end")
+
+
+class SlowConsumer(Exception):
+    """Raised when a ``disconnect``-policy subscription overflows the connection buffer."""
+
+
+class Subscription:
+    """One client subscription: channel, filters and drop policy."""
+
+    def __init__(self, sub_id: str, channel: str, policy: str, lps: Set[str], statuses: Set[str], thread_id: Optional[str]):
+        self.id = sub_id
+        self.channel = channel
+        self.policy = policy
+        self.lps = lps
+        self.statuses = statuses
+        self.thread_id = thread_id
+        self.dropped = 0
+
+    def matches_card(self, card: Dict[str, Any]) -> bool:
+        return (not self.lps or card.get("lp") in self.lps) and (not self.statuses or card.get("status") in self.statuses)
+
+
+class Connection:
+    """Outbound buffer and subscriptions of one WebSocket client."""
+
+    _keys = itertools.count()
+
+    def __init__(self, queue_size: int = WS_QUEUE_SIZE):
+        self.queue_size = queue_size
+        self.subscriptions: Dict[str, Subscription] = {}
+        self.pending: "OrderedDict[Any, Tuple[Optional[Subscription], Dict[str, Any], bool]]" = OrderedDict()
+        self.ready = asyncio.Event()
+        self.closed_reason: Optional[str] = None
+        self.sent = 0
+
+    def offer(
+        self,
+        message: Dict[str, Any],
+        subscription: Optional[Subscription] = None,
+        key: Any = None,
+        essential: bool = False,
+    ) -> None:
+        """
+        Queue a message, applying the subscription's drop policy when the buffer is full
+
+        Args:
+            message: Message to send
+            subscription: Subscription it belongs to (None for control messages, which are essential)
+            key: Coalescing key for the ``latest`` policy (e.g. the card id)
+            essential: Never dropped (acks, terminal agent events)
+        """
+        essential = essential or subscription is None
+        if subscription is not None and subscription.policy == "latest" and key is not None:
+            slot = (subscription.id, key)
+            if slot in self.pending:
+                # Replace the pending update in place; the superseded one counts as dropped
+                self.pending[slot] = (subscription, message, essential)
+                subscription.dropped += 1
+                return
+        else:
+            slot = next(self._keys)
+
+        if len(self.pending) >= self.queue_size and not essential:
+            if subscription.policy == "disconnect":
+                self.closed_reason = f"subscription {subscription.id} fell {self.queue_size} messages behind"
+                self.ready.set()
+                raise SlowConsumer(self.closed_reason)
+            if subscription.policy == "drop_newest":
+                subscription.dropped += 1
+                return
+            victim = next((k for k, (_, _, keep) in self.pending.items() if not keep), None)
+            if victim is None:
+                subscription.dropped += 1
+                return
+            victim_subscription = self.pending.pop(victim)[0]
+            victim_subscription.dropped += 1
+
+        self.pending[slot] = (subscription, message, essential)
+        self.ready.set()
+
+    async def next_message(self, keepalive: Optional[float] = WS_KEEPALIVE_SECONDS) -> Optional[Dict[str, Any]]:
+        """Next message to send (with its subscription's drop count), or None after ``keepalive`` idle seconds."""
+        while True:
+            if self.closed_reason:
+                raise SlowConsumer(self.closed_reason)
+            if self.pending:
+                break
+            self.ready.clear()
+            try:
+                await asyncio.wait_for(self.ready.wait(), keepalive)
+            except TimeoutError:
+                return None
+        _, (subscription, message, _) = self.pending.popitem(last=False)
+        if subscription is not None and subscription.dropped:
+            message = {**message, "dropped": subscription.dropped}
+            subscription.dropped = 0
+        self.sent += 1
+        return message
+
+
+class AgentStreamRelay:
+    """One upstream subscription to a thread's agent events, shared by every local subscriber."""
+
+    def __init__(self, hub: "RealtimeHub", thread_id: str):
+        self.hub = hub
+        self.thread_id = thread_id
+        self.task: Optional[asyncio.Task] = None
+
+    def start(self) -> None:
+        self.task = asyncio.create_task(self._run(), name=f"agent-relay-{self.thread_id}")
+
+    async def _run(self) -> None:
+        while True:
+            try:
+                async for event_type, payload in self.hub.agent_events(self.thread_id):
+                    self.hub.publish_agent_event(self.thread_id, event_type, payload)
+            except asyncio.CancelledError:
+                raise
+            except Exception as exc:
+                logger.warning("Agent stream relay for %s failed: %s", self.thread_id, exc)
+            await asyncio.sleep(AGENT_RELAY_RETRY_SECONDS)
+
+
+async def agent_thread_events(thread_id: str) -> AsyncIterator[Tuple[str, Dict[str, Any]]]:
+    """Follow the agent's SSE stream for ``thread_id`` and yield (event, payload) pairs."""
+    url = AGENT_THREAD_EVENTS_URL.format(thread_id=thread_id)
+    async with httpx.AsyncClient(timeout=httpx.Timeout(10.0, read=None)) as client:
+        async with client.stream("GET", url) as response:
+            response.raise_for_status()
+            event_type = None
+            async for line in response.aiter_lines():
+                if line.startswith("event: "):
+                    event_type = line[len("event: "):]
+                elif line.startswith("data: ") and event_type:
+                    yield event_type, json.loads(line[len("data: "):])
+                    event_type = None
+
+
+class RealtimeHub:
+    """Routes card changes, agent events and heartbeats to WebSocket subscriptions (one event loop)."""
+
+    def __init__(self, agent_events: Callable[[str], AsyncIterator[Tuple[str, Dict[str, Any]]]] = agent_thread_events):
+        self.agent_events = agent_events
+        self.connections: Set[Connection] = set()
+        self.relays: Dict[str, AgentStreamRelay] = {}
+        self.stats = {"connections": 0, "slow_consumer_disconnects": 0}
+
+    @staticmethod
+    def _deliver(connection: Connection, *args: Any, **kwargs: Any) -> None:
+        try:
+            connection.offer(*args, **kwargs)
+        except SlowConsumer:
+            pass  # the connection's writer closes it
+
+    def _subscriptions(self, channel: str) -> Iterable[Tuple[Connection, Subscription]]:
+        for connection in list(self.connections):
+            if connection.closed_reason:
+                continue
+            for subscription in list(connection.subscriptions.values()):
+                if subscription.channel == channel:
+                    yield connection, subscription
+
+    def has_card_subscribers(self) -> bool:
+        return any(True for _ in self._subscriptions("cards"))
+
+    def publish_card(self, card: Dict[str, Any]) -> None:
+        """Push a changed card to the subscriptions whose filters match it."""
+        for connection, subscription in self._subscriptions("cards"):
+            if subscription.matches_card(card):
+                message = {"type": "event", "id": subscription.id, "channel": "cards", "data": card}
+                self._deliver(connection, message, subscription, key=card.get("id"))
+
+    def publish_heartbeat(self, status: Dict[str, Any]) -> None:
+        """Push the monitoring loop's status to heartbeat subscriptions."""
+        for connection, subscription in self._subscriptions("heartbeat"):
+            message = {"type": "event", "id": subscription.id, "channel": "heartbeat", "data": status}
+            self._deliver(connection, message, subscription)
+
+    def publish_agent_event(self, thread_id: str, event_type: str, payload: Dict[str, Any]) -> None:
+        """Push one relayed agent event to the thread's subscriptions."""
+        for connection, subscription in self._subscriptions("agent"):
+            if subscription.thread_id == thread_id:
+                message = {"type": "event", "id": subscription.id, "channel": "agent", "event": event_type, "data": payload}
+                self._deliver(connection, message, subscription, essential=event_type in ESSENTIAL_AGENT_EVENTS)
+
+    def connect(self) -> Connection:
+        connection = Connection()
+        self.connections.add(connection)
+        self.stats["connections"] += 1
+        return connection
+
+    def disconnect(self, connection: Connection) -> None:
+        self.connections.discard(connection)
+        threads = {s.thread_id for s in connection.subscriptions.values() if s.channel == "agent"}
+        connection.subscriptions.clear()
+        for thread_id in threads:
+            self._release_relay(thread_id)
+
+    def subscribe(self, connection: Connection, request: Dict[str, Any]) -> Subscription:
+        """
+        Validate and register a subscription
+
+        Args:
+            connection: Client connection
+            request: The client's subscribe message
+
+        Returns:
+            The subscription (raises ValueError on invalid requests)
+        """
+        sub_id = str(request.get("id") or "")
+        channel = request.get("channel")
+        if not sub_id:
+            raise ValueError("subscribe requires an id")
+        if channel not in CHANNELS:
+            raise ValueError(f"unknown channel {channel!r}; expected one of {list(CHANNELS)}")
+        if sub_id not in connection.subscriptions and len(connection.subscriptions) >= WS_MAX_SUBSCRIPTIONS:
+            raise ValueError(f"at most {WS_MAX_SUBSCRIPTIONS} subscriptions per connection")
+        policy = request.get("policy") or DEFAULT_POLICIES[channel]
+        if policy not in DROP_POLICIES:
+            raise ValueError(f"unknown policy {policy!r}; expected one of {list(DROP_POLICIES)}")
+        thread_id = request.get("thread_id")
+        if channel == "agent" and not thread_id:
+            raise ValueError("agent subscriptions require a thread_id")
+
+        def as_set(value: Any) -> Set[str]:
+            if not value:
+                return set()
+            return {value} if isinstance(value, str) else set(value)
+
+        self.unsubscribe(connection, sub_id)
+        subscription = Subscription(sub_id, channel, policy, as_set(request.get("lp")), as_set(request.get("status")), thread_id)
+        connection.subscriptions[sub_id] = subscription
+        if channel == "agent" and thread_id not in self.relays:
+            relay = AgentStreamRelay(self, thread_id)
+            self.relays[thread_id] = relay
+            relay.start()
+        return subscription
+
+    def unsubscribe(self, connection: Connection, sub_id: str) -> bool:
+        subscription = connection.subscriptions.pop(sub_id, None)
+        if subscription is None:
+            return False
+        if subscription.channel == "agent":
+            self._release_relay(subscription.thread_id)
+        return True
+
+    def _release_relay(self, thread_id: str) -> None:
+        if any(s.thread_id == thread_id for _, s in self._subscriptions("agent")):
+            return
+        relay = self.relays.pop(thread_id, None)
+        if relay is not None and relay.task is not None:
+            relay.task.cancel()
+
+    def snapshot(self) -> Dict[str, Any]:
+        return {
+            **self.stats,
+            "open_connections": len(self.connections),
+            "agent_relays": sorted(self.relays),
+            "buffered": sum(len(c.pending) for c in self.connections),
+        }
+
+
+async def serve_connection(
+    websocket: Any,
+    hub: RealtimeHub,
+    list_cards: Callable[[], Any],
+    heartbeat: Callable[[], Dict[str, Any]],
+) -> None:
+    """Run one accepted WebSocket: read control messages, write buffered events."""
+    connection = hub.connect()
+
+    async def write() -> None:
+        while True:
+            message = await connection.next_message()
+            await websocket.send_text(json.dumps(message if message is not None else {"type": "keepalive"}, default=str))
+
+    async def handle(request: Dict[str, Any]) -> None:
+        op = request.get("op")
+        if op == "ping":
+            connection.offer({"type": "pong"})
+        elif op == "unsubscribe":
+            removed = hub.unsubscribe(connection, str(request.get("id") or ""))
+            connection.offer({"type": "unsubscribed", "id": request.get("id"), "found": removed})
+        elif op == "subscribe":
+            subscription = hub.subscribe(connection, request)
+            connection.offer({"type": "subscribed", "id": subscription.id, "channel": subscription.channel, "policy": subscription.policy})
+            if subscription.channel == "cards":
+                # Initial state, so clients never need to poll /alert/cards
+                for card in await list_cards():
+                    if subscription.matches_card(card):
+                        message = {"type": "event", "id": subscription.id, "channel": "cards", "data": card, "snapshot": True}
+                        connection.offer(message, subscription, key=card.get("id"))
+            elif subscription.channel == "heartbeat":
+                connection.offer({"type": "event", "id": subscription.id, "channel": "heartbeat", "data": heartbeat()}, subscription)
+        else:
+            raise ValueError(f"unknown op {op!r}")
+
+    async def read() -> None:
+        while True:
+            raw = await websocket.receive_text()
+            request = None
+            try:
+                request = json.loads(raw)
+                if not isinstance(request, dict):
+                    raise ValueError("messages must be JSON objects")
+                await handle(request)
+            except SlowConsumer:
+                raise
+            except (ValueError, TypeError) as exc:
+                connection.offer({"type": "error", "id": request.get("id") if isinstance(request, dict) else None, "error": str(exc)})
+
+    writer = asyncio.create_task(write())
+    reader = asyncio.create_task(read())
+    try:
+        done, _ = await asyncio.wait({writer, reader}, return_when=asyncio.FIRST_COMPLETED)
+        if any(isinstance(task.exception(), SlowConsumer) for task in done):
+            hub.stats["slow_consumer_disconnects"] += 1
+            with suppress(Exception):
+                await websocket.close(code=1013, reason=(connection.closed_reason or "slow consumer")[:120])
+    finally:
+        writer.cancel()
+        reader.cancel()
+        await asyncio.gather(writer, reader, return_exceptions=True)
+        hub.disconnect(connection)
+
+
+# Global hub shared by the alert endpoints and the monitoring service
+realtime_hub = RealtimeHub()
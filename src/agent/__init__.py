@@ -1,3 +1,5 @@
-from .graph import graph
+"""EigenFlow agent package.
 
-__all__ = ["graph"]
+Nothing is imported here so submodules can be used without building the graph;
+the main graph is available lazily via ``src.agent.graph.get_graph()``.
+"""
@@ -0,0 +1,196 @@
+"""
+In-process result caches for the agent pipeline.
+
+Contains:
+- TTLCache: thread-safe LRU cache with per-entry time-to-live and hit-rate stats
+- Key helpers for normalizing user input and hashing analysis snapshots
+- The shared intent classification and report caches
+- The last good gateway snapshot per LP scope (deadline fallback)
+"""
+
+import os
+import re
+import json
+import time
+import hashlib
+import threading
+import unicodedata
+from collections import OrderedDict
+from typing import Any, Dict, Hashable, Iterable, Optional, Tuple
+
+# Configuration Settings
+CONFIG = {
+    # Intent classification cache
+    'INTENT_CACHE_MAX_ENTRIES': int(os.getenv("INTENT_CACHE_MAX_ENTRIES", "1024")),
+    'INTENT_CACHE_TTL_SECONDS': float(os.getenv("INTENT_CACHE_TTL_SECONDS", "600")),
+
+    # ai_responder report cache
+    'REPORT_CACHE_MAX_ENTRIES': int(os.getenv("REPORT_CACHE_MAX_ENTRIES", "256")),
+    'REPORT_CACHE_TTL_SECONDS': float(os.getenv("REPORT_CACHE_TTL_SECONDS", "300")),
+
+    # Last good gateway snapshot per LP scope, served when a request's deadline leaves no time to fetch
+    'SNAPSHOT_CACHE_MAX_ENTRIES': int(os.getenv("SNAPSHOT_CACHE_MAX_ENTRIES", "64")),
+    'SNAPSHOT_CACHE_TTL_SECONDS': float(os.getenv("SNAPSHOT_CACHE_TTL_SECONDS", "900")),
+
+    # Per-request fields that change on every tool run without changing the snapshot
+    'VOLATILE_ANALYSIS_FIELDS': ("traceId",),
+}
+
+_MISSING = object()
+
+
+class TTLCache:
+    """Thread-safe LRU cache whose entries expire after ``ttl_seconds``."""
+
+    def __init__(self, max_entries: int = 1024, ttl_seconds: float = 600.0, name: str = "cache"):
+        self.name = name
+        self.max_entries = max(1, int(max_entries))
+        self.ttl_seconds = float(ttl_seconds)
+        self._data: "OrderedDict[Hashable, tuple]" = OrderedDict()
+        self._lock = threading.Lock()
+        self._hits = 0
+        self._misses = 0
+        self._evictions = 0
+        self._expirations = 0
+
+    def get(self, key: Hashable, default: Any = None) -> Any:
+        """
+        Return the cached value for ``key`` or ``default`` when missing or expired
+
+        Args:
+            key: Cache key
+            default: Value returned on a miss
+        """
+        now = time.monotonic()
+        with self._lock:
+            entry = self._data.get(key, _MISSING)
+            if entry is _MISSING:
+                self._misses += 1
+                return default
+            expires_at, value = entry
+            if expires_at <= now:
+                del self._data[key]
+                self._expirations += 1
+                self._misses += 1
+                return default
+            self._data.move_to_end(key)
+            self._hits += 1
+            return value
+
+    def set(self, key: Hashable, value: Any, ttl_seconds: Optional[float] = None) -> None:
+        """
+        Store ``value`` under ``key``, evicting the least recently used entry when full
+
+        Args:
+            key: Cache key
+            value: Value to store
+            ttl_seconds: Optional per-entry TTL overriding the cache default
+        """
+        ttl = self.ttl_seconds if ttl_seconds is None else float(ttl_seconds)
+        with self._lock:
+            self._data[key] = (time.monotonic() + ttl, value)
+            self._data.move_to_end(key)
+            while len(self._data) > self.max_entries:
+                self._data.popitem(last=False)
+                self._evictions += 1
+
+    def invalidate(self, key: Hashable) -> None:
+        """Drop a single entry if present."""
+        with self._lock:
+            self._data.pop(key, None)
+
+    def clear(self) -> None:
+        """Drop all entries and reset statistics."""
+        with self._lock:
+            self._data.clear()
+            self._hits = self._misses = self._evictions = self._expirations = 0
+
+    def __len__(self) -> int:
+        with self._lock:
+            return len(self._data)
+
+    def stats(self) -> Dict[str, Any]:
+        """Return size, hit/miss counters and hit rate."""
+        with self._lock:
+            lookups = self._hits + self._misses
+            return {
+                "name": self.name,
+                "size": len(self._data),
+                "max_entries": self.max_entries,
+                "ttl_seconds": self.ttl_seconds,
+                "hits": self._hits,
+                "misses": self._misses,
+                "evictions": self._evictions,
+                "expirations": self._expirations,
+                "hit_rate": round(self._hits / lookups, 4) if lookups else 0.0,
+            }
+
+
+def normalize_user_text(text: str) -> str:
+    """
+    Fold user input so trivially different phrasings share a cache key.
+
+    Applies NFKC (full-width -> half-width), case folding, drops punctuation
+    and symbols, and collapses whitespace.
+    """
+    text = unicodedata.normalize("NFKC", text or "").casefold()
+    text = "".join(
+        " " if unicodedata.category(ch)[0] in ("P", "S") else ch
+        for ch in text
+    )
+    return re.sub(r"\s+", " ", text).strip()
+
+
+def text_version(text: str) -> str:
+    """Return a short content hash identifying a prompt or template revision."""
+    return hashlib.sha1(text.encode("utf-8")).hexdigest()[:12]
+
+
+def analysis_content_hash(analysis: Dict[str, Any], exclude: Iterable[str] = CONFIG['VOLATILE_ANALYSIS_FIELDS']) -> str:
+    """
+    Hash a MarginCheckToolResponse dict independent of key order and volatile fields
+
+    Args:
+        analysis: Margin analysis produced by generate_margin_analysis
+        exclude: Top-level fields ignored when hashing
+
+    Returns:
+        Hex SHA-256 digest of the canonical JSON
+    """
+    stable = {k: v for k, v in analysis.items() if k not in set(exclude)}
+    canonical = json.dumps(stable, sort_keys=True, separators=(",", ":"), ensure_ascii=False, default=str)
+    return hashlib.sha256(canonical.encode("utf-8")).hexdigest()
+
+
+def report_cache_key(analysis: Dict[str, Any], prompt: str) -> Tuple[str, Tuple[str, ...], str]:
+    """
+    Build the report cache key: analysis content hash, LP scope and prompt version
+
+    Args:
+        analysis: Margin analysis the report is generated from
+        prompt: Prompt (or template) text used to write the report
+    """
+    lp_scope = tuple(sorted(str(lp.get("lp")) for lp in analysis.get("perLP", []) if isinstance(lp, dict)))
+    return analysis_content_hash(analysis), lp_scope, text_version(prompt)
+
+
+# Shared intent classification cache (normalized text + LP mapping version -> classification)
+intent_cache = TTLCache(
+    max_entries=CONFIG['INTENT_CACHE_MAX_ENTRIES'],
+    ttl_seconds=CONFIG['INTENT_CACHE_TTL_SECONDS'],
+    name="intent_classification",
+)
+
+# Shared report cache ((analysis hash, LP scope, prompt version) -> report text)
+report_cache = TTLCache(
+    max_entries=CONFIG['REPORT_CACHE_MAX_ENTRIES'],
+    ttl_seconds=CONFIG['REPORT_CACHE_TTL_SECONDS'],
+    name="report",
+)
+
+# Last good gateway snapshot (LP name or "*" for all LPs -> snapshot with fetched_at)
+snapshot_cache = TTLCache(
+    max_entries=CONFIG['SNAPSHOT_CACHE_MAX_ENTRIES'],
+    ttl_seconds=CONFIG['SNAPSHOT_CACHE_TTL_SECONDS'],
+    name="snapshot",
+)
@@ -5,6 +5,10 @@ from typing import Any, Optional
 from langchain_core.runnables import RunnableConfig
 
 
+# Model choices that default to MODEL_NAME when it is set
+MODEL_FIELDS = ("model", "classifier_model", "supervisor_model", "report_model")
+
+
 class Configuration(BaseModel):
     """Minimal configuration for the agent."""
 
@@ -15,7 +19,72 @@ class Configuration(BaseModel):
 
     model: str = Field(
         default="qwen-max-latest",
-        metadata={"description": "LLM model name for chat."},
+        metadata={"description": "Large model the cascade escalates to when the small model is not confident."},
+    )
+
+    classifier_model: str = Field(
+        default="qwen-turbo-latest",
+        metadata={"description": "Small model tried first for intent classification."},
+    )
+
+    supervisor_model: str = Field(
+        default="qwen-turbo-latest",
+        metadata={"description": "Small model tried first for supervisor routing."},
+    )
+
+    report_model: str = Field(
+        default="qwen-plus-latest",
+        metadata={"description": "Model used by ai_responder to write reports."},
+    )
+
+    escalation_confidence: float = Field(
+        default=0.7,
+        metadata={"description": "Classifications below this confidence are retried on the large model."},
+    )
+
+    intent_fast_path: bool = Field(
+        default=True,
+        metadata={"description": "Resolve unambiguous intents with the rule-based router before calling the LLM."},
+    )
+
+    speculative_prefetch: bool = Field(
+        default=True,
+        metadata={"description": "Fetch margin data for the likely LP scope while the intent is being classified."},
+    )
+
+    alert_template_report: bool = Field(
+        default=True,
+        metadata={"description": "Answer MARGIN_ALERT events with the deterministic template report instead of the LLM pipeline."},
+    )
+
+    report_language: str = Field(
+        default="zh",
+        metadata={"description": "Language of template reports (zh or en)."},
+    )
+
+    lp_fanout: bool = Field(
+        default=True,
+        metadata={"description": "Build multi-LP reports by fanning out one fetch/analysis/narrative branch per LP."},
+    )
+
+    history_keep_turns: int = Field(
+        default=3,
+        metadata={"description": "Most recent conversation turns sent to the supervisor verbatim; older tool outputs are summarized."},
+    )
+
+    history_max_tokens: int = Field(
+        default=12000,
+        metadata={"description": "Approximate token budget for the history sent to the supervisor (0 disables the cap)."},
+    )
+
+    max_tool_calls_per_run: int = Field(
+        default=4,
+        metadata={"description": "Tool calls allowed per supervisor run before it is short-circuited to the report writer."},
+    )
+
+    max_llm_iterations_per_run: int = Field(
+        default=6,
+        metadata={"description": "Supervisor LLM iterations allowed per run before it is short-circuited to the report writer."},
     )
 
     @classmethod
@@ -36,4 +105,11 @@ class Configuration(BaseModel):
         # Filter out None values
         values = {k: v for k, v in raw_values.items() if v is not None}
 
+        # MODEL_NAME (single model for every stage) is the default for each model choice;
+        # with one model the cascades have nothing to escalate to and are skipped
+        default_model = os.environ.get("MODEL_NAME")
+        if default_model:
+            for name in MODEL_FIELDS:
+                values.setdefault(name, default_model)
+
         return cls(**values)
\ No newline at end of file
@@ -5,15 +5,23 @@ Contains the EigenFlowAPI class for:
 - Authentication with EigenFlow API
 - LP account information retrieval
 - LP position data fetching
+
+An EigenFlowAPI instance may be shared between threads: the access token is
+swapped under a lock and request headers are built per call.
 """
 
 import os
+import hashlib
 import logging
+import threading
 import requests
 from typing import Optional, Dict, Any, List
 from datetime import datetime
 
 import dotenv
+
+from .deadline import gateway_timeout
+
 dotenv.load_dotenv()
 
 logger = logging.getLogger(__name__)
@@ -26,7 +34,7 @@ LP_POSITION_ENDPOINT = f"{API_BASE_URL}/lp/position"
 
 # Configuration Settings
 CONFIG = {
-    # API timeouts
+    # API timeouts (bounded per request by the run's deadline, see deadline.gateway_timeout)
     'API_TIMEOUT_SECONDS': 30,
 }
 
@@ -44,12 +52,28 @@ def get_lp_mapping_string() -> str:
     """Generate LP mapping string for prompt injection."""
     return ", ".join([f'"{name}"->{lp_id}' for lp_id, name in LP_MAPPING.items()])
 
+
+def get_lp_mapping_version() -> str:
+    """Return a short content hash of LP_MAPPING; changes whenever the mapping does."""
+    canonical = "|".join(f"{lp_id}={name}" for lp_id, name in sorted(LP_MAPPING.items()))
+    return hashlib.sha1(canonical.encode("utf-8")).hexdigest()[:12]
+
 class EigenFlowAPI:
     """EigenFlow API client for LP data retrieval."""
     
     def __init__(self):
         self.access_token = None
         self.headers = {"Content-Type": "application/json"}
+        self._token_lock = threading.Lock()
+    
+    def _request_headers(self) -> Dict[str, str]:
+        """Build headers for one request from the base headers and the current token."""
+        with self._token_lock:
+            token = self.access_token
+        headers = dict(self.headers)
+        if token:
+            headers["Authorization"] = f"Bearer {token}"
+        return headers
     
     def authenticate(self, email: str = None, password: str = None, broker: str = None) -> Dict[str, Any]:
         """Authenticate with EigenFlow API and get access token."""
@@ -71,15 +95,16 @@ class EigenFlowAPI:
                 "broker": broker  # Use the pre-hashed broker value directly
             }
             
-            response = requests.post(AUTH_ENDPOINT, json=auth_data, headers=self.headers, timeout=CONFIG['API_TIMEOUT_SECONDS'])
+            response = requests.post(AUTH_ENDPOINT, json=auth_data, headers=dict(self.headers), timeout=gateway_timeout(CONFIG['API_TIMEOUT_SECONDS']))
             
             if response.status_code == 200:
                 auth_result = response.json()
-                self.access_token = auth_result.get("access_token")
+                access_token = auth_result.get("access_token")
                 
-                if self.access_token:
-                    # Update headers with authorization
-                    self.headers["Authorization"] = f"Bearer {self.access_token}"
+                if access_token:
+                    # Swap the token atomically; headers are derived per request
+                    with self._token_lock:
+                        self.access_token = access_token
                     logger.info("Successfully authenticated with EigenFlow API")
                     return {"success": True, "message": "Authentication successful"}
                 else:
@@ -106,7 +131,7 @@ class EigenFlowAPI:
             if lp_name is not None:
                 params["lp_name"] = lp_name
                 
-            response = requests.get(LP_ACCOUNT_ENDPOINT, params=params, headers=self.headers, timeout=CONFIG['API_TIMEOUT_SECONDS'])
+            response = requests.get(LP_ACCOUNT_ENDPOINT, params=params, headers=self._request_headers(), timeout=gateway_timeout(CONFIG['API_TIMEOUT_SECONDS']))
             
             if response.status_code == 200:
                 account_data = response.json()
@@ -134,7 +159,7 @@ class EigenFlowAPI:
             if lp_name is not None:
                 params["lp_name"] = lp_name
                 
-            response = requests.get(LP_POSITION_ENDPOINT, params=params, headers=self.headers, timeout=CONFIG['API_TIMEOUT_SECONDS'])
+            response = requests.get(LP_POSITION_ENDPOINT, params=params, headers=self._request_headers(), timeout=gateway_timeout(CONFIG['API_TIMEOUT_SECONDS']))
             
             if response.status_code == 200:
                 position_data = response.json()
@@ -157,7 +182,7 @@ class EigenFlowAPI:
             return []
         
         try:
-            response = requests.get(LP_ACCOUNT_ENDPOINT, headers=self.headers, timeout=CONFIG['API_TIMEOUT_SECONDS'])
+            response = requests.get(LP_ACCOUNT_ENDPOINT, headers=self._request_headers(), timeout=gateway_timeout(CONFIG['API_TIMEOUT_SECONDS']))
             
             if response.status_code == 200:
                 account_data = response.json()
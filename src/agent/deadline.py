@@ -0,0 +1,191 @@
+"""
+Request deadlines and graceful degradation for graph runs.
+
+The alert service waits up to MARGIN_ENDPOINT_TIMEOUT (100s) on
+/agent/margin-check, but no node knew how much of that was left. The API
+opens a RunDeadline per request (from the ``X-Request-Timeout`` header or the
+``timeoutSeconds`` field) and its key travels in the run config, like the
+run guard's. Nodes, tools and gateway calls consult it:
+- Before an LLM round-trip, ``allows(stage)`` checks the time left against
+  the stage's typical duration; when it is too short the caller falls back
+  (keyword intent, template report/narrative, supervisor short-circuit)
+- Gateway requests get ``min(API timeout, time left)`` and fall back to the
+  last good snapshot for the LP when the time is gone
+- Every fallback is recorded with ``degrade`` and reported in the response
+
+Runs without a deadline (langgraph dev, tests) behave exactly as before.
+
+Contains:
+- RunDeadline: time left and the degradations applied for one request
+- DeadlineRegistry and the global run_deadlines (the key travels in the run config)
+- deadline_from_config / deadline_context / gateway_timeout helpers
+"""
+
+import os
+import time
+import uuid
+import logging
+import threading
+from collections import defaultdict
+from contextlib import contextmanager
+from contextvars import ContextVar
+from typing import Any, Dict, Iterator, List, Optional
+
+from langchain_core.runnables import RunnableConfig
+
+logger = logging.getLogger(__name__)
+
+# Configuration Settings
+CONFIG = {
+    # Deadline applied when the caller sends none (0 = no deadline)
+    'DEFAULT_TIMEOUT_SECONDS': float(os.getenv("AGENT_REQUEST_TIMEOUT_SECONDS", "0")),
+    # Kept back from the caller's budget for serialising and returning the response
+    'SAFETY_MARGIN_SECONDS': float(os.getenv("AGENT_DEADLINE_MARGIN_SECONDS", "2")),
+    # Time a stage typically needs; with less left it is skipped or replaced by its fallback
+    'STAGE_SECONDS': {
+        "classify_llm": 6.0,      # small-model intent classification (+ escalation)
+        "supervisor": 40.0,       # full supervisor run: routing, tool call, report, forward
+        "supervisor_round": 8.0,  # one more supervisor LLM iteration
+        "report_llm": 25.0,       # ai_responder report
+        "lp_narrative": 20.0,     # per-LP narrative in the fan-out
+        "gateway": 2.0,           # EigenFlow authenticate + account + positions
+    },
+    # Gateway requests never get less than this timeout
+    'MIN_GATEWAY_TIMEOUT_SECONDS': 0.5,
+    # Configurable key carrying the deadline key into nodes and tools
+    'CONFIG_KEY': "deadline_key",
+}
+
+
+class RunDeadline:
+    """Time budget for one request and the degradations applied to meet it."""
+
+    def __init__(self, timeout_seconds: float):
+        self.timeout_seconds = float(timeout_seconds)
+        self.expires_at = time.monotonic() + self.timeout_seconds
+        self.degradations: List[Dict[str, Any]] = []
+        self._lock = threading.Lock()
+
+    def remaining(self) -> float:
+        """Seconds left for graph work (the safety margin already deducted)."""
+        return max(0.0, self.expires_at - time.monotonic() - CONFIG['SAFETY_MARGIN_SECONDS'])
+
+    def allows(self, stage: str) -> bool:
+        """Return True when enough time is left to start ``stage``."""
+        return self.remaining() >= CONFIG['STAGE_SECONDS'].get(stage, 0.0)
+
+    def timeout_for(self, default: float) -> float:
+        """Bound a request timeout by the time left."""
+        return max(CONFIG['MIN_GATEWAY_TIMEOUT_SECONDS'], min(float(default), self.remaining()))
+
+    def degrade(self, name: str, stage: str, **detail: Any) -> None:
+        """
+        Record a fallback taken because of the deadline
+
+        Args:
+            name: Degradation applied (e.g. "template_report", "cached_snapshot")
+            stage: Node or tool that applied it
+            **detail: Extra context (LP, snapshot age, ...)
+        """
+        entry = {"degradation": name, "stage": stage, "remaining_seconds": round(self.remaining(), 2), **detail}
+        with self._lock:
+            if any(d["degradation"] == name and d["stage"] == stage and d.get("lp") == detail.get("lp")
+                   for d in self.degradations):
+                return
+            self.degradations.append(entry)
+        logger.warning(f"Deadline degradation at {stage}: {name} ({entry['remaining_seconds']}s left)")
+
+    def summary(self) -> Dict[str, Any]:
+        """Return the budget, time left and degradations applied."""
+        with self._lock:
+            degradations = list(self.degradations)
+        return {
+            "timeout_seconds": self.timeout_seconds,
+            "remaining_seconds": round(self.remaining(), 2),
+            "degradations": degradations,
+        }
+
+
+class DeadlineRegistry:
+    """Thread-safe registry of open request deadlines plus aggregate statistics."""
+
+    def __init__(self):
+        self._lock = threading.Lock()
+        self._deadlines: Dict[str, RunDeadline] = {}
+        self._stats = {"runs": 0, "degraded_runs": 0, "expired_runs": 0}
+        self._degradations: Dict[str, int] = defaultdict(int)
+
+    def open(self, timeout_seconds: Optional[float]) -> Optional[str]:
+        """Open a deadline and return its key (None when there is no deadline)."""
+        if not timeout_seconds or timeout_seconds <= 0:
+            return None
+        key = uuid.uuid4().hex
+        with self._lock:
+            self._deadlines[key] = RunDeadline(timeout_seconds)
+        return key
+
+    def get(self, key: Optional[str]) -> Optional[RunDeadline]:
+        """Return the open deadline for ``key`` (None when unknown or already closed)."""
+        if not key:
+            return None
+        with self._lock:
+            return self._deadlines.get(key)
+
+    def close(self, key: Optional[str]) -> Optional[Dict[str, Any]]:
+        """Close a deadline, fold it into the aggregates and return its summary."""
+        if not key:
+            return None
+        with self._lock:
+            deadline = self._deadlines.pop(key, None)
+        if deadline is None:
+            return None
+        summary = deadline.summary()
+        with self._lock:
+            self._stats["runs"] += 1
+            if summary["degradations"]:
+                self._stats["degraded_runs"] += 1
+            if summary["remaining_seconds"] <= 0:
+                self._stats["expired_runs"] += 1
+            for entry in summary["degradations"]:
+                self._degradations[entry["degradation"]] += 1
+        return summary
+
+    def stats(self) -> Dict[str, Any]:
+        """Return run counters, degradations by kind and open deadlines."""
+        with self._lock:
+            return {**self._stats, "degradations": dict(self._degradations), "open": len(self._deadlines)}
+
+    def reset(self) -> None:
+        """Drop aggregates (open deadlines are kept)."""
+        with self._lock:
+            self._stats = {name: 0 for name in self._stats}
+            self._degradations.clear()
+
+
+# Global deadline registry
+run_deadlines = DeadlineRegistry()
+
+# Deadline of the gateway calls made in the current context (set by deadline_context)
+_gateway_deadline: ContextVar[Optional[RunDeadline]] = ContextVar("gateway_deadline", default=None)
+
+
+def deadline_from_config(config: Optional[RunnableConfig]) -> Optional[RunDeadline]:
+    """Return the deadline for the run described by ``config``, if one is open."""
+    configurable = (config or {}).get("configurable") or {}
+    return run_deadlines.get(configurable.get(CONFIG['CONFIG_KEY']))
+
+
+@contextmanager
+def deadline_context(deadline: Optional[RunDeadline]) -> Iterator[Optional[RunDeadline]]:
+    """Bound the gateway calls made inside the block (and in contexts copied from it) by ``deadline``."""
+    token = _gateway_deadline.set(deadline)
+    try:
+        yield deadline
+    finally:
+        _gateway_deadline.reset(token)
+
+
+def gateway_timeout(default: float) -> float:
+    """Timeout for a gateway request: ``default`` bounded by the current deadline, if any."""
+    deadline = _gateway_deadline.get()
+    return deadline.timeout_for(default) if deadline is not None else default
@@ -2,19 +2,20 @@
 
 import os
 import json
+import time
 import uuid
+import asyncio
+import logging
+import threading
 from datetime import datetime
+from functools import lru_cache
 from typing import Annotated
 
-from langchain_openai import ChatOpenAI
-from langgraph.prebuilt import create_react_agent
-from langgraph_supervisor import create_supervisor
-from langgraph_supervisor.handoff import create_forward_message_tool
 from langgraph.graph import StateGraph, MessagesState, START, END
 from langchain_core.tools import tool, InjectedToolCallId
 from langgraph.prebuilt import InjectedState
-from langgraph.types import Command, interrupt
-from langchain_core.messages import HumanMessage
+from langgraph.types import Command, Send, interrupt
+from langchain_core.messages import AIMessage, HumanMessage, SystemMessage, ToolMessage
 from langchain_core.runnables import RunnableConfig
 
 from src.agent.state import OverallState, OrchestratorState
@@ -23,29 +24,100 @@ from src.agent.schemas import IntentClassification, MarginCheckToolResponse
 from src.agent.prompts import (
     AI_RESPONDER_PROMPT,
     SUPERVISOR_PROMPT,
-    INTENT_CLASSIFICATION_PROMPT
+    PROMPT_TOKEN_BUDGETS,
+    build_intent_classification_messages,
+    prompt_budget_stats,
+    prompt_token_split,
+    static_prompt_tokens,
 )
-from src.agent.data_gateway import get_lp_mapping_string
+from src.agent.data_gateway import LP_MAPPING, get_lp_mapping_string, get_lp_mapping_version
 from src.agent.configuration import Configuration
 from src.agent.utils import chat_response
-from src.agent.margin_tools import get_lp_margin_check
+from src.agent.margin_tools import get_lp_margin_check, fetch_lp_snapshot, afetch_lp_snapshot, generate_margin_analysis
+from src.agent.prefetch import snapshot_prefetcher
+from src.agent.intent_router import intent_router
+from src.agent.llm_registry import ModelRegistry
+from src.agent.cache import intent_cache, normalize_user_text, report_cache, report_cache_key
+from src.agent.report_templates import render_margin_report
+from src.agent.history import compact_history
+from src.agent.model_cascade import CascadeChatModel, invoke_structured_with_escalation
+from src.agent.run_guard import run_guards, create_loop_guard_hook, CONFIG as RUN_GUARD_CONFIG
+from src.agent.deadline import RunDeadline, deadline_context, deadline_from_config
 
+logger = logging.getLogger(__name__)
 
-def get_model():
-    """Get configured ChatOpenAI model instance."""
-    return ChatOpenAI(
-        model=os.getenv("MODEL_NAME", "qwen-plus-latest"),
-        api_key=os.getenv("DASHSCOPE_API_KEY"),
-        base_url="https://dashscope.aliyuncs.com/compatible-mode/v1",
+
+def get_model(model: str | None = None):
+    """Get the shared, connection-pooled ChatOpenAI model instance."""
+    return ModelRegistry.get_model(
+        model=model or os.getenv("MODEL_NAME", "qwen-plus-latest"),
         temperature=0.5
     )
 
 
+def start_snapshot_prefetch(lp_name: str | None, deadline: RunDeadline | None = None) -> str:
+    """Start fetching the margin snapshot for ``lp_name`` in the background."""
+    def fetch():
+        with deadline_context(deadline):
+            return fetch_lp_snapshot(lp_name)
+
+    return snapshot_prefetcher.start(lp_name, fetch)
+
+
+def keyword_intent(user_input: str) -> IntentContext:
+    """Classify from LP mentions alone (used when the deadline leaves no time for the LLM)."""
+    mentioned = intent_router.match_lps(user_input)
+    return IntentContext(
+        intent="lp_margin_check_report" if mentioned else "chat",
+        confidence=0.5,
+        slots={"lp": mentioned[0]} if len(mentioned) == 1 else {},
+    )
+
+
+async def classify_with_llm(user_input: str, configurable: Configuration | None = None) -> IntentContext:
+    """Classify ``user_input`` with the small/large model cascade, reusing cached results."""
+    configurable = configurable or Configuration()
+    # Repeated queries reuse the previous LLM classification
+    cache_key = (normalize_user_text(user_input), get_lp_mapping_version())
+    cached = intent_cache.get(cache_key)
+    if cached is not None:
+        # Fresh traceId/occurredAt per request; only the classification is reused
+        return IntentContext(
+            schemaVer=cached.schemaVer,
+            intent=cached.intent,
+            confidence=cached.confidence,
+            slots=cached.slots.dict() if cached.slots else {},
+        )
+    
+    # Static, cached system prefix + the user input, within the prompt's token budget
+    prompt_messages = build_intent_classification_messages(user_input, get_lp_mapping_string())
+    
+    # Small model first; escalate on low confidence or unparseable output
+    result = await invoke_structured_with_escalation(
+        get_model(configurable.classifier_model),
+        get_model(configurable.model),
+        IntentClassification,
+        prompt_messages,
+        min_confidence=configurable.escalation_confidence,
+        stage="classify_intent",
+    )
+    intent_cache.set(cache_key, result)
+    
+    # Convert Pydantic model to IntentContext dataclass
+    return IntentContext(
+        schemaVer=result.schemaVer,
+        intent=result.intent,
+        confidence=result.confidence,
+        slots=result.slots.dict() if result.slots else {},
+        traceId=result.traceId,
+        occurredAt=result.occurredAt
+    )
+
+
 async def classify_intent(state: OverallState, config: RunnableConfig) -> OverallState:
     """Classify user intent using LLM with enhanced structured output."""
+    prefetch_key = None
     try:
-        model = get_model()
-        
         # Get the latest user message
         messages = state.get("messages", [])
         if not messages:
@@ -54,36 +126,44 @@ async def classify_intent(state: OverallState, config: RunnableConfig) -> Overal
             return {"intentContext": default_context}
             
         latest_message = messages[-1]
-        user_input = latest_message.content if hasattr(latest_message, 'content') else str(latest_message)
+        user_input = str(latest_message.content if hasattr(latest_message, 'content') else latest_message)
+        configurable = Configuration.from_runnable_config(config)
+        deadline = deadline_from_config(config)
         
-        # Use structured output for intent classification
-        structured_model = model.with_structured_output(IntentClassification)
+        # Deterministic fast path - skip the LLM when keywords make the intent unambiguous
+        intent_context = intent_router.route(user_input) if configurable.intent_fast_path else None
         
-        # Use the predefined prompt from prompts.py with dynamic formatting
-        formatted_prompt = INTENT_CLASSIFICATION_PROMPT.format(
-            user_input=user_input,
-            lp_mapping=get_lp_mapping_string()
-        )
+        # Speculatively fetch margin data for the likely LP scope while classification runs
+        if configurable.speculative_prefetch and (
+            intent_context is None or intent_context.intent == "lp_margin_check_report"
+        ):
+            if intent_context is not None:
+                likely_lp = intent_context.slots.get("lp")
+            else:
+                mentioned = intent_router.match_lps(user_input)
+                likely_lp = mentioned[0] if len(mentioned) == 1 else None
+            # All-LP requests are fanned out per LP, so a whole-broker prefetch would go unused
+            if likely_lp or not (configurable.lp_fanout and len(LP_MAPPING) > 1):
+                prefetch_key = start_snapshot_prefetch(likely_lp, deadline)
         
-        result = await structured_model.ainvoke([HumanMessage(content=formatted_prompt)])
+        if intent_context is None and deadline is not None and not deadline.allows("classify_llm"):
+            intent_context = keyword_intent(user_input)
+            deadline.degrade("keyword_intent", "classify_intent")
+        if intent_context is None:
+            intent_context = await classify_with_llm(user_input, configurable)
         
-        # Convert Pydantic model to IntentContext dataclass
-        intent_context = IntentContext(
-            schemaVer=result.schemaVer,
-            intent=result.intent,
-            confidence=result.confidence,
-            slots=result.slots.dict() if result.slots else {},
-            traceId=result.traceId,
-            occurredAt=result.occurredAt
-        )
+        if intent_context.intent != "lp_margin_check_report":
+            snapshot_prefetcher.discard(prefetch_key)
+            prefetch_key = None
         
-        return {"intentContext": intent_context}
+        return {"intentContext": intent_context, "prefetchKey": prefetch_key}
         
     except Exception as e:
         print(f"Error in intent classification: {e}")
+        snapshot_prefetcher.discard(prefetch_key)
         # Return default chat intent context on error
         default_context = IntentContext(intent="chat", confidence=0.5)
-        return {"intentContext": default_context}
+        return {"intentContext": default_context, "prefetchKey": None}
 
 
 async def call_supervisor(state: OverallState, config: RunnableConfig) -> OverallState:
@@ -100,10 +180,8 @@ async def call_supervisor(state: OverallState, config: RunnableConfig) -> Overal
             group=getattr(intent_context, 'slots', {}).get('group')
         )
         
-        # Extract LP list from context if available
-        lps = []
-        if orchestrator_scope.lp:
-            lps.append(orchestrator_scope.lp)
+        # Resolve the LP scope from the intent slots; the tool treats it as binding
+        lps = intent_router.resolve_lp_scope(getattr(intent_context, 'slots', {}))
         
         # Set default options for margin check operations
         options = {
@@ -122,20 +200,49 @@ async def call_supervisor(state: OverallState, config: RunnableConfig) -> Overal
         # Use lp_margin_check tool for margin analysis
         tool_name = "lp_margin_check"
         
+        # Bound the history replayed to the supervisor; compacted messages keep their ids.
+        # The history also has to fit the supervisor's prompt budget after its static prefix.
+        configurable = Configuration.from_runnable_config(config)
+        history_budget = PROMPT_TOKEN_BUDGETS["supervisor"] - static_prompt_tokens(SUPERVISOR_PROMPT)
+        if configurable.history_max_tokens > 0:
+            history_budget = min(history_budget, configurable.history_max_tokens)
+        messages = compact_history(
+            state.get("messages", []),
+            keep_turns=configurable.history_keep_turns,
+            max_tokens=history_budget,
+        )
+        prompt_budget_stats.record("supervisor", prompt_token_split([SystemMessage(content=SUPERVISOR_PROMPT), *messages]))
+        
         # Create orchestrator state with messages for supervisor subgraph
         orchestrator_state = {
-            "messages": state.get("messages", []),
+            "messages": messages,
             "schemaVer": "dc/v1",
             "tool": tool_name,
             "inputs": orchestrator_inputs,
             "tenantId": None,  # Can be populated from environment or user context
             "traceId": getattr(intent_context, 'traceId', str(uuid.uuid4())),
-            "idempotencyKey": str(uuid.uuid4()),
+            "idempotencyKey": config.get("configurable", {}).get("idempotency_key") or str(uuid.uuid4()),
             "occurredAt": getattr(intent_context, 'occurredAt', datetime.now().isoformat() + "Z")
         }
         
+        # Hand the speculative snapshot (if any) to get_lp_margin_check via the run config
+        prefetch_key = state.get("prefetchKey")
+        # Per-run tool result cache and loop budget, shared by the tool and the supervisor hook
+        run_guard_key = run_guards.open(configurable.max_tool_calls_per_run, configurable.max_llm_iterations_per_run)
+        subgraph_config = {**config, "configurable": {
+            **config.get("configurable", {}),
+            "prefetch_key": prefetch_key,
+            "lp_scope": lps,
+            RUN_GUARD_CONFIG['CONFIG_KEY']: run_guard_key,
+        }}
+        
         # Invoke supervisor subgraph with orchestrator state
-        result = await supervisor_subgraph.ainvoke(orchestrator_state)
+        try:
+            result = await get_supervisor_subgraph(configurable).ainvoke(orchestrator_state, subgraph_config)
+        finally:
+            # Unused prefetches (e.g. the supervisor picked another scope) are dropped
+            snapshot_prefetcher.discard(prefetch_key)
+            run_guards.close(run_guard_key)
         
         # Extract messages from supervisor result
         supervisor_messages = result.get("messages", [])
@@ -143,7 +250,8 @@ async def call_supervisor(state: OverallState, config: RunnableConfig) -> Overal
         # Return updated state - add_messages annotation will handle merging automatically
         return {
             "messages": supervisor_messages,
-            "intentContext": intent_context
+            "intentContext": intent_context,
+            "prefetchKey": None
         }
         
     except Exception as e:
@@ -187,18 +295,97 @@ transfer_to_ai_responder = create_handoff_tool(
 # Margin assistant removed - supervisor handles margin checks directly with get_lp_margin_report tool
 
 
+def latest_margin_analysis(messages) -> dict | None:
+    """Return the margin analysis produced in the current turn, if any.
+
+    Only a get_lp_margin_check result that follows the latest human message
+    counts; follow-up questions without a fresh tool call return None.
+    """
+    for message in reversed(messages or []):
+        if isinstance(message, HumanMessage):
+            return None
+        if isinstance(message, ToolMessage) and message.name == get_lp_margin_check.name:
+            try:
+                analysis = json.loads(message.content)
+            except (json.JSONDecodeError, TypeError):
+                return None
+            return analysis if isinstance(analysis, dict) else None
+    return None
+
+
+def create_cached_ai_responder(agent, name: str = "ai_responder"):
+    """Wrap the ai_responder agent with the snapshot-keyed report cache.
+
+    When the current turn's margin analysis matches a cached snapshot (same
+    content hash, LP scope and prompt version), the cached report is returned
+    without calling the LLM and marked with ``report_cache: hit``.
+    """
+
+    async def respond(state: MessagesState, config: RunnableConfig):
+        messages = state["messages"]
+        analysis = latest_margin_analysis(messages)
+        cache_key = report_cache_key(analysis, AI_RESPONDER_PROMPT) if analysis else None
+
+        if cache_key is not None:
+            cached_report = report_cache.get(cache_key)
+            if cached_report is not None:
+                return {"messages": [AIMessage(
+                    content=cached_report,
+                    name=name,
+                    response_metadata={"report_cache": "hit"},
+                )]}
+
+        # Out of time for the LLM report: answer with the template report of the same analysis
+        deadline = deadline_from_config(config)
+        if analysis and deadline is not None and not deadline.allows("report_llm"):
+            deadline.degrade("template_report", name)
+            return {"messages": [AIMessage(
+                content=render_margin_report(analysis, Configuration.from_runnable_config(config).report_language),
+                name=name,
+                response_metadata={"report_source": "template"},
+            )]}
+
+        prompt_budget_stats.record("ai_responder", prompt_token_split([SystemMessage(content=AI_RESPONDER_PROMPT), *messages]))
+        result = await agent.ainvoke(state, config)
+        new_messages = result["messages"][len(messages):]
+
+        if cache_key is not None and new_messages:
+            final_message = new_messages[-1]
+            if isinstance(final_message, AIMessage) and final_message.content and not final_message.tool_calls:
+                report_cache.set(cache_key, final_message.content)
+
+        return {"messages": new_messages}
+
+    builder = StateGraph(MessagesState)
+    builder.add_node("respond", respond)
+    builder.add_edge(START, "respond")
+    builder.add_edge("respond", END)
+    return builder.compile(name=name)
+
+
 # Worker agents and supervisor subgraph creation
-def create_supervisor_subgraph():
-    """Create supervisor subgraph with worker agents."""
-    model = get_model()
+def create_supervisor_subgraph(configurable: Configuration | None = None):
+    """Create supervisor subgraph with worker agents (models from ``configurable``, else env/defaults)."""
+    # Deferred: langgraph_supervisor and the prebuilt agents are only needed once the graph is built
+    from langgraph.prebuilt import create_react_agent
+    from langgraph_supervisor import create_supervisor
+    from langgraph_supervisor.handoff import create_forward_message_tool
+
+    configurable = configurable or Configuration.from_runnable_config()
+    
+    # Supervisor routing: small model first, escalating on malformed or unknown tool calls
+    supervisor_model = get_model(configurable.supervisor_model)
+    escalation_model = get_model(configurable.model)
+    if supervisor_model is not escalation_model:
+        supervisor_model = CascadeChatModel(primary=supervisor_model, fallback=escalation_model, stage="supervisor")
     
     # Create worker agents using create_react_agent
-    ai_responder = create_react_agent(
-        model=model,
+    ai_responder = create_cached_ai_responder(create_react_agent(
+        model=get_model(configurable.report_model),
         tools=[chat_response],
         prompt=AI_RESPONDER_PROMPT,
         name="ai_responder"
-    )
+    ))
 
     # Removed margin_assistant - supervisor now handles margin checks directly
 
@@ -207,10 +394,11 @@ def create_supervisor_subgraph():
     # Create supervisor subgraph and compile it
     supervisor = create_supervisor(
         [ai_responder],
-        model=model,
+        model=supervisor_model,
         prompt=SUPERVISOR_PROMPT,
         add_handoff_messages=False,   # Don't add handoff messages to conversation history
         output_mode="full_history",   # Return only the last message from the active agent
+        post_model_hook=create_loop_guard_hook("ai_responder", "forward_message"),  # Caps tool calls / iterations per run
         tools=[get_lp_margin_check, forwarding_tool]  # Supervisor can use tools directly
     )
     
@@ -218,6 +406,163 @@ def create_supervisor_subgraph():
     return supervisor.compile()
 
 
+def route_entry(state: OverallState, config: RunnableConfig) -> str:
+    """Route alert events straight to reporting; everything else goes through classification."""
+    if state.get("eventType") != "MARGIN_ALERT" or not state.get("intentContext"):
+        return "classify_intent"
+    configurable = Configuration.from_runnable_config(config)
+    return "template_report" if configurable.alert_template_report or not has_time_for_supervisor(config) else "call_supervisor"
+
+
+def has_time_for_supervisor(config: RunnableConfig) -> bool:
+    """Return False when the request deadline leaves too little time for a supervisor run."""
+    deadline = deadline_from_config(config)
+    return deadline is None or deadline.allows("supervisor")
+
+
+async def template_report_node(state: OverallState, config: RunnableConfig) -> Command:
+    """Answer a MARGIN_ALERT with the deterministic template report (no LLM calls).
+    
+    The tool call and its result are recorded in the history so a follow-up
+    request for the LLM narrative can reuse the same snapshot. Margin reports
+    are also routed here when the request deadline leaves no time for the
+    supervisor.
+    """
+    configurable = Configuration.from_runnable_config(config)
+    deadline = deadline_from_config(config)
+    if deadline is not None and not (state.get("eventType") == "MARGIN_ALERT" and configurable.alert_template_report):
+        deadline.degrade("template_report", "template_report")
+    
+    intent_context = state["intentContext"]
+    lp_scope = intent_router.resolve_lp_scope(intent_context.slots)
+    tool_args = {"lp_name": lp_scope[0]} if len(lp_scope) == 1 else {}
+    tool_config = {**config, "configurable": {**config.get("configurable", {}), "lp_scope": lp_scope}}
+    tool_output = await get_lp_margin_check.ainvoke(tool_args, tool_config)
+    
+    try:
+        analysis = json.loads(tool_output)
+    except (json.JSONDecodeError, TypeError):
+        # Gateway or scope error - let the supervisor handle and explain it
+        return Command(goto="call_supervisor", update={"eventType": None})
+    
+    tool_call_id = f"call_{uuid.uuid4().hex}"
+    messages = [
+        AIMessage(content="", tool_calls=[{"name": get_lp_margin_check.name, "args": tool_args, "id": tool_call_id}]),
+        ToolMessage(content=tool_output, name=get_lp_margin_check.name, tool_call_id=tool_call_id),
+        AIMessage(
+            content=render_margin_report(analysis, configurable.report_language),
+            name="template_report",
+            response_metadata={"report_source": "template"},
+        ),
+    ]
+    return Command(goto="human_approval", update={"messages": messages, "eventType": None})
+
+
+def fanout_scope(state: OverallState) -> list:
+    """Return the LPs a fresh margin report covers (empty scope means every LP)."""
+    intent_context = state.get("intentContext")
+    return intent_router.resolve_lp_scope(getattr(intent_context, "slots", {})) or list(LP_MAPPING.values())
+
+
+def route_after_classification(state: OverallState, config: RunnableConfig):
+    """Fan multi-LP margin reports out per LP; everything else goes to the supervisor.
+
+    A report request that names no LP covers every mapped LP, so it fans out too.
+    """
+    intent_context = state.get("intentContext")
+    configurable = Configuration.from_runnable_config(config)
+    if configurable.lp_fanout and getattr(intent_context, "intent", None) == "lp_margin_check_report":
+        scope = fanout_scope(state)
+        if len(scope) > 1:
+            return [Send("lp_report_branch", {"lp": lp_name}) for lp_name in scope]
+    if getattr(intent_context, "intent", None) == "lp_margin_check_report" and not has_time_for_supervisor(config):
+        return "template_report"
+    return "call_supervisor"
+
+
+async def lp_report_branch(task: dict, config: RunnableConfig) -> dict:
+    """Fetch, analyse and narrate one LP (one parallel branch of the fan-out)."""
+    lp_name = task["lp"]
+    deadline = deadline_from_config(config)
+    snapshot = await afetch_lp_snapshot(lp_name, deadline)
+    if not snapshot["success"]:
+        return {"lpReports": [{"lp": lp_name, "error": snapshot["error"]}]}
+    
+    accounts = snapshot["accounts"] if isinstance(snapshot["accounts"], list) else [snapshot["accounts"]]
+    positions = snapshot["positions"] if isinstance(snapshot["positions"], list) else [snapshot["positions"]]
+    analysis = generate_margin_analysis(accounts, positions)
+    
+    configurable = Configuration.from_runnable_config(config)
+    # Same writer prompt and report cache as ai_responder, so each LP section reads like
+    # (and is shared with) the single-LP report of the same snapshot
+    cache_key = report_cache_key(analysis, AI_RESPONDER_PROMPT)
+    narrative = report_cache.get(cache_key)
+    if narrative is None and deadline is not None and not deadline.allows("lp_narrative"):
+        deadline.degrade("template_narrative", "lp_report_branch", lp=lp_name)
+        narrative = render_margin_report(analysis, configurable.report_language)
+    elif narrative is None:
+        prompt_messages = [
+            SystemMessage(content=AI_RESPONDER_PROMPT),
+            HumanMessage(content=json.dumps(analysis, ensure_ascii=False)),
+        ]
+        prompt_budget_stats.record("ai_responder", prompt_token_split(prompt_messages))
+        try:
+            call = get_model(configurable.report_model).ainvoke(prompt_messages)
+            response = await (asyncio.wait_for(call, deadline.remaining()) if deadline is not None else call)
+            narrative = response.content
+            if narrative:
+                report_cache.set(cache_key, narrative)
+        except TimeoutError:
+            if deadline is not None:
+                deadline.degrade("template_narrative", "lp_report_branch", lp=lp_name, reason="timeout")
+            else:
+                logger.warning(f"Per-LP narrative timed out for {lp_name}, using template")
+            narrative = render_margin_report(analysis, configurable.report_language)
+        except Exception as e:
+            logger.warning(f"Per-LP narrative failed for {lp_name}, using template: {e}")
+            narrative = render_margin_report(analysis, configurable.report_language)
+    
+    return {"lpReports": [{
+        "lp": lp_name,
+        "accounts": accounts,
+        "positions": positions,
+        "narrative": narrative,
+    }]}
+
+
+async def merge_lp_reports(state: OverallState, config: RunnableConfig) -> Command:
+    """Reduce per-LP branches into the portfolio report, including cross-LP netting."""
+    configurable = Configuration.from_runnable_config(config)
+    snapshot_prefetcher.discard(state.get("prefetchKey"))
+    order = {lp_name: i for i, lp_name in enumerate(fanout_scope(state))}
+    branches = sorted(state.get("lpReports") or [], key=lambda r: order.get(r["lp"], len(order)))
+    succeeded = [branch for branch in branches if not branch.get("error")]
+    
+    if not succeeded:
+        # Nothing fetched - let the supervisor handle and explain it
+        return Command(goto="call_supervisor", update={"lpReports": None, "prefetchKey": None})
+    
+    # Cross-LP netting needs positions from every LP, so the portfolio analysis runs on the merged data
+    portfolio = generate_margin_analysis(
+        [row for branch in succeeded for row in branch["accounts"]],
+        [row for branch in succeeded for row in branch["positions"]],
+    )
+    narratives = [f"### {branch['lp']}\n{branch['narrative']}" for branch in succeeded]
+    narratives += [f"### {branch['lp']}\n⚠️ {branch['error']}" for branch in branches if branch.get("error")]
+    report = (
+        render_margin_report(portfolio, configurable.report_language)
+        + "\n\n<LP_NARRATIVES>\n" + "\n\n".join(narratives) + "\n</LP_NARRATIVES>"
+    )
+    
+    tool_call_id = f"call_{uuid.uuid4().hex}"
+    messages = [
+        AIMessage(content="", tool_calls=[{"name": get_lp_margin_check.name, "args": {}, "id": tool_call_id}]),
+        ToolMessage(content=json.dumps(portfolio, indent=2), name=get_lp_margin_check.name, tool_call_id=tool_call_id),
+        AIMessage(content=report, name="lp_fanout_report", response_metadata={"report_source": "fanout"}),
+    ]
+    return Command(goto="human_approval", update={"messages": messages, "lpReports": None, "prefetchKey": None})
+
+
 def human_approval_node(state: OverallState, config: RunnableConfig) -> Command:
     """Human approval node for margin check recommendations."""
     # Extract the last message which should contain the AI response
@@ -228,18 +573,29 @@ def human_approval_node(state: OverallState, config: RunnableConfig) -> Command:
     # Only interrupt for margin check reports, not regular chat
     intent_context = state.get("intentContext")
     if intent_context and intent_context.intent == "lp_margin_check_report":
+        # Flag reports served from the snapshot-keyed report cache
+        report_message = next(
+            (m for m in reversed(state["messages"]) if isinstance(m, AIMessage) and m.name == "ai_responder"),
+            None,
+        )
+        cached = bool(report_message and report_message.response_metadata.get("report_cache") == "hit")
+        source = (getattr(last_message, "response_metadata", None) or {}).get("report_source", "llm")
+        
         user_input = interrupt({
             "type": "margin_check_approval",
             "report": last_message.content if last_message else "No report generated",
+            "cached": cached,
+            "source": source,
             "question": "Please review the margin analysis report above. You can:\n1. Enter feedback/comments to continue discussion\n2. Leave empty to end the session",
             "trace_id": intent_context.traceId,
             "card_id": configurable.thread_id
         })
         
         # If user provides input, go back to supervisor for further discussion
+        # (or straight to the template report when the deadline leaves no time for it)
         if user_input and str(user_input).strip():
             return Command(
-                goto="call_supervisor",
+                goto="call_supervisor" if has_time_for_supervisor(config) else "template_report",
                 update={"messages": state["messages"] + [HumanMessage(content=str(user_input))]}
             )
     
@@ -258,22 +614,72 @@ def create_main_graph():
     # Add supervisor subgraph call node  
     builder.add_node("call_supervisor", call_supervisor)
     
+    # Add LLM-free report node for MARGIN_ALERT events
+    builder.add_node("template_report", template_report_node, destinations=("human_approval", "call_supervisor"))
+    
+    # Per-LP fan-out (map) and portfolio merge (reduce) for multi-LP reports
+    builder.add_node("lp_report_branch", lp_report_branch)
+    builder.add_node("merge_lp_reports", merge_lp_reports, destinations=("human_approval", "call_supervisor"))
+    
     # Add human approval node for margin check reports
     builder.add_node("human_approval", human_approval_node)
     
     # Define the flow: START -> classify_intent -> call_supervisor -> human_approval -> END
-    builder.add_edge(START, "classify_intent")
-    builder.add_edge("classify_intent", "call_supervisor")
+    # MARGIN_ALERT events: START -> template_report -> human_approval
+    builder.add_conditional_edges(START, route_entry, ["classify_intent", "template_report", "call_supervisor"])
+    # Multi-LP reports: classify_intent -> lp_report_branch (one per LP) -> merge_lp_reports -> human_approval
+    builder.add_conditional_edges("classify_intent", route_after_classification, ["call_supervisor", "lp_report_branch", "template_report"])
+    builder.add_edge("lp_report_branch", "merge_lp_reports")
     builder.add_edge("call_supervisor", "human_approval")
     # human_approval uses Command to conditionally go to END or back to call_supervisor
     
     return builder
 
 
-# Initialize components when module loads
-model = get_model()
-supervisor_subgraph = create_supervisor_subgraph()
-graph = create_main_graph()
+# Graph components are built lazily on first use (or from the FastAPI lifespan)
+# so importing this module stays cheap and free of side effects.
+_build_lock = threading.Lock()
+BUILD_TIMINGS = {}
+
+
+def _timed_build(name: str, factory):
+    started = time.perf_counter()
+    built = factory()
+    BUILD_TIMINGS[name] = round(time.perf_counter() - started, 4)
+    return built
+
+
+@lru_cache(maxsize=None)
+def _cached_supervisor_subgraph(supervisor_model: str, model: str, report_model: str):
+    configurable = Configuration(supervisor_model=supervisor_model, model=model, report_model=report_model)
+    return _timed_build("supervisor_subgraph", lambda: create_supervisor_subgraph(configurable))
+
+
+@lru_cache(maxsize=None)
+def _cached_main_graph():
+    return _timed_build("main_graph", create_main_graph)
+
+
+def get_supervisor_subgraph(configurable: Configuration | None = None):
+    """Return the compiled supervisor subgraph for the run's model choices, building it on first use."""
+    configurable = configurable or Configuration.from_runnable_config()
+    with _build_lock:
+        return _cached_supervisor_subgraph(configurable.supervisor_model, configurable.model, configurable.report_model)
+
+
+def get_graph():
+    """Return the main graph builder, building it on first use."""
+    with _build_lock:
+        return _cached_main_graph()
+
+
+def __getattr__(name: str):
+    # Module-level ``graph`` is kept for the langgraph.json entry point
+    if name == "graph":
+        return get_graph()
+    if name == "supervisor_subgraph":
+        return get_supervisor_subgraph()
+    raise AttributeError(f"module {__name__!r} has no attribute {name!r}")
 
 
 async def build_graph(checkpointer, store=None):
@@ -287,9 +693,10 @@ async def build_graph(checkpointer, store=None):
     Returns:
         Compiled graph instance
     """
+    # Build the supervisor eagerly here so the first request does not pay for it
+    get_supervisor_subgraph()
     
-    return graph.compile(
+    return get_graph().compile(
         checkpointer=checkpointer,
         store=store
     )
-
@@ -0,0 +1,119 @@
+"""
+Message history compaction for long human-in-the-loop conversations.
+
+Every human_approval round trip appends feedback to the thread and sends the
+whole history back into the supervisor. compact_history bounds that:
+- The last ``keep_turns`` turns (a turn starts at a HumanMessage) stay verbatim
+- Older tool outputs are replaced by one-line summaries that keep the snapshot hash
+- If the result still exceeds ``max_tokens``, the oldest turns are dropped
+
+Compacted messages keep their ids, so returning them through the add_messages
+reducer also shrinks the checkpointed state.
+"""
+
+import json
+import logging
+from typing import Any, Dict, List, Sequence
+
+from langchain_core.messages import AnyMessage, HumanMessage, ToolMessage
+from langchain_core.messages.utils import count_tokens_approximately
+
+from src.agent.cache import analysis_content_hash
+
+logger = logging.getLogger(__name__)
+
+# Configuration Settings
+CONFIG = {
+    # Tool outputs from other tools are truncated to this many characters
+    'MAX_TOOL_SUMMARY_CHARS': 300,
+    # Prefix marking a tool output that has already been compacted
+    'COMPACTED_PREFIX': "[compacted]",
+}
+
+
+def summarize_margin_analysis(analysis: Dict[str, Any]) -> str:
+    """
+    Summarize a MarginCheckToolResponse in one line
+
+    Args:
+        analysis: Margin analysis produced by get_lp_margin_check
+
+    Returns:
+        Status, per-LP margin levels, recommendation count and snapshot hash
+    """
+    lps = ", ".join(
+        f"{lp.get('lp')}={float(lp.get('marginLevel', 0)):.1f}%" for lp in analysis.get("perLP", []) if isinstance(lp, dict)
+    )
+    metrics = analysis.get("metrics") or {}
+    return (
+        f"{CONFIG['COMPACTED_PREFIX']} margin snapshot {analysis_content_hash(analysis)[:12]}: "
+        f"status={analysis.get('status')}, avgMarginLevel={float(metrics.get('avgMarginLevel', 0)):.1f}%, "
+        f"LPs: {lps or '-'}; {len(analysis.get('recommendations') or [])} recommendations, "
+        f"{len(analysis.get('crossCandidates') or [])} cross candidates"
+    )
+
+
+def summarize_tool_output(message: ToolMessage) -> str:
+    """Return a compact replacement for an older tool output."""
+    content = message.content if isinstance(message.content, str) else json.dumps(message.content, default=str)
+    if content.startswith(CONFIG['COMPACTED_PREFIX']):
+        return content
+    try:
+        parsed = json.loads(content)
+    except (json.JSONDecodeError, TypeError):
+        parsed = None
+    if isinstance(parsed, dict) and "perLP" in parsed:
+        return summarize_margin_analysis(parsed)
+    if len(content) <= CONFIG['MAX_TOOL_SUMMARY_CHARS']:
+        return content
+    return f"{CONFIG['COMPACTED_PREFIX']} {content[:CONFIG['MAX_TOOL_SUMMARY_CHARS']]}..."
+
+
+def split_turns(messages: Sequence[AnyMessage]) -> List[List[AnyMessage]]:
+    """Split messages into turns, each starting at a HumanMessage."""
+    turns: List[List[AnyMessage]] = []
+    for message in messages:
+        if isinstance(message, HumanMessage) or not turns:
+            turns.append([])
+        turns[-1].append(message)
+    return turns
+
+
+def compact_history(messages: Sequence[AnyMessage], keep_turns: int = 3, max_tokens: int = 12000) -> List[AnyMessage]:
+    """
+    Bound the message history sent to the supervisor
+
+    Args:
+        messages: Full thread history
+        keep_turns: Number of most recent turns kept verbatim
+        max_tokens: Approximate token budget for the compacted history (<= 0 disables the cap)
+
+    Returns:
+        Compacted message list; the latest turn is always kept whole
+    """
+    turns = split_turns(messages)
+    keep_turns = max(1, int(keep_turns))
+    older, recent = turns[:-keep_turns], turns[-keep_turns:]
+
+    compacted_turns = []
+    for turn in older:
+        compacted = []
+        for message in turn:
+            if isinstance(message, ToolMessage):
+                summary = summarize_tool_output(message)
+                if summary != message.content:
+                    message = message.model_copy(update={"content": summary})
+            compacted.append(message)
+        compacted_turns.append(compacted)
+    compacted_turns.extend(recent)
+
+    dropped = 0
+    if max_tokens > 0:
+        while len(compacted_turns) > 1 and count_tokens_approximately(
+            [m for turn in compacted_turns for m in turn]
+        ) > max_tokens:
+            dropped += len(compacted_turns.pop(0))
+    if dropped:
+        logger.info(f"History compaction dropped {dropped} messages to fit {max_tokens} tokens")
+
+    return [message for turn in compacted_turns for message in turn]
@@ -0,0 +1,299 @@
+"""
+Per-node latency and token instrumentation for the LangGraph pipeline.
+
+Contains:
+- RunMetricsCallback: callback handler attached to one graph run; records wall
+  time, LLM round trips, prompt/completion tokens and tool time per node
+- RunMetricsRegistry: process-wide aggregates and the most recent run summaries
+
+Nodes are identified by their path through the graph, e.g.
+``call_supervisor/supervisor/agent`` for the supervisor's tool-selection LLM
+call or ``call_supervisor/supervisor/tools`` for get_lp_margin_check.
+"""
+
+import os
+import time
+import logging
+import threading
+from collections import defaultdict, deque
+from typing import Any, Dict, Optional
+from uuid import UUID
+
+from langchain_core.callbacks import BaseCallbackHandler
+
+from src.agent.prompts import prompt_token_split
+
+logger = logging.getLogger(__name__)
+
+# Configuration Settings
+CONFIG = {
+    # Run summaries kept for the metrics endpoint
+    'RECENT_RUNS': int(os.getenv("METRICS_RECENT_RUNS", "50")),
+    # Decimal places for reported seconds
+    'SECONDS_PRECISION': 4,
+}
+
+
+def node_path(metadata: Optional[Dict[str, Any]]) -> Optional[str]:
+    """Build the node path (``parent/child``) from LangGraph callback metadata."""
+    metadata = metadata or {}
+    node = metadata.get("langgraph_node")
+    if not node:
+        return None
+    namespace = metadata.get("checkpoint_ns") or ""
+    parts = [part.split(":")[0] for part in namespace.split("|") if part]
+    if not parts or parts[-1] != node:
+        parts.append(node)
+    return "/".join(parts)
+
+
+def _empty_node_metrics() -> Dict[str, Any]:
+    return {
+        "calls": 0,
+        "wall_seconds": 0.0,
+        "llm_calls": 0,
+        "llm_seconds": 0.0,
+        "prompt_tokens": 0,
+        "cached_prompt_tokens": 0,
+        "completion_tokens": 0,
+        "prompt_static_tokens": 0,
+        "prompt_dynamic_tokens": 0,
+        "tool_calls": 0,
+        "tool_seconds": 0.0,
+    }
+
+
+class RunMetricsCallback(BaseCallbackHandler):
+    """Collect per-node metrics for a single graph run."""
+
+    # Record synchronously on the event loop; handlers only do dict updates
+    run_inline = True
+
+    def __init__(self, thread_id: Optional[str] = None, trace_id: Optional[str] = None):
+        self.thread_id = thread_id
+        self.trace_id = trace_id
+        self.started_at = time.perf_counter()
+        self.finished_at: Optional[float] = None
+        self.nodes: Dict[str, Dict[str, Any]] = defaultdict(_empty_node_metrics)
+        self._open: Dict[UUID, tuple] = {}
+        self._lock = threading.Lock()
+
+    # Timing helpers
+
+    def _start(self, run_id: UUID, kind: str, metadata: Optional[Dict[str, Any]]) -> None:
+        path = node_path(metadata)
+        if path:
+            with self._lock:
+                self._open[run_id] = (kind, path, time.perf_counter())
+
+    def _end(self, run_id: UUID) -> Optional[tuple]:
+        with self._lock:
+            entry = self._open.pop(run_id, None)
+        if entry is None:
+            return None
+        kind, path, started = entry
+        return kind, path, time.perf_counter() - started
+
+    # Node (chain) callbacks
+
+    def on_chain_start(self, serialized, inputs, *, run_id: UUID, metadata=None, **kwargs: Any) -> None:
+        # Only the node runnable itself, not the chains nested inside it
+        if metadata and kwargs.get("name") == metadata.get("langgraph_node"):
+            self._start(run_id, "node", metadata)
+
+    def on_chain_end(self, outputs, *, run_id: UUID, **kwargs: Any) -> None:
+        self._record_node_end(run_id)
+
+    def on_chain_error(self, error, *, run_id: UUID, **kwargs: Any) -> None:
+        self._record_node_end(run_id)
+
+    def _record_node_end(self, run_id: UUID) -> None:
+        ended = self._end(run_id)
+        if ended is None:
+            return
+        _, path, elapsed = ended
+        with self._lock:
+            self.nodes[path]["calls"] += 1
+            self.nodes[path]["wall_seconds"] += elapsed
+
+    # LLM callbacks
+
+    def on_chat_model_start(self, serialized, messages, *, run_id: UUID, metadata=None, **kwargs: Any) -> None:
+        self._start(run_id, "llm", metadata)
+        path = node_path(metadata)
+        if path and messages:
+            # Estimated cost of the static (provider-cacheable) prefix vs the per-request part
+            split = prompt_token_split(messages[0])
+            with self._lock:
+                self.nodes[path]["prompt_static_tokens"] += split["static_tokens"]
+                self.nodes[path]["prompt_dynamic_tokens"] += split["dynamic_tokens"]
+
+    def on_llm_start(self, serialized, prompts, *, run_id: UUID, metadata=None, **kwargs: Any) -> None:
+        self._start(run_id, "llm", metadata)
+
+    def on_llm_end(self, response, *, run_id: UUID, **kwargs: Any) -> None:
+        ended = self._end(run_id)
+        if ended is None:
+            return
+        _, path, elapsed = ended
+        prompt_tokens, completion_tokens, cached_tokens = self._token_usage(response)
+        with self._lock:
+            metrics = self.nodes[path]
+            metrics["llm_calls"] += 1
+            metrics["llm_seconds"] += elapsed
+            metrics["prompt_tokens"] += prompt_tokens
+            metrics["cached_prompt_tokens"] += cached_tokens
+            metrics["completion_tokens"] += completion_tokens
+
+    def on_llm_error(self, error, *, run_id: UUID, **kwargs: Any) -> None:
+        ended = self._end(run_id)
+        if ended is not None:
+            _, path, elapsed = ended
+            with self._lock:
+                self.nodes[path]["llm_calls"] += 1
+                self.nodes[path]["llm_seconds"] += elapsed
+
+    @staticmethod
+    def _token_usage(response) -> tuple:
+        """Read prompt/completion/cached-prefix tokens from message usage metadata or provider llm_output."""
+        prompt_tokens = completion_tokens = cached_tokens = 0
+        for generations in getattr(response, "generations", None) or []:
+            for generation in generations:
+                usage = getattr(getattr(generation, "message", None), "usage_metadata", None) or {}
+                prompt_tokens += usage.get("input_tokens", 0)
+                completion_tokens += usage.get("output_tokens", 0)
+                cached_tokens += (usage.get("input_token_details") or {}).get("cache_read", 0) or 0
+        if not prompt_tokens and not completion_tokens:
+            usage = (getattr(response, "llm_output", None) or {}).get("token_usage") or {}
+            prompt_tokens = usage.get("prompt_tokens", 0)
+            completion_tokens = usage.get("completion_tokens", 0)
+            cached_tokens = (usage.get("prompt_tokens_details") or {}).get("cached_tokens", 0) or 0
+        return prompt_tokens, completion_tokens, cached_tokens
+
+    # Tool callbacks
+
+    def on_tool_start(self, serialized, input_str, *, run_id: UUID, metadata=None, **kwargs: Any) -> None:
+        self._start(run_id, "tool", metadata)
+
+    def on_tool_end(self, output, *, run_id: UUID, **kwargs: Any) -> None:
+        self._record_tool_end(run_id)
+
+    def on_tool_error(self, error, *, run_id: UUID, **kwargs: Any) -> None:
+        self._record_tool_end(run_id)
+
+    def _record_tool_end(self, run_id: UUID) -> None:
+        ended = self._end(run_id)
+        if ended is None:
+            return
+        _, path, elapsed = ended
+        with self._lock:
+            self.nodes[path]["tool_calls"] += 1
+            self.nodes[path]["tool_seconds"] += elapsed
+
+    # Summary
+
+    def summary(self) -> Dict[str, Any]:
+        """
+        Summarize the run
+
+        Returns:
+            traceId, thread_id, total wall time, totals and per-node metrics.
+            ``untracked_seconds`` is run time outside top-level nodes
+            (checkpoint writes, routing and scheduling overhead).
+        """
+        precision = CONFIG['SECONDS_PRECISION']
+        end = self.finished_at or time.perf_counter()
+        wall = end - self.started_at
+        with self._lock:
+            nodes = {path: dict(metrics) for path, metrics in self.nodes.items()}
+        top_level = sum(m["wall_seconds"] for path, m in nodes.items() if "/" not in path)
+        for metrics in nodes.values():
+            for key in ("wall_seconds", "llm_seconds", "tool_seconds"):
+                metrics[key] = round(metrics[key], precision)
+        return {
+            "traceId": self.trace_id,
+            "thread_id": self.thread_id,
+            "wall_seconds": round(wall, precision),
+            "untracked_seconds": round(max(0.0, wall - top_level), precision),
+            "llm_calls": sum(m["llm_calls"] for m in nodes.values()),
+            "prompt_tokens": sum(m["prompt_tokens"] for m in nodes.values()),
+            "cached_prompt_tokens": sum(m["cached_prompt_tokens"] for m in nodes.values()),
+            "prompt_static_tokens": sum(m["prompt_static_tokens"] for m in nodes.values()),
+            "prompt_dynamic_tokens": sum(m["prompt_dynamic_tokens"] for m in nodes.values()),
+            "completion_tokens": sum(m["completion_tokens"] for m in nodes.values()),
+            "tool_seconds": round(sum(m["tool_seconds"] for m in nodes.values()), precision),
+            "nodes": nodes,
+        }
+
+    def finish(self, trace_id: Optional[str] = None) -> Dict[str, Any]:
+        """Close the run, record it in the shared registry (once) and return its summary."""
+        if trace_id:
+            self.trace_id = trace_id
+        if self.finished_at is not None:
+            return self.summary()
+        self.finished_at = time.perf_counter()
+        summary = self.summary()
+        run_metrics_registry.record(summary)
+        return summary
+
+
+class RunMetricsRegistry:
+    """Process-wide aggregation of run metrics."""
+
+    def __init__(self, recent_runs: int = CONFIG['RECENT_RUNS']):
+        self._lock = threading.Lock()
+        self._nodes: Dict[str, Dict[str, Any]] = defaultdict(lambda: {**_empty_node_metrics(), "max_wall_seconds": 0.0})
+        self._recent = deque(maxlen=recent_runs)
+        self._runs = 0
+        self._wall_seconds = 0.0
+
+    def record(self, summary: Dict[str, Any]) -> None:
+        """Add one run summary to the aggregates."""
+        with self._lock:
+            self._runs += 1
+            self._wall_seconds += summary["wall_seconds"]
+            self._recent.append(summary)
+            for path, metrics in summary["nodes"].items():
+                aggregate = self._nodes[path]
+                for key, value in metrics.items():
+                    aggregate[key] += value
+                aggregate["max_wall_seconds"] = max(aggregate["max_wall_seconds"], metrics["wall_seconds"])
+
+    def find(self, trace_id: Optional[str] = None, thread_id: Optional[str] = None) -> list:
+        """Return recent run summaries matching a traceId and/or thread_id."""
+        with self._lock:
+            return [
+                run for run in self._recent
+                if (trace_id is None or run["traceId"] == trace_id)
+                and (thread_id is None or run["thread_id"] == thread_id)
+            ]
+
+    def stats(self) -> Dict[str, Any]:
+        """Return run counts, per-node totals and averages."""
+        precision = CONFIG['SECONDS_PRECISION']
+        with self._lock:
+            nodes = {}
+            for path, aggregate in self._nodes.items():
+                calls = aggregate["calls"] or 1
+                nodes[path] = {
+                    **{k: round(v, precision) if isinstance(v, float) else v for k, v in aggregate.items()},
+                    "avg_wall_seconds": round(aggregate["wall_seconds"] / calls, precision),
+                }
+            return {
+                "runs": self._runs,
+                "avg_wall_seconds": round(self._wall_seconds / self._runs, precision) if self._runs else 0.0,
+                "nodes": nodes,
+                "recent_runs": len(self._recent),
+            }
+
+    def reset(self) -> None:
+        """Drop all aggregates and recent runs."""
+        with self._lock:
+            self._nodes.clear()
+            self._recent.clear()
+            self._runs = 0
+            self._wall_seconds = 0.0
+
+
+# Global metrics registry
+run_metrics_registry = RunMetricsRegistry()
@@ -0,0 +1,231 @@
+"""
+Deterministic fast-path intent router.
+
+Runs before the LLM classifier in ``classify_intent`` and resolves the
+unambiguous cases on its own:
+- LP aliases are derived from ``LP_MAPPING`` and compiled into one regex automaton
+- Margin/risk keywords (Chinese and English) identify margin report requests
+- Greetings and small talk identify general conversation
+
+Anything it is not confident about returns ``None`` so the caller falls back
+to the LLM classifier.
+"""
+
+import re
+import logging
+import threading
+from typing import Dict, Iterable, List, Optional, Set
+
+from src.agent.schemas import IntentContext
+from src.agent.data_gateway import LP_MAPPING
+
+logger = logging.getLogger(__name__)
+
+# Configuration Settings
+CONFIG = {
+    # Inputs longer than this are left to the LLM (multi-sentence requests are rarely unambiguous)
+    'MAX_INPUT_CHARS': 200,
+    # Minimum alias length so short fragments do not match inside ordinary words
+    'MIN_ALIAS_CHARS': 3,
+    # Confidence reported for fast-path decisions
+    'MARGIN_CONFIDENCE': 0.95,
+    'CHAT_CONFIDENCE': 0.9,
+}
+
+# Generic words that appear in LP names but do not identify a single LP
+ALIAS_STOPWORDS = {
+    "FIN", "FINANCE", "FINANCIAL", "TRADE", "TRADING", "GLOBAL", "LTD", "LIMITED",
+    "CAPITAL", "MARKETS", "MARKET", "GROUP", "PRIME", "BANK", "THE",
+}
+
+# Margin/risk keywords; any hit marks the input as a margin report request
+MARGIN_PATTERNS = [
+    r"保证金", r"风险", r"风控", r"仓位", r"持仓", r"头寸", r"爆仓", r"强平",
+    r"净额", r"对冲", r"敞口", r"预警", r"告警", r"复查", r"占用率",
+    r"\bmargins?\b", r"\brisks?\b", r"\bpositions?\b", r"\bexposures?\b", r"\bnetting\b",
+    r"\bhedg(?:e|es|ing)\b", r"\brecheck\b", r"\butili[sz]ation\b",
+]
+
+# Small-talk patterns; only used when no margin keyword or LP alias is present
+CHAT_PATTERNS = [
+    r"^\s*(?:hi|hello|hey|thanks|thank\s+you|good\s+(?:morning|afternoon|evening))\b",
+    r"^\s*(?:你好|您好|嗨|谢谢|多谢|早上好|下午好|晚上好|再见)",
+    r"\bhow\s+are\s+you\b", r"你是谁", r"\bwho\s+are\s+you\b", r"天气", r"\bweather\b",
+]
+
+_WORD_EDGE_BEFORE = r"(?<![A-Za-z0-9])"
+_WORD_EDGE_AFTER = r"(?![A-Za-z0-9])"
+
+
+def _split_camel(token: str) -> List[str]:
+    """Split ``GBEGlobal1`` into ``['GBE', 'Global']``."""
+    return re.findall(r"[A-Z]+(?![a-z])|[A-Z][a-z]+|[a-z]+", token)
+
+
+def derive_lp_aliases(lp_names: Iterable[str]) -> Dict[str, str]:
+    """
+    Derive case-insensitive aliases for each LP name.
+
+    Aliases that would map to more than one LP are dropped so every match
+    identifies exactly one LP.
+
+    Args:
+        lp_names: Canonical LP names, e.g. ``"[CFH] MAJESTIC FIN TRADE"``
+
+    Returns:
+        Dictionary of lower-cased alias -> canonical LP name
+    """
+    candidates: Dict[str, Set[str]] = {}
+
+    def add(alias: str, lp_name: str) -> None:
+        alias = alias.strip()
+        if len(alias) < CONFIG['MIN_ALIAS_CHARS'] or alias.upper() in ALIAS_STOPWORDS:
+            return
+        candidates.setdefault(alias.lower(), set()).add(lp_name)
+
+    for lp_name in lp_names:
+        add(lp_name, lp_name)
+        # Bracket tags such as "[CFH]" are the names operators actually type
+        for tag in re.findall(r"\[([^\]]+)\]", lp_name):
+            add(tag, lp_name)
+        for token in re.findall(r"[A-Za-z0-9]+", lp_name):
+            add(token, lp_name)
+            add(token.rstrip("0123456789"), lp_name)
+            for part in _split_camel(token):
+                add(part, lp_name)
+
+    return {alias: next(iter(names)) for alias, names in candidates.items() if len(names) == 1}
+
+
+class IntentRouter:
+    """Rule-based intent classifier with hit-rate statistics."""
+
+    def __init__(self, lp_names: Iterable[str]):
+        self.lp_names = list(lp_names)
+        self.aliases = derive_lp_aliases(self.lp_names)
+        # Longest aliases first so "GBEGlobal1" wins over "GBE"
+        alternation = "|".join(
+            re.escape(alias) for alias in sorted(self.aliases, key=len, reverse=True)
+        )
+        self._alias_re = re.compile(
+            f"{_WORD_EDGE_BEFORE}(?:{alternation}){_WORD_EDGE_AFTER}", re.IGNORECASE
+        ) if alternation else None
+        self._margin_re = re.compile("|".join(MARGIN_PATTERNS), re.IGNORECASE)
+        self._chat_re = re.compile("|".join(CHAT_PATTERNS), re.IGNORECASE)
+
+        self._lock = threading.Lock()
+        self._stats = {"total": 0, "hits": 0, "fallbacks": 0, "by_intent": {}}
+
+    def match_lps(self, text: str) -> List[str]:
+        """Return the distinct canonical LP names mentioned in ``text``."""
+        if not self._alias_re:
+            return []
+        found: List[str] = []
+        for match in self._alias_re.finditer(text):
+            lp_name = self.aliases[match.group(0).lower()]
+            if lp_name not in found:
+                found.append(lp_name)
+        return found
+
+    def resolve_lp_scope(self, slots: Optional[Dict[str, object]]) -> List[str]:
+        """
+        Resolve the LP scope named in intent slots to canonical LP names.
+
+        Accepts ``slots["lp"]`` and an optional ``slots["lps"]`` list; each
+        value may be a canonical name or an alias (e.g. ``"CFH"`` from an
+        alert payload). Values that do not identify exactly one LP are dropped.
+
+        Args:
+            slots: IntentContext.slots
+
+        Returns:
+            Canonical LP names; empty means "all LPs"
+        """
+        slots = slots or {}
+        requested = [slots.get("lp")] + list(slots.get("lps") or [])
+        scope: List[str] = []
+        for value in requested:
+            if not value:
+                continue
+            value = str(value)
+            if value in self.lp_names:
+                resolved = [value]
+            else:
+                resolved = self.match_lps(value)
+            if len(resolved) != 1:
+                logger.warning(f"Ignoring LP scope value that does not identify one LP: {value!r}")
+                continue
+            if resolved[0] not in scope:
+                scope.append(resolved[0])
+        return scope
+
+    def route(self, user_input: str) -> Optional[IntentContext]:
+        """
+        Classify ``user_input`` without calling the LLM.
+
+        Args:
+            user_input: Raw user message text
+
+        Returns:
+            IntentContext when the decision is unambiguous, otherwise None
+        """
+        context = self._classify(user_input or "")
+        self._record(context)
+        return context
+
+    def _classify(self, text: str) -> Optional[IntentContext]:
+        text = text.strip()
+        if not text or len(text) > CONFIG['MAX_INPUT_CHARS']:
+            return None
+
+        lps = self.match_lps(text)
+        if len(lps) > 1:
+            # The classifier slot holds a single LP; let the LLM decide the scope
+            return None
+
+        if self._margin_re.search(text):
+            return IntentContext(
+                intent="lp_margin_check_report",
+                confidence=CONFIG['MARGIN_CONFIDENCE'],
+                slots={"currentLevel": "lp", "brokerId": None, "lp": lps[0] if lps else None, "group": None},
+            )
+
+        if not lps and self._chat_re.search(text):
+            return IntentContext(
+                intent="general_conversation",
+                confidence=CONFIG['CHAT_CONFIDENCE'],
+                slots={"currentLevel": "lp", "brokerId": None, "lp": None, "group": None},
+            )
+
+        return None
+
+    def _record(self, context: Optional[IntentContext]) -> None:
+        with self._lock:
+            self._stats["total"] += 1
+            if context is None:
+                self._stats["fallbacks"] += 1
+            else:
+                self._stats["hits"] += 1
+                by_intent = self._stats["by_intent"]
+                by_intent[context.intent] = by_intent.get(context.intent, 0) + 1
+
+    def stats(self) -> Dict[str, object]:
+        """Return fast-path counters and hit rate."""
+        with self._lock:
+            total = self._stats["total"]
+            return {
+                "total": total,
+                "hits": self._stats["hits"],
+                "fallbacks": self._stats["fallbacks"],
+                "hit_rate": round(self._stats["hits"] / total, 4) if total else 0.0,
+                "by_intent": dict(self._stats["by_intent"]),
+            }
+
+    def reset_stats(self) -> None:
+        """Reset all counters."""
+        with self._lock:
+            self._stats = {"total": 0, "hits": 0, "fallbacks": 0, "by_intent": {}}
+
+
+# Global router instance built from the configured LP mapping
+intent_router = IntentRouter(LP_MAPPING.values())
@@ -0,0 +1,320 @@
+"""
+Process-wide registry of pooled LLM clients.
+
+Contains the ModelRegistry class for:
+- Reusing chat model instances keyed by model name and parameters
+- Sharing HTTP connection pools across every model that talks to the same endpoint
+- Per-model concurrency limits
+- Warming connections at application startup
+- Hedged, retried and rate-budgeted requests (see llm_resilience)
+- Switching to the offline, deterministic backend (LLM_BACKEND=offline)
+"""
+
+import os
+import json
+import asyncio
+import logging
+from contextlib import asynccontextmanager
+from functools import lru_cache
+from typing import Any, AsyncIterator, Dict, Optional, Tuple
+
+import httpx
+
+logger = logging.getLogger(__name__)
+
+# Endpoint Configuration
+DASHSCOPE_BASE_URL = "https://dashscope.aliyuncs.com/compatible-mode/v1"
+
+# Configuration Settings
+CONFIG = {
+    # "dashscope" (default) or "offline" for network-free load tests and benchmarks
+    'BACKEND': os.getenv("LLM_BACKEND", "dashscope"),
+
+    # HTTP connection pool (shared per base URL)
+    'MAX_CONNECTIONS': int(os.getenv("LLM_MAX_CONNECTIONS", "20")),
+    'MAX_KEEPALIVE_CONNECTIONS': int(os.getenv("LLM_MAX_KEEPALIVE_CONNECTIONS", "10")),
+    'KEEPALIVE_EXPIRY_SECONDS': float(os.getenv("LLM_KEEPALIVE_EXPIRY_SECONDS", "60")),
+    'REQUEST_TIMEOUT_SECONDS': float(os.getenv("LLM_REQUEST_TIMEOUT_SECONDS", "60")),
+    'WARMUP_TIMEOUT_SECONDS': 5.0,
+
+    # Concurrent in-flight requests per model ("qwen-plus-latest=8,qwen-max-latest=4")
+    'DEFAULT_CONCURRENCY': int(os.getenv("LLM_DEFAULT_CONCURRENCY", "16")),
+    'CONCURRENCY_LIMITS': os.getenv("LLM_CONCURRENCY_LIMITS", ""),
+}
+
+
+def parse_model_limits(spec: str, kind: str = "concurrency") -> Dict[str, int]:
+    """Parse ``model=limit`` pairs separated by commas."""
+    limits: Dict[str, int] = {}
+    for item in spec.split(","):
+        if "=" not in item:
+            continue
+        name, value = item.split("=", 1)
+        try:
+            limits[name.strip()] = max(1, int(value))
+        except ValueError:
+            logger.warning(f"Ignoring invalid LLM {kind} limit: {item!r}")
+    return limits
+
+
+@lru_cache(maxsize=None)
+def pooled_chat_model_class():
+    """
+    Build the ChatOpenAI subclass used by the registry.
+
+    langchain_openai (and the openai SDK behind it) is only imported here so
+    importing the agent package does not pay for it.
+    """
+    from langchain_openai import ChatOpenAI
+
+    from src.agent.llm_resilience import estimate_call_tokens, llm_call_policy
+
+    class PooledChatOpenAI(ChatOpenAI):
+        """ChatOpenAI that holds a per-model concurrency slot for every request.
+
+        Requests go through llm_call_policy (RPM/TPM budget, Retry-After aware
+        retries, p95 hedging); each attempt takes its own slot, so a backoff
+        wait does not hold one.
+        """
+
+        def _generate(self, messages, stop=None, run_manager=None, **kwargs):
+            parent = super()._generate
+            return llm_call_policy.call_sync(
+                self.model_name, lambda: parent(messages, stop=stop, run_manager=run_manager, **kwargs)
+            )
+
+        async def _agenerate(self, messages, stop=None, run_manager=None, **kwargs):
+            parent = super()._agenerate
+
+            async def attempt():
+                async with ModelRegistry.slot(self.model_name):
+                    return await parent(messages, stop=stop, run_manager=run_manager, **kwargs)
+
+            return await llm_call_policy.call(self.model_name, attempt, estimate_call_tokens(messages))
+
+        async def _astream(self, messages, stop=None, run_manager=None, **kwargs) -> AsyncIterator:
+            parent = super()._astream
+
+            async def attempt():
+                async with ModelRegistry.slot(self.model_name):
+                    async for chunk in parent(messages, stop=stop, run_manager=run_manager, **kwargs):
+                        yield chunk
+
+            async for chunk in llm_call_policy.stream(self.model_name, attempt, estimate_call_tokens(messages)):
+                yield chunk
+
+    return PooledChatOpenAI
+
+
+class ModelRegistry:
+    """
+    Chat model registry using singleton pattern.
+    Provides shared, connection-pooled model clients for the whole process.
+    """
+
+    _instance: Optional["ModelRegistry"] = None
+    _models: Dict[Tuple, Any] = {}
+    _http_clients: Dict[str, httpx.Client] = {}
+    _async_http_clients: Dict[str, httpx.AsyncClient] = {}
+    _limiters: Dict[str, asyncio.Semaphore] = {}
+    _in_flight: Dict[str, int] = {}
+    _concurrency_limits: Dict[str, int] = parse_model_limits(CONFIG['CONCURRENCY_LIMITS'])
+
+    def __new__(cls):
+        if cls._instance is None:
+            cls._instance = super().__new__(cls)
+        return cls._instance
+
+    @classmethod
+    def get_model(
+        cls,
+        model: str,
+        temperature: float = 0.5,
+        base_url: str = DASHSCOPE_BASE_URL,
+        api_key: Optional[str] = None,
+        **kwargs: Any,
+    ) -> Any:
+        """
+        Get a shared chat model instance, creating it on first use
+
+        Args:
+            model: Model name
+            temperature: Sampling temperature
+            base_url: OpenAI-compatible endpoint
+            api_key: API key (defaults to DASHSCOPE_API_KEY)
+            **kwargs: Extra ChatOpenAI parameters; they are part of the cache key
+
+        Returns:
+            ChatOpenAI: model bound to the pooled HTTP clients for ``base_url``
+            (OfflineChatModel when LLM_BACKEND=offline)
+        """
+        if CONFIG['BACKEND'] == "offline":
+            return cls._get_offline_model(model, temperature)
+
+        api_key = api_key or os.getenv("DASHSCOPE_API_KEY")
+        # Retries are left to llm_call_policy, which honours Retry-After and the RPM/TPM budget
+        kwargs.setdefault("max_retries", 0)
+        key = (model, temperature, base_url, api_key, json.dumps(kwargs, sort_keys=True, default=str))
+
+        instance = cls._models.get(key)
+        if instance is None:
+            instance = pooled_chat_model_class()(
+                model=model,
+                api_key=api_key,
+                base_url=base_url,
+                temperature=temperature,
+                http_client=cls._get_http_client(base_url),
+                http_async_client=cls._get_async_http_client(base_url),
+                **kwargs,
+            )
+            cls._models[key] = instance
+            logger.info(f"Registered pooled chat model {model} (temperature={temperature})")
+        return instance
+
+    @classmethod
+    def _get_offline_model(cls, model: str, temperature: float) -> Any:
+        from src.agent.offline_llm import offline_chat_model
+
+        key = (model, temperature, "offline")
+        instance = cls._models.get(key)
+        if instance is None:
+            instance = offline_chat_model(model)
+            cls._models[key] = instance
+            logger.info(f"Registered offline chat model {model}")
+        return instance
+
+    @classmethod
+    def _pool_limits(cls) -> httpx.Limits:
+        return httpx.Limits(
+            max_connections=CONFIG['MAX_CONNECTIONS'],
+            max_keepalive_connections=CONFIG['MAX_KEEPALIVE_CONNECTIONS'],
+            keepalive_expiry=CONFIG['KEEPALIVE_EXPIRY_SECONDS'],
+        )
+
+    @classmethod
+    def _get_http_client(cls, base_url: str) -> httpx.Client:
+        client = cls._http_clients.get(base_url)
+        if client is None:
+            client = httpx.Client(limits=cls._pool_limits(), timeout=CONFIG['REQUEST_TIMEOUT_SECONDS'])
+            cls._http_clients[base_url] = client
+        return client
+
+    @classmethod
+    def _get_async_http_client(cls, base_url: str) -> httpx.AsyncClient:
+        client = cls._async_http_clients.get(base_url)
+        if client is None:
+            client = httpx.AsyncClient(limits=cls._pool_limits(), timeout=CONFIG['REQUEST_TIMEOUT_SECONDS'])
+            cls._async_http_clients[base_url] = client
+        return client
+
+    @classmethod
+    def get_limiter(cls, model: str) -> asyncio.Semaphore:
+        """
+        Get the concurrency limiter for a model
+
+        Args:
+            model: Model name
+
+        Returns:
+            asyncio.Semaphore: limiter sized from LLM_CONCURRENCY_LIMITS or LLM_DEFAULT_CONCURRENCY
+        """
+        limiter = cls._limiters.get(model)
+        if limiter is None:
+            limiter = asyncio.Semaphore(cls.concurrency_limit(model))
+            cls._limiters[model] = limiter
+        return limiter
+
+    @classmethod
+    @asynccontextmanager
+    async def slot(cls, model: str) -> AsyncIterator[None]:
+        """
+        Hold one of the model's concurrency slots for the duration of a request
+
+        Args:
+            model: Model name
+        """
+        async with cls.get_limiter(model):
+            cls._in_flight[model] = cls._in_flight.get(model, 0) + 1
+            try:
+                yield
+            finally:
+                cls._in_flight[model] -= 1
+
+    @classmethod
+    def concurrency_limit(cls, model: str) -> int:
+        """Return the configured in-flight request limit for a model."""
+        return cls._concurrency_limits.get(model, CONFIG['DEFAULT_CONCURRENCY'])
+
+    @classmethod
+    def set_concurrency_limit(cls, model: str, limit: int) -> None:
+        """
+        Override the in-flight request limit for a model
+
+        Args:
+            model: Model name
+            limit: Maximum concurrent requests (>= 1)
+        """
+        cls._concurrency_limits[model] = max(1, int(limit))
+        cls._limiters.pop(model, None)
+
+    @classmethod
+    async def warmup(cls, base_urls: Optional[list] = None) -> None:
+        """
+        Open connections to the LLM endpoints so the first request skips TLS setup
+
+        Args:
+            base_urls: Endpoints to warm (defaults to every registered endpoint plus DashScope)
+        """
+        if CONFIG['BACKEND'] == "offline":
+            return
+        urls = base_urls or sorted(set(cls._async_http_clients) | {DASHSCOPE_BASE_URL})
+        for base_url in urls:
+            client = cls._get_async_http_client(base_url)
+            try:
+                api_key = os.getenv("DASHSCOPE_API_KEY")
+                headers = {"Authorization": f"Bearer {api_key}"} if api_key else {}
+                await client.get(f"{base_url}/models", headers=headers, timeout=CONFIG['WARMUP_TIMEOUT_SECONDS'])
+                logger.info(f"Warmed LLM connection pool for {base_url}")
+            except Exception as e:
+                logger.warning(f"LLM connection warmup failed for {base_url}: {e}")
+
+    @classmethod
+    def stats(cls) -> Dict[str, Any]:
+        """Return registry size, per-model concurrency usage and call policy counters."""
+        from src.agent.llm_resilience import llm_call_policy
+
+        models = sorted({key[0] for key in cls._models})
+        return {
+            "models": len(cls._models),
+            "endpoints": len(cls._async_http_clients),
+            "concurrency": {
+                name: {
+                    "limit": cls.concurrency_limit(name),
+                    "in_flight": cls._in_flight.get(name, 0),
+                }
+                for name in models
+            },
+            "calls": llm_call_policy.stats(),
+        }
+
+    @classmethod
+    async def close(cls) -> None:
+        """
+        Close all pooled HTTP clients and drop cached models
+        """
+        for client in cls._async_http_clients.values():
+            try:
+                await client.aclose()
+            except Exception as e:
+                logger.warning(f"Error closing LLM async HTTP client: {e}")
+        for client in cls._http_clients.values():
+            try:
+                client.close()
+            except Exception as e:
+                logger.warning(f"Error closing LLM HTTP client: {e}")
+        cls._models = {}
+        cls._http_clients = {}
+        cls._async_http_clients = {}
+        cls._limiters = {}
+        cls._in_flight = {}
+        logger.info("LLM model registry closed successfully")
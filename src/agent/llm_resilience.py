@@ -0,0 +1,404 @@
+"""
+Hedged, retried and rate-budgeted LLM calls.
+
+A single slow DashScope response used to stall a whole report and a 429
+failed the run outright. The registry's pooled models route every call
+through the global llm_call_policy:
+- A client-side requests/tokens-per-minute budget per model; calls wait for
+  room instead of tripping the provider's limit
+- Retries on 429 and 5xx with exponential backoff (full jitter), honouring
+  the provider's Retry-After / retry-after-ms headers
+- A hedged duplicate request once the first is slower than the model's
+  observed p95 latency; whichever returns first wins and the other is cancelled
+
+Streaming calls get the budget and are retried only before their first
+chunk; they are not hedged, since a second stream cannot be merged into
+one whose tokens have already been emitted.
+
+Contains:
+- retry_after_seconds / is_retryable for provider errors
+- RateBudget (sliding one-minute RPM/TPM window)
+- LLMCallPolicy and the global llm_call_policy
+"""
+
+import os
+import time
+import random
+import asyncio
+import logging
+from collections import defaultdict, deque
+from email.utils import parsedate_to_datetime
+from typing import Any, AsyncIterator, Awaitable, Callable, Dict, List, Optional, Sequence
+
+from langchain_core.messages import BaseMessage
+from langchain_core.messages.utils import count_tokens_approximately
+
+from src.agent.llm_registry import parse_model_limits
+
+logger = logging.getLogger(__name__)
+
+# Configuration Settings
+CONFIG = {
+    # Retries after the first attempt for 429/5xx responses
+    'MAX_RETRIES': int(os.getenv("LLM_MAX_RETRIES", "3")),
+    'BACKOFF_BASE_SECONDS': float(os.getenv("LLM_BACKOFF_BASE_SECONDS", "0.5")),
+    # Upper bound for any single wait, including a provider's Retry-After
+    'BACKOFF_MAX_SECONDS': float(os.getenv("LLM_BACKOFF_MAX_SECONDS", "30")),
+
+    # Hedging: duplicate a call once it runs longer than this latency percentile
+    'HEDGE_ENABLED': os.getenv("LLM_HEDGE_ENABLED", "true").lower() == "true",
+    'HEDGE_PERCENTILE': 0.95,
+    # Successful calls per model needed before the percentile is trusted
+    'HEDGE_MIN_SAMPLES': 20,
+    # Hedge delay before enough samples exist (0 disables hedging until then)
+    'HEDGE_INITIAL_DELAY_SECONDS': float(os.getenv("LLM_HEDGE_INITIAL_DELAY", "20")),
+    'HEDGE_MIN_DELAY_SECONDS': 1.0,
+    # At most this share of recent calls may be hedged (bounds the extra load)
+    'HEDGE_MAX_RATIO': float(os.getenv("LLM_HEDGE_MAX_RATIO", "0.1")),
+    # Recent latencies / hedge decisions kept per model
+    'LATENCY_WINDOW': 200,
+
+    # Client-side per-model budgets ("qwen-plus-latest=600,qwen-max-latest=60"); 0 = unlimited
+    'DEFAULT_RPM': int(os.getenv("LLM_DEFAULT_RPM", "0")),
+    'DEFAULT_TPM': int(os.getenv("LLM_DEFAULT_TPM", "0")),
+    'RPM_LIMITS': os.getenv("LLM_RPM_LIMITS", ""),
+    'TPM_LIMITS': os.getenv("LLM_TPM_LIMITS", ""),
+    'BUDGET_WINDOW_SECONDS': 60.0,
+    # Completion tokens reserved per call until the response reports actual usage
+    'OUTPUT_TOKEN_RESERVE': int(os.getenv("LLM_OUTPUT_TOKEN_RESERVE", "1000")),
+}
+
+
+def _status_code(exc: BaseException) -> Optional[int]:
+    status = getattr(exc, "status_code", None)
+    if status is None:
+        status = getattr(getattr(exc, "response", None), "status_code", None)
+    return status if isinstance(status, int) else None
+
+
+def is_retryable(exc: BaseException) -> bool:
+    """Return True for provider errors worth retrying (429 and 5xx)."""
+    status = _status_code(exc)
+    return status is not None and (status == 429 or 500 <= status < 600)
+
+
+def retry_after_seconds(exc: BaseException) -> Optional[float]:
+    """
+    Read the provider's requested wait from an error's response headers
+
+    Args:
+        exc: Provider error (openai.APIStatusError or anything with ``.response.headers``)
+
+    Returns:
+        float: seconds to wait, or None when the response carries no usable hint
+    """
+    headers = getattr(getattr(exc, "response", None), "headers", None)
+    if not headers:
+        return None
+    value = headers.get("retry-after-ms")
+    if value is not None:
+        try:
+            return max(0.0, float(value) / 1000)
+        except ValueError:
+            pass
+    value = headers.get("retry-after")
+    if value is None:
+        return None
+    try:
+        return max(0.0, float(value))
+    except ValueError:
+        pass
+    try:
+        return max(0.0, parsedate_to_datetime(value).timestamp() - time.time())
+    except (TypeError, ValueError):
+        return None
+
+
+def estimate_call_tokens(messages: Sequence[BaseMessage]) -> int:
+    """Approximate tokens a call will consume: the prompt plus the output reserve."""
+    return count_tokens_approximately(list(messages)) + CONFIG['OUTPUT_TOKEN_RESERVE']
+
+
+def tokens_used(result: Any) -> Optional[int]:
+    """Total tokens reported by a ChatResult or ChatGenerationChunk, if any."""
+    generations = getattr(result, "generations", None)
+    message = generations[0].message if generations else getattr(result, "message", None)
+    usage = getattr(message, "usage_metadata", None)
+    return usage.get("total_tokens") if usage else None
+
+
+class RateBudget:
+    """Sliding-window request and token budget for one model (one event loop)."""
+
+    def __init__(self, rpm: int = 0, tpm: int = 0, window: float = CONFIG['BUDGET_WINDOW_SECONDS']):
+        self.rpm = max(0, int(rpm))
+        self.tpm = max(0, int(tpm))
+        self.window = window
+        self._entries: deque = deque()  # [timestamp, tokens], mutable so reservations can be settled
+        self._tokens = 0
+
+    def _prune(self, now: float) -> None:
+        while self._entries and self._entries[0][0] <= now - self.window:
+            self._tokens -= self._entries.popleft()[1]
+
+    def wait_time(self, tokens: int) -> float:
+        """Seconds until a call of ``tokens`` fits in the window (0 when it fits now)."""
+        now = time.monotonic()
+        self._prune(now)
+        waits = [0.0]
+        if self.rpm and len(self._entries) >= self.rpm:
+            waits.append(self._entries[len(self._entries) - self.rpm][0] + self.window - now)
+        # A single call larger than the whole budget only needs an empty window
+        tokens = min(tokens, self.tpm)
+        if self.tpm and self._tokens + tokens > self.tpm:
+            excess = self._tokens + tokens - self.tpm
+            for stamp, used in self._entries:
+                excess -= used
+                if excess <= 0:
+                    waits.append(stamp + self.window - now)
+                    break
+        return max(waits)
+
+    def try_reserve(self, tokens: int) -> Optional[List]:
+        """Record a call if it fits now; return its entry or None."""
+        if self.wait_time(tokens) > 0:
+            return None
+        entry = [time.monotonic(), tokens]
+        self._entries.append(entry)
+        self._tokens += tokens
+        return entry
+
+    async def reserve(self, tokens: int) -> List:
+        """Wait until a call of ``tokens`` fits, then record it and return its entry."""
+        while True:
+            entry = self.try_reserve(tokens)
+            if entry is not None:
+                return entry
+            await asyncio.sleep(max(self.wait_time(tokens), 0.01))
+
+    def settle(self, entry: List, tokens: int) -> None:
+        """Replace a reservation's estimate with the tokens actually used."""
+        if any(e is entry for e in self._entries):
+            self._tokens += tokens - entry[1]
+        entry[1] = tokens
+
+    def usage(self) -> Dict[str, int]:
+        self._prune(time.monotonic())
+        return {"requests": len(self._entries), "tokens": self._tokens, "rpm": self.rpm, "tpm": self.tpm}
+
+
+class LLMCallPolicy:
+    """Applies the rate budget, retries and hedging to model calls, per model name."""
+
+    def __init__(
+        self,
+        max_retries: int = CONFIG['MAX_RETRIES'],
+        hedge_enabled: bool = CONFIG['HEDGE_ENABLED'],
+        rpm_limits: Optional[Dict[str, int]] = None,
+        tpm_limits: Optional[Dict[str, int]] = None,
+    ):
+        self.max_retries = max(0, int(max_retries))
+        self.hedge_enabled = hedge_enabled
+        self.rpm_limits = dict(rpm_limits if rpm_limits is not None else parse_model_limits(CONFIG['RPM_LIMITS'], "RPM"))
+        self.tpm_limits = dict(tpm_limits if tpm_limits is not None else parse_model_limits(CONFIG['TPM_LIMITS'], "TPM"))
+        self.reset()
+
+    def reset(self) -> None:
+        """Drop budgets, latency history and counters."""
+        self._budgets: Dict[str, RateBudget] = {}
+        self._latencies: Dict[str, deque] = defaultdict(lambda: deque(maxlen=CONFIG['LATENCY_WINDOW']))
+        self._hedge_history: Dict[str, deque] = defaultdict(lambda: deque(maxlen=CONFIG['LATENCY_WINDOW']))
+        self._stats: Dict[str, Dict[str, float]] = defaultdict(lambda: defaultdict(float))
+
+    def budget(self, model: str) -> RateBudget:
+        """Get the RPM/TPM budget for a model."""
+        budget = self._budgets.get(model)
+        if budget is None:
+            budget = RateBudget(
+                self.rpm_limits.get(model, CONFIG['DEFAULT_RPM']),
+                self.tpm_limits.get(model, CONFIG['DEFAULT_TPM']),
+            )
+            self._budgets[model] = budget
+        return budget
+
+    def hedge_delay(self, model: str) -> Optional[float]:
+        """Seconds after which a call to ``model`` is hedged, or None when hedging is off."""
+        if not self.hedge_enabled:
+            return None
+        samples = self._latencies[model]
+        if len(samples) < CONFIG['HEDGE_MIN_SAMPLES']:
+            delay = CONFIG['HEDGE_INITIAL_DELAY_SECONDS']
+            return delay if delay > 0 else None
+        ordered = sorted(samples)
+        index = min(len(ordered) - 1, int(CONFIG['HEDGE_PERCENTILE'] * len(ordered)))
+        return max(CONFIG['HEDGE_MIN_DELAY_SECONDS'], ordered[index])
+
+    def backoff_delay(self, retry: int, exc: BaseException) -> float:
+        """Wait before retry number ``retry``: the provider's Retry-After, else jittered exponential backoff."""
+        requested = retry_after_seconds(exc)
+        if requested is not None:
+            return min(requested, CONFIG['BACKOFF_MAX_SECONDS'])
+        return random.uniform(0, min(CONFIG['BACKOFF_MAX_SECONDS'], CONFIG['BACKOFF_BASE_SECONDS'] * 2 ** retry))
+
+    async def _reserve(self, model: str, tokens: int) -> List:
+        started = time.perf_counter()
+        entry = await self.budget(model).reserve(tokens)
+        waited = time.perf_counter() - started
+        if waited > 0.001:
+            self._stats[model]["budget_waits"] += 1
+            self._stats[model]["budget_wait_seconds"] += waited
+        return entry
+
+    def _retry_or_raise(self, model: str, retry: int, exc: BaseException) -> float:
+        """Return the backoff before the next attempt, or re-raise ``exc`` when it should not be retried."""
+        if retry >= self.max_retries or not is_retryable(exc):
+            self._stats[model]["failures"] += 1
+            raise exc
+        if _status_code(exc) == 429:
+            self._stats[model]["rate_limited"] += 1
+        self._stats[model]["retries"] += 1
+        delay = self.backoff_delay(retry, exc)
+        logger.warning(f"LLM call to {model} failed ({_status_code(exc)}); retry {retry + 1} in {delay:.2f}s")
+        return delay
+
+    async def call(self, model: str, attempt: Callable[[], Awaitable[Any]], tokens: int) -> Any:
+        """
+        Run a model call under the budget, with retries and hedging
+
+        Args:
+            model: Model name (budgets and latency history are per model)
+            attempt: Coroutine function performing one request
+            tokens: Estimated tokens for the call (see estimate_call_tokens)
+
+        Returns:
+            Any: the first successful attempt's result
+        """
+        self._stats[model]["calls"] += 1
+        budget = self.budget(model)
+        retry = 0
+        while True:
+            entry = await self._reserve(model, tokens)
+            try:
+                result = await self._hedged(model, attempt, tokens)
+            except Exception as exc:
+                budget.settle(entry, 0)
+                delay = self._retry_or_raise(model, retry, exc)
+                retry += 1
+                await asyncio.sleep(delay)
+                continue
+            budget.settle(entry, tokens_used(result) or tokens)
+            return result
+
+    async def stream(self, model: str, open_stream: Callable[[], AsyncIterator[Any]], tokens: int) -> AsyncIterator[Any]:
+        """
+        Stream a model call under the budget, retrying only until the first chunk arrives
+
+        Args:
+            model: Model name
+            open_stream: Function returning a fresh chunk iterator per attempt
+            tokens: Estimated tokens for the call
+
+        Yields:
+            Any: chunks of the successful attempt
+        """
+        self._stats[model]["calls"] += 1
+        budget = self.budget(model)
+        retry = 0
+        while True:
+            entry = await self._reserve(model, tokens)
+            emitted = False
+            used = None
+            try:
+                async for chunk in open_stream():
+                    emitted = True
+                    used = tokens_used(chunk) or used
+                    yield chunk
+            except Exception as exc:
+                budget.settle(entry, used or 0)
+                if emitted:
+                    self._stats[model]["failures"] += 1
+                    raise
+                delay = self._retry_or_raise(model, retry, exc)
+                retry += 1
+                await asyncio.sleep(delay)
+                continue
+            budget.settle(entry, used or tokens)
+            return
+
+    def call_sync(self, model: str, attempt: Callable[[], Any]) -> Any:
+        """Blocking variant of call: retries with backoff only (no budget or hedging)."""
+        self._stats[model]["calls"] += 1
+        retry = 0
+        while True:
+            try:
+                return attempt()
+            except Exception as exc:
+                delay = self._retry_or_raise(model, retry, exc)
+                retry += 1
+                time.sleep(delay)
+
+    async def _timed(self, model: str, attempt: Callable[[], Awaitable[Any]]) -> Any:
+        started = time.perf_counter()
+        result = await attempt()
+        self._latencies[model].append(time.perf_counter() - started)
+        return result
+
+    def _may_hedge(self, model: str) -> bool:
+        history = self._hedge_history[model]
+        return sum(history) < CONFIG['HEDGE_MAX_RATIO'] * max(len(history), 1) + 1
+
+    async def _hedged(self, model: str, attempt: Callable[[], Awaitable[Any]], tokens: int) -> Any:
+        primary = asyncio.ensure_future(self._timed(model, attempt))
+        backup: Optional[asyncio.Future] = None
+        try:
+            delay = self.hedge_delay(model)
+            if delay is not None:
+                await asyncio.wait({primary}, timeout=delay)
+            # The duplicate must fit the budget without waiting and stay within the hedge ratio
+            hedge = (
+                not primary.done()
+                and delay is not None
+                and self._may_hedge(model)
+                and self.budget(model).try_reserve(tokens) is not None
+            )
+            self._hedge_history[model].append(hedge)
+            if not hedge:
+                return await primary
+
+            self._stats[model]["hedged"] += 1
+            logger.info(f"Hedging LLM call to {model} after {delay:.2f}s")
+            backup = asyncio.ensure_future(self._timed(model, attempt))
+            pending = {primary, backup}
+            errors = []
+            while pending:
+                done, pending = await asyncio.wait(pending, return_when=asyncio.FIRST_COMPLETED)
+                for task in done:
+                    if task.exception() is None:
+                        if task is backup:
+                            self._stats[model]["hedge_wins"] += 1
+                        return task.result()
+                    errors.append(task.exception())
+            raise errors[0]
+        finally:
+            for task in (primary, backup):
+                if task is not None and not task.done():
+                    task.cancel()
+
+    def stats(self) -> Dict[str, Any]:
+        """Return per-model call, retry, hedge and budget counters plus the current hedge delay."""
+        models = sorted(set(self._stats) | set(self._budgets))
+        report = {}
+        for model in models:
+            counters = {name: round(value, 3) if isinstance(value, float) and not value.is_integer() else int(value)
+                        for name, value in self._stats[model].items()}
+            delay = self.hedge_delay(model)
+            report[model] = {
+                **counters,
+                "hedge_delay_seconds": round(delay, 3) if delay is not None else None,
+                "budget": self.budget(model).usage(),
+            }
+        return report
+
+
+# Global call policy shared by every pooled model
+llm_call_policy = LLMCallPolicy()
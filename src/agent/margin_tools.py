@@ -8,14 +8,26 @@ Contains tools for:
 - Position move recommendations
 """
 
+import os
 import json
+import time
 import logging
-from typing import Dict, Any, List
+import threading
+from concurrent.futures import ThreadPoolExecutor
+from contextvars import copy_context
+from functools import partial
+from typing import Dict, Any, List, Optional
 from datetime import datetime
-from langchain_core.tools import tool
+from langchain_core.tools import StructuredTool
+from langchain_core.runnables import RunnableConfig
+from langchain_core.runnables.config import run_in_executor
 import uuid
 
 from .data_gateway import EigenFlowAPI, LP_MAPPING, LP_NAME_TO_ID
+from .prefetch import snapshot_prefetcher
+from .run_guard import guard_from_config
+from .cache import snapshot_cache
+from .deadline import RunDeadline, deadline_context, deadline_from_config
 
 logger = logging.getLogger(__name__)
 
@@ -49,15 +61,164 @@ CONFIG = {
     # Schema and formatting
     'SCHEMA_VERSION': 'dc/v1-lean',
     'MONEY_PRECISION': 2,
-    'PRICE_PRECISION': 5
+    'PRICE_PRECISION': 5,
+    
+    # Worker threads for blocking gateway calls and analysis (keeps the event loop free)
+    'TOOL_MAX_WORKERS': int(os.getenv("MARGIN_TOOL_MAX_WORKERS", "4")),
 }
 
-# Global API client instance
-api_client = EigenFlowAPI()
+# Global API client instance (created on first use; safe to share between threads)
+_api_client = None
+_api_client_lock = threading.Lock()
+
+# Bounded executor for the async tool path
+_tool_executor = ThreadPoolExecutor(max_workers=CONFIG['TOOL_MAX_WORKERS'], thread_name_prefix="margin-tool")
+
+
+def get_api_client() -> EigenFlowAPI:
+    """Return the shared EigenFlow API client, creating it on first use."""
+    global _api_client
+    if _api_client is None:
+        with _api_client_lock:
+            if _api_client is None:
+                _api_client = EigenFlowAPI()
+    return _api_client
+
+
+def fetch_lp_snapshot(lp_name: str = None, api_client: EigenFlowAPI = None) -> Dict[str, Any]:
+    """
+    Fetch the raw account and position snapshot for one LP or all LPs.
+    
+    Args:
+        lp_name: Optional LP name; None fetches every LP
+        api_client: Client to use (defaults to the shared client)
+    
+    Returns:
+        {"success": True, "lp_name", "accounts", "positions"} or {"success": False, "error"}
+    """
+    api_client = api_client or get_api_client()
+    
+    # Step 1: Authenticate
+    auth_result = api_client.authenticate()
+    if not auth_result["success"]:
+        return {"success": False, "error": f"❌ Authentication failed: {auth_result['error']}"}
+    
+    # Step 2: Determine LP ID if specific LP requested
+    lp_id = None
+    if lp_name:
+        lp_id = LP_NAME_TO_ID.get(lp_name)
+        if lp_id is None:
+            available_lps = list(LP_NAME_TO_ID.keys())
+            return {"success": False, "error": f"❌ Unknown LP name: {lp_name}. Available LPs: {available_lps}"}
+    
+    # Step 3: Get LP account data
+    account_result = api_client.get_lp_account(lp_id)
+    if not account_result["success"]:
+        return {"success": False, "error": f"❌ Failed to retrieve account data: {account_result['error']}"}
+    
+    # Step 4: Get LP positions (filter by same LP ID if specified)
+    position_result = api_client.get_lp_positions(lp_id)
+    if not position_result["success"]:
+        return {"success": False, "error": f"❌ Failed to retrieve position data: {position_result['error']}"}
+    
+    return {
+        "success": True,
+        "lp_name": lp_name,
+        "accounts": account_result["data"],
+        "positions": position_result["data"],
+    }
 
 
-@tool
-def get_lp_margin_check(lp_name: str = None) -> str:
+def fetch_lp_snapshot_within_deadline(
+    lp_name: str = None,
+    deadline: Optional[RunDeadline] = None,
+    stage: str = "get_lp_margin_check",
+) -> Dict[str, Any]:
+    """
+    Fetch an LP snapshot within the request deadline, remembering the last good one.
+    
+    Gateway requests are bounded by the time left. When too little is left
+    to fetch, or the fetch fails under a deadline, the last good snapshot for
+    the LP is returned instead and the degradation is recorded.
+    
+    Args:
+        lp_name: Optional LP name; None fetches every LP
+        deadline: The request's deadline (None: plain fetch)
+        stage: Node or tool name recorded with a degradation
+    
+    Returns:
+        Snapshot in the fetch_lp_snapshot format
+    """
+    cache_key = lp_name or "*"
+    if deadline is not None and not deadline.allows("gateway"):
+        cached = snapshot_cache.get(cache_key)
+        if cached is not None:
+            deadline.degrade("cached_snapshot", stage, lp=lp_name, age_seconds=round(time.time() - cached["fetched_at"], 1))
+            return cached
+    
+    with deadline_context(deadline):
+        snapshot = fetch_lp_snapshot(lp_name)
+    
+    if snapshot["success"]:
+        snapshot_cache.set(cache_key, {**snapshot, "fetched_at": time.time()})
+    elif deadline is not None:
+        cached = snapshot_cache.get(cache_key)
+        if cached is not None:
+            deadline.degrade(
+                "cached_snapshot", stage, lp=lp_name,
+                age_seconds=round(time.time() - cached["fetched_at"], 1), reason=snapshot["error"],
+            )
+            return cached
+    return snapshot
+
+
+async def afetch_lp_snapshot(lp_name: str = None, deadline: Optional[RunDeadline] = None) -> Dict[str, Any]:
+    """Fetch one LP snapshot on the bounded tool executor without blocking the event loop."""
+    return await run_in_executor(
+        _tool_executor,
+        partial(copy_context().run, fetch_lp_snapshot_within_deadline, lp_name, deadline, "lp_report_branch"),
+    )
+
+
+def fetch_lp_scope_snapshot(lp_names: List[str], api_client: EigenFlowAPI = None) -> Dict[str, Any]:
+    """
+    Fetch and merge snapshots for several LPs, one filtered gateway call pair per LP.
+    
+    Args:
+        lp_names: Canonical LP names
+        api_client: Client to use (defaults to the shared client)
+    
+    Returns:
+        Merged snapshot in the fetch_lp_snapshot format
+    """
+    accounts, positions = [], []
+    for lp_name in lp_names:
+        snapshot = fetch_lp_snapshot(lp_name, api_client)
+        if not snapshot["success"]:
+            return snapshot
+        accounts.extend(snapshot["accounts"] if isinstance(snapshot["accounts"], list) else [snapshot["accounts"]])
+        positions.extend(snapshot["positions"] if isinstance(snapshot["positions"], list) else [snapshot["positions"]])
+    return {"success": True, "lp_name": None, "accounts": accounts, "positions": positions}
+
+
+def restrict_snapshot_to_scope(snapshot: Dict[str, Any], lp_names: List[str]) -> Dict[str, Any]:
+    """Drop accounts and positions outside ``lp_names`` (guards against unfiltered gateway responses)."""
+    if not lp_names:
+        return snapshot
+    scope = set(lp_names)
+    
+    def keep(rows):
+        rows = rows if isinstance(rows, list) else [rows]
+        return [row for row in rows if isinstance(row, dict) and row.get("LP") in scope]
+    
+    accounts = keep(snapshot["accounts"])
+    if not accounts:
+        # Gateway labels do not match the mapping names; rely on its lp_id filter
+        return snapshot
+    return {**snapshot, "accounts": accounts, "positions": keep(snapshot["positions"])}
+
+
+def run_lp_margin_check(lp_name: str = None, config: RunnableConfig = None) -> str:
     """
     Get comprehensive LP margin and risk data from EigenFlow API.
     
@@ -74,42 +235,74 @@ def get_lp_margin_check(lp_name: str = None) -> str:
     Returns structured JSON containing accounts, balances, positions, risk indicators, and metadata.
     """
     try:
-        # Step 1: Authenticate
-        auth_result = api_client.authenticate()
-        if not auth_result["success"]:
-            return f"❌ Authentication failed: {auth_result['error']}"
+        configurable = (config or {}).get("configurable") or {}
+        
+        # The scope resolved from IntentContext / the alert payload is binding
+        lp_scope = list(configurable.get("lp_scope") or [])
+        if lp_scope:
+            scoped_lp = lp_scope[0] if len(lp_scope) == 1 else None
+            if lp_name != scoped_lp:
+                logger.info(f"Binding LP scope {lp_scope} overrides requested lp_name={lp_name!r}")
+            lp_name = scoped_lp
         
-        # Step 2: Determine LP ID if specific LP requested
-        lp_id = None
-        if lp_name:
-            lp_id = LP_NAME_TO_ID.get(lp_name)
-            if lp_id is None:
-                available_lps = list(LP_NAME_TO_ID.keys())
-                return f"❌ Unknown LP name: {lp_name}. Available LPs: {available_lps}"
+        # Within one supervisor run, repeated calls for the same scope reuse the first result
+        guard = guard_from_config(config)
+        cache_args = {"lp_name": lp_name, "lp_scope": lp_scope}
+        if guard is not None:
+            cached = guard.cached_result("get_lp_margin_check", cache_args)
+            if cached is not None:
+                return cached
+            if guard.over_tool_budget():
+                # Never answer new arguments with another scope's analysis
+                logger.warning(f"Tool call budget exhausted; not fetching margin data for lp_name={lp_name!r}")
+                return "Tool call budget exhausted: write the report from the margin data already fetched in this run."
         
-        # Step 3: Get LP account data
-        account_result = api_client.get_lp_account(lp_id)
-        if not account_result["success"]:
-            return f"❌ Failed to retrieve account data: {account_result['error']}"
+        # Use the snapshot prefetched during intent classification when it matches the scope
+        prefetch_key = configurable.get("prefetch_key")
+        deadline = deadline_from_config(config)
+        snapshot = None
+        if len(lp_scope) > 1:
+            with deadline_context(deadline):
+                snapshot = fetch_lp_scope_snapshot(lp_scope)
+        elif prefetch_key:
+            snapshot = snapshot_prefetcher.take(prefetch_key, lp_name)
+        if snapshot is None:
+            # Gateway calls are bounded by the request deadline (last good snapshot when out of time)
+            snapshot = fetch_lp_snapshot_within_deadline(lp_name, deadline)
         
-        # Step 4: Get LP positions (filter by same LP ID if specified)
-        position_result = api_client.get_lp_positions(lp_id)
-        if not position_result["success"]:
-            return f"❌ Failed to retrieve position data: {position_result['error']}"
+        if not snapshot["success"]:
+            return snapshot["error"]
         
-        # Step 4: Generate structured JSON data
-        account_data = account_result["data"]
-        position_data = position_result["data"]
+        # Analyse only the LPs in scope
+        snapshot = restrict_snapshot_to_scope(snapshot, lp_scope or ([lp_name] if lp_name else []))
         
         # Generate analysis and return MarginCheckToolResponse format
-        margin_response = generate_margin_analysis(account_data, position_data)
-        return json.dumps(margin_response, indent=2)
+        margin_response = generate_margin_analysis(snapshot["accounts"], snapshot["positions"])
+        result = json.dumps(margin_response, indent=2)
+        if guard is not None:
+            guard.store_result("get_lp_margin_check", cache_args, result)
+        return result
         
     except Exception as e:
         logger.error(f"LP margin report generation failed: {e}")
         return f"❌ Report generation failed: {str(e)}"
 
 
+async def arun_lp_margin_check(lp_name: str = None, config: RunnableConfig = None) -> str:
+    """Run the margin check on the bounded tool executor without blocking the event loop."""
+    return await run_in_executor(
+        _tool_executor, partial(copy_context().run, run_lp_margin_check, lp_name, config)
+    )
+
+
+# Sync callers run the pipeline inline; graph (async) callers go through the bounded executor
+get_lp_margin_check = StructuredTool.from_function(
+    func=run_lp_margin_check,
+    coroutine=arun_lp_margin_check,
+    name="get_lp_margin_check",
+)
+
+
 def lp_margin_check_report(lp_account_info: List[Dict[str, Any]]) -> List[Dict[str, Any]]:
     """
     Check LP margin utilization and generate alerts for accounts >= 80% usage.
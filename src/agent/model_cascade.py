@@ -0,0 +1,215 @@
+"""
+Confidence-driven model cascade.
+
+A small, fast model answers first; the call escalates to a larger model only
+when the small model's answer is not usable:
+- Structured output (intent classification): confidence below the threshold,
+  or the output could not be parsed
+- Tool-calling (supervisor routing): malformed or unknown tool calls, or an
+  empty response
+
+Contains:
+- invoke_structured_with_escalation for structured-output calls
+- CascadeChatModel, a chat model that can be handed to create_supervisor
+- CascadeStats tracking escalation rates per stage
+"""
+
+import logging
+import threading
+from collections import defaultdict
+from typing import Any, Dict, List, Optional, Sequence
+
+from langchain_core.language_models.chat_models import BaseChatModel
+from langchain_core.messages import AIMessage, BaseMessage
+from langchain_core.messages.ai import add_usage
+from langchain_core.outputs import ChatGeneration, ChatResult
+from langchain_core.utils.function_calling import convert_to_openai_tool
+from pydantic import Field
+
+logger = logging.getLogger(__name__)
+
+# Configuration Settings
+CONFIG = {
+    # Escalate when the small model's confidence is below this value
+    'DEFAULT_ESCALATION_CONFIDENCE': 0.7,
+}
+
+# Inner tier calls run without callbacks: the cascade's own LLM run reports
+# them once (callbacks such as RunMetricsCallback would otherwise count twice)
+_INNER_CALL_CONFIG = {"callbacks": []}
+
+
+class CascadeStats:
+    """Thread-safe per-stage counters of cascade calls and escalations."""
+
+    def __init__(self):
+        self._lock = threading.Lock()
+        self._calls: Dict[str, int] = defaultdict(int)
+        self._escalations: Dict[str, Dict[str, int]] = defaultdict(lambda: defaultdict(int))
+
+    def record(self, stage: str, reason: Optional[str]) -> None:
+        """
+        Record one cascade call
+
+        Args:
+            stage: Pipeline stage (e.g. classify_intent, supervisor)
+            reason: Escalation reason, or None when the small model's answer was used
+        """
+        with self._lock:
+            self._calls[stage] += 1
+            if reason:
+                self._escalations[stage][reason] += 1
+
+    def stats(self) -> Dict[str, Any]:
+        """Return calls, escalations by reason and escalation rate per stage."""
+        with self._lock:
+            result = {}
+            for stage, calls in self._calls.items():
+                reasons = dict(self._escalations.get(stage, {}))
+                escalations = sum(reasons.values())
+                result[stage] = {
+                    "calls": calls,
+                    "escalations": escalations,
+                    "reasons": reasons,
+                    "escalation_rate": round(escalations / calls, 4) if calls else 0.0,
+                }
+            return result
+
+    def reset(self) -> None:
+        """Clear all counters."""
+        with self._lock:
+            self._calls.clear()
+            self._escalations.clear()
+
+
+# Global cascade statistics
+cascade_stats = CascadeStats()
+
+
+async def invoke_structured_with_escalation(
+    small_model: Any,
+    large_model: Any,
+    schema: Any,
+    messages: List[BaseMessage],
+    min_confidence: float = CONFIG['DEFAULT_ESCALATION_CONFIDENCE'],
+    stage: str = "classify_intent",
+) -> Any:
+    """
+    Run a structured-output call on the small model, escalating when needed
+
+    Args:
+        small_model: Fast chat model tried first
+        large_model: Chat model used on escalation (None or the same model disables escalation)
+        schema: Pydantic schema with a ``confidence`` field
+        messages: Prompt messages
+        min_confidence: Results below this confidence are escalated
+        stage: Stage name used for escalation statistics
+
+    Returns:
+        Parsed schema instance from whichever tier answered
+    """
+    if large_model is None or large_model is small_model:
+        return await small_model.with_structured_output(schema).ainvoke(messages)
+
+    try:
+        result = await small_model.with_structured_output(schema).ainvoke(messages)
+        if result is None:
+            reason = "parse_error"
+        elif getattr(result, "confidence", 1.0) < min_confidence:
+            reason = "low_confidence"
+        else:
+            reason = None
+    except Exception as e:
+        logger.warning(f"{stage}: small model output unusable, escalating: {e}")
+        reason = "parse_error"
+
+    cascade_stats.record(stage, reason)
+    if reason is None:
+        return result
+    return await large_model.with_structured_output(schema).ainvoke(messages)
+
+
+def escalation_reason(message: AIMessage, tool_names: Sequence[str]) -> Optional[str]:
+    """Return why a tool-calling response should be escalated, or None if it is usable."""
+    if getattr(message, "invalid_tool_calls", None):
+        return "parse_error"
+    if tool_names and any(call["name"] not in tool_names for call in message.tool_calls):
+        return "unknown_tool"
+    if not message.tool_calls and not message.content:
+        return "empty_response"
+    return None
+
+
+class CascadeChatModel(BaseChatModel):
+    """Chat model that answers with ``primary`` and falls back to ``fallback`` when the answer is unusable."""
+
+    primary: Any
+    fallback: Any
+    stage: str = "supervisor"
+    bound_tools: List[Any] = Field(default_factory=list)
+    bind_kwargs: Dict[str, Any] = Field(default_factory=dict)
+
+    @property
+    def _llm_type(self) -> str:
+        return "cascade"
+
+    @property
+    def model_name(self) -> Optional[str]:
+        return getattr(self.primary, "model_name", None)
+
+    def bind_tools(self, tools: Sequence[Any], *, tool_choice: Any = None, parallel_tool_calls: Optional[bool] = None, **kwargs: Any) -> "CascadeChatModel":
+        """Bind tools to both tiers (binding is re-applied from the raw models, so it is idempotent).
+
+        A rebind that omits options keeps the earlier ones: create_supervisor binds with
+        ``parallel_tool_calls=False`` and create_react_agent then rebinds the same tools without it.
+        """
+        bind_kwargs = {**self.bind_kwargs, **kwargs}
+        if tool_choice is not None:
+            bind_kwargs["tool_choice"] = tool_choice
+        if parallel_tool_calls is not None:
+            bind_kwargs["parallel_tool_calls"] = parallel_tool_calls
+        return self.model_copy(update={"bound_tools": list(tools), "bind_kwargs": bind_kwargs})
+
+    def _tier(self, model: Any) -> Any:
+        return model.bind_tools(self.bound_tools, **self.bind_kwargs) if self.bound_tools else model
+
+    def _tool_names(self) -> List[str]:
+        return [convert_to_openai_tool(tool)["function"]["name"] for tool in self.bound_tools]
+
+    def _result(self, message: AIMessage, reason: Optional[str], discarded: Optional[AIMessage] = None) -> ChatResult:
+        if discarded is not None and discarded.usage_metadata:
+            # The escalated call's usage includes the small model's discarded attempt
+            message.usage_metadata = add_usage(discarded.usage_metadata, message.usage_metadata)
+        message.response_metadata = {
+            **(message.response_metadata or {}),
+            "cascade": {"stage": self.stage, "escalated": reason is not None, "reason": reason},
+        }
+        return ChatResult(generations=[ChatGeneration(message=message)])
+
+    def _generate(self, messages, stop=None, run_manager=None, **kwargs) -> ChatResult:
+        message = None
+        try:
+            message = self._tier(self.primary).invoke(messages, _INNER_CALL_CONFIG, stop=stop, **kwargs)
+            reason = escalation_reason(message, self._tool_names())
+        except Exception as e:
+            logger.warning(f"{self.stage}: small model call failed, escalating: {e}")
+            reason = "error"
+        cascade_stats.record(self.stage, reason)
+        if reason is None:
+            return self._result(message, reason)
+        escalated = self._tier(self.fallback).invoke(messages, _INNER_CALL_CONFIG, stop=stop, **kwargs)
+        return self._result(escalated, reason, discarded=message)
+
+    async def _agenerate(self, messages, stop=None, run_manager=None, **kwargs) -> ChatResult:
+        message = None
+        try:
+            message = await self._tier(self.primary).ainvoke(messages, _INNER_CALL_CONFIG, stop=stop, **kwargs)
+            reason = escalation_reason(message, self._tool_names())
+        except Exception as e:
+            logger.warning(f"{self.stage}: small model call failed, escalating: {e}")
+            reason = "error"
+        cascade_stats.record(self.stage, reason)
+        if reason is None:
+            return self._result(message, reason)
+        escalated = await self._tier(self.fallback).ainvoke(messages, _INNER_CALL_CONFIG, stop=stop, **kwargs)
+        return self._result(escalated, reason, discarded=message)
@@ -0,0 +1,331 @@
+"""
+Offline, deterministic chat model for load tests and benchmarks.
+
+Selected with ``LLM_BACKEND=offline``: ModelRegistry.get_model then returns
+OfflineChatModel instances instead of DashScope clients, so classify_intent,
+the supervisor and ai_responder run without any network access and graph
+orchestration, checkpointing and SSE overhead can be measured in isolation.
+
+Responses come from, in order:
+- A recorded script (``OFFLINE_LLM_SCRIPT``, JSON) replayed per key in order:
+  the structured-output schema name, a bound tool name, or "text", e.g.
+  {"IntentClassification": [{"structured": {...}}],
+   "get_lp_margin_check": [{"tool_calls": [{"name": "...", "args": {}}]}],
+   "text": [{"content": "..."}]}
+- Otherwise a built-in policy that mirrors the real pipeline: keyword intent
+  classification, supervisor routing (margin tool -> ai_responder -> forward)
+  and template reports rendered from the tool output
+
+Latency is drawn from configurable distributions (time to first token plus
+per-token delay) with a fixed seed; text responses stream token by token.
+"""
+
+import os
+import re
+import json
+import time
+import random
+import asyncio
+import itertools
+import logging
+import threading
+from functools import lru_cache
+from typing import Any, AsyncIterator, Callable, Dict, Iterator, List, Optional, Sequence
+
+from langchain_core.language_models.chat_models import BaseChatModel
+from langchain_core.messages import AIMessage, AIMessageChunk, BaseMessage, HumanMessage, ToolMessage
+from langchain_core.messages.utils import count_tokens_approximately
+from langchain_core.outputs import ChatGeneration, ChatGenerationChunk, ChatResult
+from langchain_core.runnables import RunnableLambda
+from langchain_core.utils.function_calling import convert_to_openai_tool
+from pydantic import Field, PrivateAttr
+
+logger = logging.getLogger(__name__)
+
+# Configuration Settings
+CONFIG = {
+    # Time to first token and per streamed token: "fixed:s", "uniform:a,b", "normal:mu,sigma",
+    # "lognormal:mu,sigma" (of ln seconds) or "exp:mean"
+    'LATENCY': os.getenv("OFFLINE_LLM_LATENCY", "fixed:0"),
+    'TOKEN_LATENCY': os.getenv("OFFLINE_LLM_TOKEN_LATENCY", "fixed:0"),
+    'SCRIPT_PATH': os.getenv("OFFLINE_LLM_SCRIPT", ""),
+    'SEED': int(os.getenv("OFFLINE_LLM_SEED", "0")),
+    # Tool names the built-in supervisor policy routes through
+    'MARGIN_TOOL': "get_lp_margin_check",
+    'REPORT_AGENT': "ai_responder",
+}
+
+_TOKEN_RE = re.compile(r"\S+\s*|\s+")
+
+
+@lru_cache(maxsize=32)
+def parse_latency(spec: str) -> Callable[[random.Random], float]:
+    """
+    Parse a latency distribution spec
+
+    Args:
+        spec: "fixed:0.2", "uniform:0.1,0.5", "normal:0.3,0.05", "lognormal:-1.2,0.4" or "exp:0.3"
+
+    Returns:
+        Sampler taking a Random instance and returning seconds (never negative)
+    """
+    kind, _, params = (spec or "fixed:0").partition(":")
+    values = [float(v) for v in params.split(",") if v.strip()] or [0.0]
+    kind = kind.strip().lower()
+    if kind == "fixed":
+        return lambda rng: max(0.0, values[0])
+    if kind == "uniform":
+        low, high = values[0], values[1] if len(values) > 1 else values[0]
+        return lambda rng: max(0.0, rng.uniform(low, high))
+    if kind == "normal":
+        mu, sigma = values[0], values[1] if len(values) > 1 else 0.0
+        return lambda rng: max(0.0, rng.gauss(mu, sigma))
+    if kind == "lognormal":
+        mu, sigma = values[0], values[1] if len(values) > 1 else 0.0
+        return lambda rng: rng.lognormvariate(mu, sigma)
+    if kind == "exp":
+        return lambda rng: rng.expovariate(1.0 / values[0]) if values[0] > 0 else 0.0
+    raise ValueError(f"Unknown latency distribution: {spec!r}")
+
+
+def load_script(path: str) -> Dict[str, List[Dict[str, Any]]]:
+    """Load a recorded response script (empty when no path is configured)."""
+    if not path:
+        return {}
+    with open(path, encoding="utf-8") as f:
+        script = json.load(f)
+    if not isinstance(script, dict):
+        raise ValueError(f"Offline LLM script {path} must map keys to response lists")
+    return script
+
+
+def _text(message: BaseMessage) -> str:
+    content = message.content
+    if isinstance(content, list):
+        return "".join(part.get("text", "") for part in content if isinstance(part, dict))
+    return str(content)
+
+
+def _current_turn(messages: Sequence[BaseMessage]) -> List[BaseMessage]:
+    """Messages after the latest HumanMessage."""
+    for index in range(len(messages) - 1, -1, -1):
+        if isinstance(messages[index], HumanMessage):
+            return list(messages[index + 1:])
+    return list(messages)
+
+
+def _latest_user_text(messages: Sequence[BaseMessage]) -> str:
+    for message in reversed(messages):
+        if isinstance(message, HumanMessage):
+            text = _text(message)
+            return text[len("User input: "):] if text.startswith("User input: ") else text
+    return ""
+
+
+def classify_intent_offline(messages: Sequence[BaseMessage]) -> Dict[str, Any]:
+    """Keyword intent classification standing in for the LLM classifier."""
+    from src.agent.intent_router import intent_router
+
+    text = _latest_user_text(messages)
+    lps = intent_router.match_lps(text)
+    if lps or re.search(r"margin|保证金|风险|risk|position|持仓|report|报告", text, re.IGNORECASE):
+        return {
+            "intent": "lp_margin_check_report",
+            "confidence": 0.95,
+            "slots": {"currentLevel": "lp", "lp": lps[0] if len(lps) == 1 else None},
+        }
+    return {"intent": "general_conversation", "confidence": 0.9, "slots": {"currentLevel": "lp"}}
+
+
+# Built-in structured-output policies by schema name
+STRUCTURED_POLICIES: Dict[str, Callable[[Sequence[BaseMessage]], Dict[str, Any]]] = {
+    "IntentClassification": classify_intent_offline,
+}
+
+
+class OfflineChatModel(BaseChatModel):
+    """Deterministic, network-free chat model with scripted responses and simulated latency."""
+
+    model_name: str = "offline"
+    script: Dict[str, List[Dict[str, Any]]] = Field(default_factory=dict)
+    latency: str = CONFIG['LATENCY']
+    token_latency: str = CONFIG['TOKEN_LATENCY']
+    seed: int = CONFIG['SEED']
+    bound_tools: List[str] = Field(default_factory=list)
+
+    _rng: random.Random = PrivateAttr()
+    _lock: Any = PrivateAttr()
+    _positions: Dict[str, int] = PrivateAttr()
+    _call_ids: Iterator[int] = PrivateAttr()
+
+    def model_post_init(self, __context: Any) -> None:
+        super().model_post_init(__context)
+        self._rng = random.Random(self.seed)
+        self._lock = threading.Lock()
+        self._positions = {}
+        self._call_ids = itertools.count(1)
+
+    @property
+    def _llm_type(self) -> str:
+        return "offline"
+
+    # Binding
+
+    def bind_tools(self, tools: Sequence[Any], **kwargs: Any) -> "OfflineChatModel":
+        """Record the bound tool names; the copy shares the script position, RNG and call ids."""
+        bound = self.model_copy(update={"bound_tools": [convert_to_openai_tool(t)["function"]["name"] for t in tools]})
+        bound._rng, bound._lock, bound._positions, bound._call_ids = self._rng, self._lock, self._positions, self._call_ids
+        return bound
+
+    def with_structured_output(self, schema: Any, **kwargs: Any):
+        """Return a runnable producing ``schema`` instances from the script or the built-in policy."""
+
+        def build(messages) -> Any:
+            messages = self._coerce(messages)
+            data = self._scripted(schema.__name__, "structured")
+            if data is None:
+                policy = STRUCTURED_POLICIES.get(schema.__name__)
+                data = policy(messages) if policy else {}
+            return schema(**data) if isinstance(data, dict) else data
+
+        def invoke(messages):
+            time.sleep(self._sample(self.latency))
+            return build(messages)
+
+        async def ainvoke(messages):
+            await asyncio.sleep(self._sample(self.latency))
+            return build(messages)
+
+        return RunnableLambda(invoke, afunc=ainvoke, name=f"offline_structured_{schema.__name__}")
+
+    # Response selection
+
+    @staticmethod
+    def _coerce(messages) -> List[BaseMessage]:
+        if hasattr(messages, "to_messages"):
+            return messages.to_messages()
+        if isinstance(messages, str):
+            return [HumanMessage(content=messages)]
+        return list(messages)
+
+    def _sample(self, spec: str) -> float:
+        with self._lock:
+            return parse_latency(spec)(self._rng)
+
+    def _scripted(self, key: str, field: Optional[str] = None) -> Any:
+        """Return the next recorded response for ``key`` (cycling), or None."""
+        responses = self.script.get(key)
+        if not responses:
+            return None
+        with self._lock:
+            position = self._positions.get(key, 0)
+            self._positions[key] = position + 1
+        response = responses[position % len(responses)]
+        return response.get(field) if field else response
+
+    def _next_call_id(self) -> str:
+        with self._lock:
+            return f"call_offline_{next(self._call_ids)}"
+
+    def _tool_call(self, name: str, args: Optional[Dict[str, Any]] = None) -> Dict[str, Any]:
+        return {"name": name, "args": args or {}, "id": self._next_call_id(), "type": "tool_call"}
+
+    def _respond(self, messages: Sequence[BaseMessage]) -> AIMessage:
+        for key in [*self.bound_tools, "text"]:
+            recorded = self._scripted(key)
+            if recorded is not None:
+                return AIMessage(
+                    content=recorded.get("content", ""),
+                    tool_calls=[self._tool_call(c["name"], c.get("args")) for c in recorded.get("tool_calls", [])],
+                )
+        if CONFIG['MARGIN_TOOL'] in self.bound_tools:
+            return self._supervise(messages)
+        return AIMessage(content=self._write_report(messages))
+
+    def _supervise(self, messages: Sequence[BaseMessage]) -> AIMessage:
+        """Built-in supervisor policy: margin tool, then the report writer, then forward its report."""
+        turn = _current_turn(messages)
+        report_agent = CONFIG['REPORT_AGENT']
+        if any(isinstance(m, AIMessage) and m.name == report_agent and m.content for m in turn):
+            return AIMessage(content="", tool_calls=[self._tool_call("forward_message", {"from_agent": report_agent})])
+        if any(isinstance(m, ToolMessage) and m.name == CONFIG['MARGIN_TOOL'] for m in turn):
+            return AIMessage(content="", tool_calls=[self._tool_call(f"transfer_to_{report_agent}")])
+        if classify_intent_offline(messages)["intent"] == "lp_margin_check_report":
+            return AIMessage(content="", tool_calls=[self._tool_call(CONFIG['MARGIN_TOOL'])])
+        return AIMessage(content="", tool_calls=[self._tool_call(f"transfer_to_{report_agent}")])
+
+    def _write_report(self, messages: Sequence[BaseMessage]) -> str:
+        """Built-in writer policy: template report for margin data, otherwise an echo reply."""
+        from src.agent.report_templates import render_margin_report
+
+        for message in reversed(messages):
+            if isinstance(message, HumanMessage):
+                try:
+                    analysis = json.loads(_text(message))
+                except (json.JSONDecodeError, TypeError):
+                    break
+                if isinstance(analysis, dict) and "perLP" in analysis:
+                    return render_margin_report(analysis)
+                break
+        for message in reversed(_current_turn(messages)):
+            if isinstance(message, ToolMessage) and message.name == CONFIG['MARGIN_TOOL']:
+                try:
+                    return render_margin_report(json.loads(_text(message)))
+                except (json.JSONDecodeError, TypeError):
+                    return _text(message)
+        return f"[offline] {_latest_user_text(messages)[:200]}"
+
+    def _with_usage(self, message: AIMessage, messages: Sequence[BaseMessage]) -> AIMessage:
+        input_tokens = count_tokens_approximately(list(messages))
+        output_tokens = count_tokens_approximately([message])
+        message.usage_metadata = {
+            "input_tokens": input_tokens,
+            "output_tokens": output_tokens,
+            "total_tokens": input_tokens + output_tokens,
+        }
+        message.response_metadata = {"model_name": self.model_name, "backend": "offline"}
+        return message
+
+    # Generation
+
+    def _generate(self, messages, stop=None, run_manager=None, **kwargs) -> ChatResult:
+        message = self._with_usage(self._respond(messages), messages)
+        tokens = len(_TOKEN_RE.findall(_text(message)))
+        time.sleep(self._sample(self.latency) + sum(self._sample(self.token_latency) for _ in range(tokens)))
+        return ChatResult(generations=[ChatGeneration(message=message)])
+
+    async def _agenerate(self, messages, stop=None, run_manager=None, **kwargs) -> ChatResult:
+        message = self._with_usage(self._respond(messages), messages)
+        tokens = len(_TOKEN_RE.findall(_text(message)))
+        await asyncio.sleep(self._sample(self.latency) + sum(self._sample(self.token_latency) for _ in range(tokens)))
+        return ChatResult(generations=[ChatGeneration(message=message)])
+
+    async def _astream(self, messages, stop=None, run_manager=None, **kwargs) -> AsyncIterator[ChatGenerationChunk]:
+        message = self._with_usage(self._respond(messages), messages)
+        await asyncio.sleep(self._sample(self.latency))
+        for token in _TOKEN_RE.findall(_text(message)):
+            await asyncio.sleep(self._sample(self.token_latency))
+            chunk = ChatGenerationChunk(message=AIMessageChunk(content=token))
+            if run_manager:
+                await run_manager.on_llm_new_token(token, chunk=chunk)
+            yield chunk
+        yield ChatGenerationChunk(message=AIMessageChunk(
+            content="",
+            tool_call_chunks=[
+                {"name": call["name"], "args": json.dumps(call["args"]), "id": call["id"], "index": index}
+                for index, call in enumerate(message.tool_calls)
+            ],
+            usage_metadata=message.usage_metadata,
+            response_metadata=message.response_metadata,
+        ))
+
+
+def offline_chat_model(model: str) -> OfflineChatModel:
+    """Build the offline stand-in for ``model`` from the OFFLINE_LLM_* settings."""
+    return OfflineChatModel(
+        model_name=model,
+        script=load_script(CONFIG['SCRIPT_PATH']),
+        latency=CONFIG['LATENCY'],
+        token_latency=CONFIG['TOKEN_LATENCY'],
+        seed=CONFIG['SEED'],
+    )
@@ -0,0 +1,132 @@
+"""
+Speculative data prefetch for margin reports.
+
+The gateway fetch for the likely LP scope is started while the intent is
+still being classified. If the request turns out to be a margin report the
+tool takes the prefetched snapshot instead of fetching again; otherwise the
+prefetch is discarded.
+"""
+
+import os
+import time
+import uuid
+import logging
+import threading
+from concurrent.futures import Future, ThreadPoolExecutor, TimeoutError as FutureTimeoutError
+from typing import Any, Callable, Dict, Optional
+
+logger = logging.getLogger(__name__)
+
+# Configuration Settings
+CONFIG = {
+    # Worker threads for blocking gateway fetches
+    'MAX_WORKERS': int(os.getenv("PREFETCH_MAX_WORKERS", "4")),
+    # Prefetches not taken within this window are dropped (snapshot would be stale)
+    'MAX_AGE_SECONDS': float(os.getenv("PREFETCH_MAX_AGE_SECONDS", "60")),
+    # How long the tool waits for an in-flight prefetch before giving up
+    'TAKE_TIMEOUT_SECONDS': float(os.getenv("PREFETCH_TAKE_TIMEOUT_SECONDS", "45")),
+}
+
+
+class SnapshotPrefetcher:
+    """Tracks in-flight snapshot fetches keyed by a per-request prefetch key."""
+
+    def __init__(self, max_workers: int = CONFIG['MAX_WORKERS']):
+        self._executor = ThreadPoolExecutor(max_workers=max_workers, thread_name_prefix="snapshot-prefetch")
+        self._lock = threading.Lock()
+        self._pending: Dict[str, Dict[str, Any]] = {}
+        self._stats = {"started": 0, "used": 0, "scope_mismatch": 0, "discarded": 0, "expired": 0, "failed": 0}
+
+    def start(self, lp_name: Optional[str], fetch: Callable[[], Dict[str, Any]]) -> str:
+        """
+        Start fetching a snapshot in the background
+
+        Args:
+            lp_name: LP scope the snapshot is fetched for (None = all LPs)
+            fetch: Blocking callable returning the snapshot dict
+
+        Returns:
+            Prefetch key to hand to the tool via ``configurable.prefetch_key``
+        """
+        key = str(uuid.uuid4())
+        future = self._executor.submit(fetch)
+        with self._lock:
+            self._expire_locked()
+            self._pending[key] = {"lp_name": lp_name, "future": future, "started_at": time.monotonic()}
+            self._stats["started"] += 1
+        return key
+
+    def take(self, key: str, lp_name: Optional[str], timeout: float = CONFIG['TAKE_TIMEOUT_SECONDS']) -> Optional[Dict[str, Any]]:
+        """
+        Claim a prefetched snapshot if it matches the requested LP scope
+
+        Args:
+            key: Prefetch key returned by start()
+            lp_name: LP scope the caller needs
+            timeout: Seconds to wait for an in-flight fetch
+
+        Returns:
+            Snapshot dict, or None when missing, mismatched, expired or failed
+        """
+        with self._lock:
+            entry = self._pending.pop(key, None)
+            if entry is None:
+                return None
+            if (entry["lp_name"] or None) != (lp_name or None):
+                self._stats["scope_mismatch"] += 1
+                entry["future"].cancel()
+                return None
+
+        future: Future = entry["future"]
+        try:
+            snapshot = future.result(timeout=timeout)
+        except FutureTimeoutError:
+            logger.warning("Prefetched snapshot not ready in time, fetching directly")
+            self._count("failed")
+            return None
+        except Exception as e:
+            logger.warning(f"Snapshot prefetch failed: {e}")
+            self._count("failed")
+            return None
+
+        if not snapshot or not snapshot.get("success"):
+            # Let the caller fetch again so errors are reported from a fresh attempt
+            self._count("failed")
+            return None
+
+        self._count("used")
+        return snapshot
+
+    def discard(self, key: Optional[str]) -> None:
+        """Drop a prefetch that will not be used."""
+        if not key:
+            return
+        with self._lock:
+            entry = self._pending.pop(key, None)
+            if entry is not None:
+                entry["future"].cancel()
+                self._stats["discarded"] += 1
+
+    def _expire_locked(self) -> None:
+        now = time.monotonic()
+        for key in [k for k, e in self._pending.items() if now - e["started_at"] > CONFIG['MAX_AGE_SECONDS']]:
+            self._pending.pop(key)["future"].cancel()
+            self._stats["expired"] += 1
+
+    def _count(self, name: str) -> None:
+        with self._lock:
+            self._stats[name] += 1
+
+    def stats(self) -> Dict[str, Any]:
+        """Return prefetch counters and the share of prefetches that were used."""
+        with self._lock:
+            started = self._stats["started"]
+            return {
+                **self._stats,
+                "pending": len(self._pending),
+                "use_rate": round(self._stats["used"] / started, 4) if started else 0.0,
+            }
+
+
+# Global prefetcher instance
+snapshot_prefetcher = SnapshotPrefetcher()
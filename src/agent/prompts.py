@@ -1,3 +1,24 @@
+"""
+Prompt texts and prefix-stable prompt assembly.
+
+Providers cache prompt prefixes that are byte-identical across requests, so
+prompts are assembled as a static system prefix (rendered once and reused)
+followed by the per-request part. Each prompt has an approximate token
+budget; assembled prompts are measured against it and the per-request part
+is trimmed (or the history shortened) when it would not fit.
+"""
+
+import logging
+import threading
+from collections import defaultdict
+from functools import lru_cache
+from typing import Any, Dict, List, Sequence
+
+from langchain_core.messages import BaseMessage, HumanMessage, SystemMessage
+from langchain_core.messages.utils import count_tokens_approximately
+
+logger = logging.getLogger(__name__)
+
 # Intent classification prompt for main graph
 INTENT_CLASSIFICATION_PROMPT = """You are an advanced intent classifier. Analyze the user's input and provide detailed classification with confidence scoring.
 
@@ -68,7 +89,7 @@ CONTEXT: The user's intent has been pre-classified with detailed context informa
 The intentContext contains:
 - intent: classified user intent
 - confidence: classification confidence score
-- slots: contextual scope information (brokerId, lp, group, etc.)
+- slots: contextual scope information (brokerId, lp, group, etc.). The LP scope in slots is enforced by get_lp_margin_check; pass slots.lp as lp_name when it is set
 - traceId: unique trace identifier for this request
 
 INSTRUCTIONS:
@@ -193,3 +214,134 @@ CRITICAL REQUIREMENTS:
 - All recommendations must focus on reducing margin usage
 - Provide specific volume and margin impact numbers
 - Avoid listing raw account data - focus on actionable insights"""
+
+
+# Approximate token budget per prompt (static prefix + per-request part)
+PROMPT_TOKEN_BUDGETS = {
+    "intent_classification": 2000,
+    "supervisor": 12000,
+    "ai_responder": 16000,
+}
+
+# The user input is moved out of the intent prompt so everything before it stays static
+_INTENT_USER_INPUT = "User input: {user_input}"
+_INTENT_PREFIX, _INTENT_SUFFIX = INTENT_CLASSIFICATION_PROMPT.split(_INTENT_USER_INPUT)
+
+
+@lru_cache(maxsize=8)
+def intent_classification_prefix(lp_mapping: str) -> str:
+    """Render the static part of the intent prompt once per LP mapping (byte-identical across requests)."""
+    return (_INTENT_PREFIX + _INTENT_SUFFIX.lstrip()).format(lp_mapping=lp_mapping)
+
+
+@lru_cache(maxsize=32)
+def static_prompt_tokens(text: str) -> int:
+    """Approximate token cost of a static prompt prefix (computed once per text)."""
+    return count_tokens_approximately([SystemMessage(content=text)])
+
+
+def prompt_token_split(messages: Sequence[BaseMessage]) -> Dict[str, int]:
+    """Split a prompt's approximate token cost into the static system prefix and the per-request part."""
+    static = 0
+    for message in messages:
+        if not isinstance(message, SystemMessage):
+            break
+        static += static_prompt_tokens(message.content) if isinstance(message.content, str) else count_tokens_approximately([message])
+    total = count_tokens_approximately(list(messages))
+    return {"static_tokens": static, "dynamic_tokens": max(0, total - static), "total_tokens": total}
+
+
+def fit_text_to_tokens(text: str, max_tokens: int) -> str:
+    """Trim ``text`` to roughly ``max_tokens`` tokens, keeping its head and tail."""
+    tokens = count_tokens_approximately([HumanMessage(content=text)])
+    if tokens <= max_tokens:
+        return text
+    keep = max(0, int(len(text) * max(0, max_tokens) / tokens) - 5)
+    head = keep * 2 // 3
+    return text[:head] + " … " + text[len(text) - (keep - head):] if keep else ""
+
+
+class PromptBudgetStats:
+    """Thread-safe per-prompt token cost and budget counters."""
+
+    def __init__(self):
+        self._lock = threading.Lock()
+        self._stats: Dict[str, Dict[str, Any]] = defaultdict(lambda: {
+            "requests": 0, "static_tokens": 0, "dynamic_tokens": 0, "max_total_tokens": 0, "trimmed": 0, "over_budget": 0,
+        })
+
+    def record(self, name: str, split: Dict[str, int], trimmed: bool = False) -> Dict[str, Any]:
+        """
+        Record one assembled prompt
+
+        Args:
+            name: Prompt name (key of PROMPT_TOKEN_BUDGETS)
+            split: Result of prompt_token_split
+            trimmed: Whether the per-request part was cut to fit the budget
+
+        Returns:
+            The split with the budget and whether the prompt exceeds it
+        """
+        budget = PROMPT_TOKEN_BUDGETS.get(name)
+        over_budget = budget is not None and split["total_tokens"] > budget
+        if over_budget:
+            logger.warning(f"Prompt {name} costs ~{split['total_tokens']} tokens, over its {budget} token budget")
+        with self._lock:
+            stats = self._stats[name]
+            stats["requests"] += 1
+            stats["static_tokens"] = split["static_tokens"]
+            stats["dynamic_tokens"] += split["dynamic_tokens"]
+            stats["max_total_tokens"] = max(stats["max_total_tokens"], split["total_tokens"])
+            stats["trimmed"] += int(trimmed)
+            stats["over_budget"] += int(over_budget)
+        return {**split, "budget": budget, "over_budget": over_budget}
+
+    def stats(self) -> Dict[str, Any]:
+        """Return per-prompt request counts, static prefix size, average per-request tokens and budget hits."""
+        with self._lock:
+            return {
+                name: {
+                    "requests": stats["requests"],
+                    "budget": PROMPT_TOKEN_BUDGETS.get(name),
+                    "static_tokens": stats["static_tokens"],
+                    "avg_dynamic_tokens": round(stats["dynamic_tokens"] / stats["requests"], 1) if stats["requests"] else 0.0,
+                    "max_total_tokens": stats["max_total_tokens"],
+                    "trimmed": stats["trimmed"],
+                    "over_budget": stats["over_budget"],
+                }
+                for name, stats in self._stats.items()
+            }
+
+    def reset(self) -> None:
+        """Clear all counters."""
+        with self._lock:
+            self._stats.clear()
+
+
+# Global prompt budget statistics
+prompt_budget_stats = PromptBudgetStats()
+
+
+def build_intent_classification_messages(user_input: str, lp_mapping: str) -> List[BaseMessage]:
+    """
+    Assemble the intent classification prompt
+
+    Args:
+        user_input: Latest user message
+        lp_mapping: Rendered LP mapping (see get_lp_mapping_string)
+
+    Returns:
+        [static SystemMessage, per-request HumanMessage]; the user input is
+        trimmed when the prompt would exceed its token budget
+    """
+    system = SystemMessage(content=intent_classification_prefix(lp_mapping))
+    user = HumanMessage(content=_INTENT_USER_INPUT.format(user_input=user_input))
+    split = prompt_token_split([system, user])
+    budget = PROMPT_TOKEN_BUDGETS["intent_classification"]
+    trimmed = split["total_tokens"] > budget
+    if trimmed:
+        room = budget - split["static_tokens"] - count_tokens_approximately([HumanMessage(content=_INTENT_USER_INPUT.format(user_input=""))])
+        user = HumanMessage(content=_INTENT_USER_INPUT.format(user_input=fit_text_to_tokens(user_input, room)))
+        split = prompt_token_split([system, user])
+    prompt_budget_stats.record("intent_classification", split, trimmed)
+    return [system, user]
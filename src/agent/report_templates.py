@@ -0,0 +1,194 @@
+"""
+Deterministic report templates for margin analyses.
+
+Contains render_margin_report, which turns a MarginCheckToolResponse dict into
+the standard tagged report (the same sections ai_responder produces) without
+calling an LLM. Used for MARGIN_ALERT events so alert cards get a report
+immediately; the LLM narrative can still be requested as a follow-up.
+"""
+
+from typing import Any, Dict, List
+
+# Configuration Settings
+CONFIG = {
+    # Threshold used when an LP carries no thresholdsRef
+    'DEFAULT_THRESHOLD': 80.0,
+    # Recommendations and cross candidates shown in the report
+    'MAX_RECOMMENDATIONS': 3,
+    'MAX_CROSS_CANDIDATES': 3,
+    'DEFAULT_LANGUAGE': "zh",
+}
+
+# Section labels and phrases per language
+LABELS = {
+    "zh": {
+        "critical": "CRITICAL - 存在保证金占用超过阈值的 LP",
+        "ok": "OK - 所有 LP 保证金占用均低于阈值",
+        "data_time": "数据时间",
+        "avg_margin": "平均保证金占用",
+        "lp_count": "LP 数量",
+        "high_risk_count": "高风险 LP 数量",
+        "cross_count": "对冲清理机会",
+        "high_risk": "高风险",
+        "healthy": "健康",
+        "threshold": "阈值",
+        "no_alerts": "无 - 当前没有 LP 超过保证金阈值",
+        "no_recommendations": "无 - 保证金占用处于安全范围，无需操作",
+        "clear_cross": "对冲清理 {symbol}（{lpA} ↔ {lpB}）",
+        "move": "减仓 {lp} 的 {symbol} {volume} 手",
+        "generic": "{type} 操作",
+        "release": "预计释放保证金 ${amount:,.0f}",
+        "impact": "保证金占用 {before:.1f}% → {after:.1f}%",
+        "equity": "净值",
+        "margin_used": "已用保证金",
+        "free_margin": "可用保证金",
+        "positions": "持仓数",
+        "top_symbols": "主要品种",
+        "cross_header": "跨 LP 对冲机会",
+        "cross_line": "{symbol}: {lpA} {a} 手 / {lpB} {b} 手，可释放 ${amount:,.0f}",
+        "no_cross": "无跨 LP 对冲机会",
+    },
+    "en": {
+        "critical": "CRITICAL - at least one LP is above its margin threshold",
+        "ok": "OK - all LPs are below their margin thresholds",
+        "data_time": "Data time",
+        "avg_margin": "Average margin level",
+        "lp_count": "LP count",
+        "high_risk_count": "High-risk LPs",
+        "cross_count": "Cross-netting opportunities",
+        "high_risk": "HIGH RISK",
+        "healthy": "HEALTHY",
+        "threshold": "Threshold",
+        "no_alerts": "None - no LP is above its margin threshold",
+        "no_recommendations": "None - margin usage is within the safe range, no action needed",
+        "clear_cross": "Clear cross position {symbol} ({lpA} <-> {lpB})",
+        "move": "Reduce {symbol} on {lp} by {volume} lots",
+        "generic": "{type} action",
+        "release": "Expected margin release ${amount:,.0f}",
+        "impact": "Margin level {before:.1f}% -> {after:.1f}%",
+        "equity": "Equity",
+        "margin_used": "Margin used",
+        "free_margin": "Free margin",
+        "positions": "Positions",
+        "top_symbols": "Top symbols",
+        "cross_header": "Cross-LP netting opportunities",
+        "cross_line": "{symbol}: {lpA} {a} lots / {lpB} {b} lots, releases ${amount:,.0f}",
+        "no_cross": "No cross-LP netting opportunities",
+    },
+}
+
+
+def _threshold(lp: Dict[str, Any]) -> float:
+    thresholds = lp.get("thresholdsRef") or {}
+    return float(thresholds.get("critical", CONFIG['DEFAULT_THRESHOLD']))
+
+
+def _is_high_risk(lp: Dict[str, Any]) -> bool:
+    return float(lp.get("marginLevel", 0)) >= _threshold(lp)
+
+
+def _status_line(lp: Dict[str, Any], text: Dict[str, str]) -> str:
+    high = _is_high_risk(lp)
+    return (
+        f"{'🔴' if high else '🟢'} {lp.get('lp', 'Unknown')}: {float(lp.get('marginLevel', 0)):.1f}% "
+        f"({text['threshold']}: {_threshold(lp):.0f}%) - {text['high_risk'] if high else text['healthy']}"
+    )
+
+
+def _recommendation_line(rec: Dict[str, Any], text: Dict[str, str]) -> str:
+    params = (rec.get("actions") or [{}])[0].get("params", {})
+    rec_type = rec.get("type", "")
+    if rec_type == "CLEAR_CROSS":
+        action = text["clear_cross"].format(
+            symbol=params.get("symbol", ""), lpA=params.get("lpA", ""), lpB=params.get("lpB", "")
+        )
+    elif rec_type == "MOVE":
+        action = text["move"].format(
+            symbol=params.get("symbol", ""), lp=params.get("lp", ""), volume=params.get("volume", 0)
+        )
+    else:
+        action = text["generic"].format(type=rec_type)
+
+    details = []
+    released = sum(-d.get("delta", 0) for d in rec.get("explain", {}).get("drivers", []) if d.get("k") == "marginUsed")
+    if released > 0:
+        details.append(text["release"].format(amount=released))
+    impact = rec.get("impact") or {}
+    if "mlBefore" in impact and "mlAfter" in impact:
+        details.append(text["impact"].format(before=impact["mlBefore"], after=impact["mlAfter"]))
+
+    priority = min(int(rec.get("priority", 2)), 2)
+    return f"P{priority} - {action}" + (f"; {'; '.join(details)}" if details else "")
+
+
+def _lp_detail_lines(lp: Dict[str, Any], text: Dict[str, str]) -> List[str]:
+    lines = [_status_line(lp, text)]
+    lines.append(
+        f"  - {text['equity']}: ${float(lp.get('equity', 0)):,.2f} | "
+        f"{text['margin_used']}: ${float(lp.get('marginUsed', 0)):,.2f} | "
+        f"{text['free_margin']}: ${float(lp.get('freeMargin', 0)):,.2f}"
+    )
+    symbols = ", ".join(lp.get("topSymbols") or []) or "-"
+    lines.append(f"  - {text['positions']}: {lp.get('totalPositions', 0)} | {text['top_symbols']}: {symbols}")
+    return lines
+
+
+def render_margin_report(analysis: Dict[str, Any], language: str = CONFIG['DEFAULT_LANGUAGE']) -> str:
+    """
+    Render a margin analysis as the standard tagged report without an LLM
+
+    Args:
+        analysis: MarginCheckToolResponse dict from generate_margin_analysis
+        language: "zh" or "en" (unknown values fall back to the default language)
+
+    Returns:
+        Report text with HEALTH_STATUS, SUMMARY_METRICS, CRITICAL_ALERTS,
+        PRIORITY_RECOMMENDATIONS and DETAILED_ANALYSIS sections. The output
+        depends only on ``analysis`` so identical snapshots render identically.
+    """
+    text = LABELS.get(language) or LABELS[CONFIG['DEFAULT_LANGUAGE']]
+    per_lp = sorted(analysis.get("perLP") or [], key=lambda lp: float(lp.get("marginLevel", 0)), reverse=True)
+    high_risk = [lp for lp in per_lp if _is_high_risk(lp)]
+    metrics = analysis.get("metrics") or {}
+    cross_candidates = sorted(
+        analysis.get("crossCandidates") or [], key=lambda c: c.get("releasableMargin", 0), reverse=True
+    )
+    recommendations = sorted(
+        analysis.get("recommendations") or [], key=lambda r: (r.get("priority", 2), r.get("id", ""))
+    )[:CONFIG['MAX_RECOMMENDATIONS']]
+    data_time = max((lp.get("dataTimestamp") or "" for lp in per_lp), default="") or "-"
+
+    health = text["critical"] if high_risk or analysis.get("status") == "critical" else text["ok"]
+    sections = [
+        ("HEALTH_STATUS", [f"{'🔴' if high_risk else '🟢'} {health}", f"{text['data_time']}: {data_time}"]),
+        ("SUMMARY_METRICS", [
+            f"- {text['avg_margin']}: {float(metrics.get('avgMarginLevel', 0)):.1f}%",
+            f"- {text['lp_count']}: {metrics.get('lpCount', len(per_lp))}",
+            f"- {text['high_risk_count']}: {len(high_risk)}",
+            f"- {text['cross_count']}: {len(cross_candidates)}",
+        ]),
+        ("CRITICAL_ALERTS", [
+            f"{i}. {_status_line(lp, text)}" for i, lp in enumerate(high_risk, 1)
+        ] or [text["no_alerts"]]),
+        ("PRIORITY_RECOMMENDATIONS", [
+            f"{i}. {_recommendation_line(rec, text)}" for i, rec in enumerate(recommendations, 1)
+        ] or [text["no_recommendations"]]),
+    ]
+
+    detail_lines = [line for lp in per_lp for line in _lp_detail_lines(lp, text)]
+    detail_lines.append(f"{text['cross_header']}:")
+    for cross in cross_candidates[:CONFIG['MAX_CROSS_CANDIDATES']]:
+        volumes = cross.get("volumePair") or {}
+        detail_lines.append("  - " + text["cross_line"].format(
+            symbol=cross.get("symbol", ""),
+            lpA=cross.get("lpA", ""),
+            lpB=cross.get("lpB", ""),
+            a=volumes.get("a", 0),
+            b=volumes.get("b", 0),
+            amount=cross.get("releasableMargin", 0),
+        ))
+    if not cross_candidates:
+        detail_lines.append(f"  - {text['no_cross']}")
+    sections.append(("DETAILED_ANALYSIS", detail_lines))
+
+    return "\n\n".join(f"<{tag}>\n" + "\n".join(lines) + f"\n</{tag}>" for tag, lines in sections)
@@ -0,0 +1,227 @@
+"""
+Run-scoped tool result reuse and supervisor loop guard.
+
+Nothing in the supervisor's ReAct loop stops it from calling
+get_lp_margin_check again and again within one run; every call is a full
+authenticate + fetch + analysis round trip. A RunGuard is opened for each
+supervisor invocation (one user turn or one recheck cycle) and:
+- Caches tool results keyed by tool name and arguments, so repeated calls
+  with the same arguments are answered from memory
+- Caps tool calls and supervisor LLM iterations per run; once a cap is hit,
+  the supervisor is short-circuited to the report writer (ai_responder)
+  and then to forwarding its report. The same short-circuit applies when
+  the request deadline leaves no time for another supervisor iteration
+
+Contains:
+- RunGuard: per-run cache and counters
+- RunGuardRegistry: open/get/close guards by key (the key travels in the run config)
+- create_loop_guard_hook: post-model hook for create_supervisor
+"""
+
+import json
+import os
+import uuid
+import logging
+import threading
+from collections import defaultdict
+from typing import Any, Dict, Optional
+
+from langchain_core.messages import AIMessage, HumanMessage
+from langchain_core.runnables import RunnableConfig
+
+from src.agent.deadline import deadline_from_config
+
+logger = logging.getLogger(__name__)
+
+# Configuration Settings
+CONFIG = {
+    # Defaults used when the run config does not set the caps
+    'DEFAULT_MAX_TOOL_CALLS': int(os.getenv("RUN_MAX_TOOL_CALLS", "4")),
+    'DEFAULT_MAX_LLM_ITERATIONS': int(os.getenv("RUN_MAX_LLM_ITERATIONS", "6")),
+    # Configurable key carrying the guard key into tools and hooks
+    'CONFIG_KEY': "run_guard_key",
+}
+
+
+def tool_cache_key(tool_name: str, args: Dict[str, Any]) -> tuple:
+    """Build the cache key for a tool call (argument order does not matter)."""
+    return tool_name, json.dumps(args, sort_keys=True, default=str)
+
+
+class RunGuard:
+    """Tool result cache and call budget for one supervisor run."""
+
+    def __init__(self, max_tool_calls: int, max_llm_iterations: int):
+        self.max_tool_calls = max(1, int(max_tool_calls))
+        self.max_llm_iterations = max(1, int(max_llm_iterations))
+        self.tool_calls = 0
+        self.cache_hits = 0
+        self.llm_iterations = 0
+        self.tripped: Optional[str] = None
+        self._results: Dict[tuple, str] = {}
+        self._lock = threading.Lock()
+
+    def _trip(self, reason: str) -> None:
+        if self.tripped is None:
+            self.tripped = reason
+            logger.warning(f"Run guard tripped ({reason}): {self.tool_calls} tool calls, {self.llm_iterations} LLM iterations")
+
+    def cached_result(self, tool_name: str, args: Dict[str, Any]) -> Optional[str]:
+        """Count one tool call and return its cached result, if this run already made it."""
+        with self._lock:
+            self.tool_calls += 1
+            if self.tool_calls > self.max_tool_calls:
+                self._trip("max_tool_calls")
+            result = self._results.get(tool_cache_key(tool_name, args))
+            if result is not None:
+                self.cache_hits += 1
+            return result
+
+    def store_result(self, tool_name: str, args: Dict[str, Any], result: str) -> None:
+        """Cache a successful tool result for the rest of the run."""
+        with self._lock:
+            self._results[tool_cache_key(tool_name, args)] = result
+
+    def over_tool_budget(self) -> bool:
+        """Return True once the run has made more tool calls than allowed."""
+        with self._lock:
+            return self.tool_calls > self.max_tool_calls
+
+    def record_llm_iteration(self) -> bool:
+        """Count one supervisor LLM iteration; returns False once the run is over budget."""
+        with self._lock:
+            self.llm_iterations += 1
+            if self.llm_iterations >= self.max_llm_iterations:
+                self._trip("max_llm_iterations")
+            return self.tripped is None
+
+    def summary(self) -> Dict[str, Any]:
+        """Return the run's counters and whether (and why) it was short-circuited."""
+        with self._lock:
+            return {
+                "tool_calls": self.tool_calls,
+                "cache_hits": self.cache_hits,
+                "llm_iterations": self.llm_iterations,
+                "tripped": self.tripped,
+            }
+
+
+class RunGuardRegistry:
+    """Thread-safe registry of open run guards plus aggregate statistics."""
+
+    def __init__(self):
+        self._lock = threading.Lock()
+        self._guards: Dict[str, RunGuard] = {}
+        self._stats = {"runs": 0, "tool_calls": 0, "cache_hits": 0, "llm_iterations": 0}
+        self._tripped: Dict[str, int] = defaultdict(int)
+
+    def open(
+        self,
+        max_tool_calls: int = CONFIG['DEFAULT_MAX_TOOL_CALLS'],
+        max_llm_iterations: int = CONFIG['DEFAULT_MAX_LLM_ITERATIONS'],
+    ) -> str:
+        """Open a guard for a new run and return its key."""
+        key = uuid.uuid4().hex
+        with self._lock:
+            self._guards[key] = RunGuard(max_tool_calls, max_llm_iterations)
+        return key
+
+    def get(self, key: Optional[str]) -> Optional[RunGuard]:
+        """Return the open guard for ``key`` (None when unknown or already closed)."""
+        if not key:
+            return None
+        with self._lock:
+            return self._guards.get(key)
+
+    def close(self, key: Optional[str]) -> Optional[Dict[str, Any]]:
+        """Close a guard, fold its counters into the aggregates and return its summary."""
+        if not key:
+            return None
+        with self._lock:
+            guard = self._guards.pop(key, None)
+        if guard is None:
+            return None
+        summary = guard.summary()
+        with self._lock:
+            self._stats["runs"] += 1
+            for name in ("tool_calls", "cache_hits", "llm_iterations"):
+                self._stats[name] += summary[name]
+            if summary["tripped"]:
+                self._tripped[summary["tripped"]] += 1
+        return summary
+
+    def stats(self) -> Dict[str, Any]:
+        """Return aggregate counters, short-circuits by reason and open guards."""
+        with self._lock:
+            return {**self._stats, "tripped": dict(self._tripped), "open": len(self._guards)}
+
+    def reset(self) -> None:
+        """Drop aggregates (open guards are kept)."""
+        with self._lock:
+            self._stats = {name: 0 for name in self._stats}
+            self._tripped.clear()
+
+
+# Global run guard registry
+run_guards = RunGuardRegistry()
+
+
+def guard_from_config(config: Optional[RunnableConfig]) -> Optional[RunGuard]:
+    """Return the guard for the run described by ``config``, if one is open."""
+    configurable = (config or {}).get("configurable") or {}
+    return run_guards.get(configurable.get(CONFIG['CONFIG_KEY']))
+
+
+def create_loop_guard_hook(report_agent: str = "ai_responder", forward_tool: str = "forward_message"):
+    """
+    Create the supervisor post-model hook enforcing the run guard
+
+    While the run is within budget (and, when the request has a deadline,
+    there is time for another iteration) the hook is a no-op. Once a cap is hit, the
+    supervisor's next tool calls are replaced: first a handoff to
+    ``report_agent`` (if it has not written this turn's report yet), then
+    ``forward_tool`` to pass that report on. Replies without tool calls are
+    left alone, so the loop always terminates within two extra iterations.
+
+    Args:
+        report_agent: Name of the report-writing worker
+        forward_tool: Name of the tool that forwards the worker's report
+
+    Returns:
+        Hook callable for create_supervisor(post_model_hook=...)
+    """
+
+    def loop_guard(state: Dict[str, Any], config: RunnableConfig) -> Dict[str, Any]:
+        guard = guard_from_config(config)
+        deadline = deadline_from_config(config)
+        if guard is None and deadline is None:
+            return {}
+        within_budget = guard.record_llm_iteration() if guard is not None else True
+        out_of_time = deadline is not None and not deadline.allows("supervisor_round")
+        messages = state["messages"]
+        last_message = messages[-1] if messages else None
+        if (within_budget and not out_of_time) or not isinstance(last_message, AIMessage) or not last_message.tool_calls:
+            return {}
+
+        report_written = False
+        for message in reversed(messages[:-1]):
+            if isinstance(message, HumanMessage):
+                break
+            if isinstance(message, AIMessage) and message.name == report_agent and message.content:
+                report_written = True
+                break
+
+        if report_written:
+            tool_call = {"name": forward_tool, "args": {"from_agent": report_agent}}
+        else:
+            tool_call = {"name": f"transfer_to_{report_agent}", "args": {}}
+        if within_budget:
+            deadline.degrade("supervisor_short_circuit", "supervisor", next_tool=tool_call["name"])
+        logger.info(f"Run guard short-circuit ({guard.tripped if not within_budget else 'deadline'}): {tool_call['name']}")
+        # Same message id, so add_messages replaces the model's tool calls
+        return {"messages": [last_message.model_copy(update={
+            "tool_calls": [{**tool_call, "id": f"call_{uuid.uuid4().hex}", "type": "tool_call"}],
+            "invalid_tool_calls": [],
+        })]}
+
+    return loop_guard
@@ -7,11 +7,21 @@ from typing import List, Optional, Dict, Any
 import operator
 from src.agent.schemas import IntentContext, OrchestratorInputs
 
+def lp_reports_reducer(existing: Optional[list], update: Optional[list]) -> list:
+    """Collect per-LP branch results; a None update clears them once merged."""
+    if update is None:
+        return []
+    return (existing or []) + update
+
+
 # main graph state
 class OverallState(TypedDict, total=False):
     """Main graph state managing overall workflow with enhanced intent classification."""
     messages: Annotated[list[AnyMessage], add_messages]
     intentContext: Optional[IntentContext]  # Enhanced intent context with full classification details
+    prefetchKey: Optional[str]  # Key of the speculative margin snapshot fetch started during classification
+    eventType: Optional[str]  # Triggering event type (e.g. MARGIN_ALERT); cleared once the event is handled
+    lpReports: Annotated[list, lp_reports_reducer]  # Per-LP fan-out branch results awaiting the merge step
 
 
 # subgraph state
@@ -2,6 +2,7 @@
 
 import os
 import sys
+import time
 import asyncio
 from contextlib import asynccontextmanager
 from fastapi import FastAPI, Request
@@ -13,7 +14,8 @@ if sys.platform == "win32":
     asyncio.set_event_loop_policy(asyncio.WindowsSelectorEventLoopPolicy())
 
 from src.db.checkpoints import CheckpointerManager
-from src.agent.graph import build_graph
+from src.agent.graph import build_graph, BUILD_TIMINGS
+from src.agent.llm_registry import ModelRegistry
 from src.api.graph import router as graph_router
 from src.api.models import ErrorResponse
 
@@ -32,6 +34,7 @@ async def lifespan(app: FastAPI):
     if not DATABASE_URL:
         raise ValueError("DATABASE_URL environment variable is not set")
 
+    startup_started = time.perf_counter()
     try:
         # Initialize the async checkpointer
         await CheckpointerManager.initialize(DATABASE_URL)
@@ -60,12 +63,24 @@ async def lifespan(app: FastAPI):
         checkpointer = await CheckpointerManager.get_checkpointer()
 
         # Build the graph with async checkpointer
+        graph_started = time.perf_counter()
         graph = await build_graph(checkpointer)
         app.state.graph = graph
+        graph_build_seconds = time.perf_counter() - graph_started
+        
+        # Open pooled LLM connections so the first request skips TLS setup
+        await ModelRegistry.warmup()
         
         # Build the data processing graph with async checkpointer
         logger.info("Successfully compiled graphs and attached to app state.")
         
+        app.state.startup_metrics = {
+            "graph_build_seconds": round(graph_build_seconds, 4),
+            "startup_seconds": round(time.perf_counter() - startup_started, 4),
+            "build_timings": dict(BUILD_TIMINGS),
+        }
+        logger.info(f"Startup metrics: {app.state.startup_metrics}")
+        
         yield
         
     except Exception as e:
@@ -74,6 +89,7 @@ async def lifespan(app: FastAPI):
     finally:
         # Clean up resources on shutdown
         await CheckpointerManager.close()
+        await ModelRegistry.close()
     logger.info("Application shutdown: graph resources released.")
 
 
@@ -0,0 +1,211 @@
+"""
+Paginated, projected reads of a thread's checkpoint history.
+
+The history endpoint used to walk ``aget_state_history`` to the first
+checkpoint, ``str()`` every state value, regex-parse the printed
+``IntentContext`` and sort the whole history in memory. Long HITL threads
+(one alert, many rechecks) made that slow and memory-heavy. Now:
+- A page is ``limit`` checkpoints older than the ``before`` cursor; both are
+  passed to the checkpointer, so Postgres reads only that page (one extra row
+  tells whether an older page exists)
+- ``fields`` projects each step to the groups the caller needs, and groups
+  that are not requested are never serialised
+- Pydantic state values (``IntentContext``) are dumped structurally; other
+  values are kept as JSON-friendly primitives and truncated strings
+
+Contains:
+- HISTORY_FIELDS and CONFIG (page sizes, truncation)
+- serialize_value / serialize_messages / serialize_step
+- read_history_page: one page of serialised steps plus the next cursor
+"""
+
+import os
+import json
+import logging
+from typing import Any, Dict, Iterable, List, Optional, Sequence
+
+from pydantic import BaseModel
+
+logger = logging.getLogger(__name__)
+
+# Step field groups a caller can project to (every step also carries checkpoint_id, step, created_at)
+HISTORY_FIELDS = (
+    "metadata",       # source, writes, executed_nodes, next, parent checkpoint
+    "messages",       # formatted conversation messages
+    "intentContext",  # structured IntentContext
+    "values",         # remaining state values
+    "tasks",          # pending tasks and their interrupts
+)
+
+# Configuration Settings
+CONFIG = {
+    # Page size when the caller sends no limit
+    'DEFAULT_PAGE_SIZE': int(os.getenv("HISTORY_PAGE_SIZE", "50")),
+    # Largest page a caller may request
+    'MAX_PAGE_SIZE': int(os.getenv("HISTORY_MAX_PAGE_SIZE", "500")),
+    # Truncation of message contents and other state values
+    'MESSAGE_PREVIEW_CHARS': 300,
+    'VALUE_PREVIEW_CHARS': 500,
+}
+
+
+def _truncate(text: str, limit: int) -> str:
+    return text[:limit] + "..." if len(text) > limit else text
+
+
+def serialize_value(value: Any) -> Any:
+    """JSON-friendly form of a state value (models dumped, primitives kept, the rest truncated)."""
+    if isinstance(value, BaseModel):
+        return value.model_dump(mode="json")
+    if value is None or isinstance(value, (bool, int, float)):
+        return value
+    if isinstance(value, str):
+        return _truncate(value, CONFIG['VALUE_PREVIEW_CHARS'])
+    if isinstance(value, (list, tuple)) and all(v is None or isinstance(v, (str, bool, int, float)) for v in value):
+        return list(value)
+    return _truncate(str(value), CONFIG['VALUE_PREVIEW_CHARS'])
+
+
+def serialize_messages(messages: Iterable[Any]) -> List[Any]:
+    """Format messages for display (tool JSON parsed, contents truncated)."""
+    limit = CONFIG['MESSAGE_PREVIEW_CHARS']
+    formatted = []
+    for msg in messages:
+        if not (hasattr(msg, "content") and hasattr(msg, "type")):
+            formatted.append(_truncate(str(msg), limit))
+            continue
+        content = msg.content
+        parsed_content = None
+        if msg.type == "tool" and content:
+            try:
+                parsed_content = json.loads(content)
+            except (json.JSONDecodeError, TypeError):
+                parsed_content = None
+        formatted.append({
+            "type": msg.type,
+            "content": _truncate(content, limit) if isinstance(content, str) else content,
+            "parsed_content": parsed_content,
+            "name": getattr(msg, "name", None),
+            "additional_kwargs": getattr(msg, "additional_kwargs", {}),
+        })
+    return formatted
+
+
+def _serialize_interrupt(interrupt: Any) -> Dict[str, Any]:
+    if hasattr(interrupt, "id") and hasattr(interrupt, "value"):
+        return {"id": interrupt.id, "value": interrupt.value}
+    if isinstance(interrupt, dict):
+        return {"id": interrupt.get("id"), "value": interrupt.get("value", {})}
+    return {"id": str(getattr(interrupt, "id", "unknown")), "value": str(interrupt)}
+
+
+def serialize_step(state_snapshot: Any, fields: Sequence[str] = HISTORY_FIELDS) -> Dict[str, Any]:
+    """
+    Serialise one StateSnapshot, limited to the requested field groups
+
+    Args:
+        state_snapshot: Snapshot from aget_state_history
+        fields: Field groups from HISTORY_FIELDS
+
+    Returns:
+        Step dictionary
+    """
+    metadata = state_snapshot.metadata or {}
+    created_at = state_snapshot.created_at
+    step: Dict[str, Any] = {
+        "checkpoint_id": state_snapshot.config.get("configurable", {}).get("checkpoint_id"),
+        "step": metadata.get("step", 0),
+        "created_at": created_at.isoformat() if hasattr(created_at, "isoformat") else created_at,
+    }
+
+    if "metadata" in fields:
+        writes = metadata.get("writes") or {}
+        parent = (state_snapshot.parent_config or {}).get("configurable", {})
+        step.update({
+            "source": metadata.get("source", "unknown"),
+            "writes": writes,
+            "executed_nodes": list(writes.keys()),
+            "next": list(state_snapshot.next or []),
+            "parent_checkpoint_id": parent.get("checkpoint_id"),
+        })
+
+    state_values = state_snapshot.values or {}
+    if {"messages", "intentContext", "values"} & set(fields):
+        values: Dict[str, Any] = {}
+        for key, value in state_values.items():
+            if key == "messages":
+                if "messages" in fields and value:
+                    values[key] = serialize_messages(value)
+            elif key == "intentContext":
+                if "intentContext" in fields and value:
+                    values[key] = serialize_value(value)
+            elif "values" in fields:
+                values[key] = serialize_value(value)
+        step["values"] = values
+
+    if "tasks" in fields:
+        step["tasks"] = [
+            {
+                "id": task.id,
+                "name": task.name,
+                "error": str(task.error) if task.error else None,
+                "interrupts": [_serialize_interrupt(i) for i in task.interrupts or ()],
+            }
+            for task in state_snapshot.tasks or ()
+        ]
+    return step
+
+
+def parse_fields(fields: Optional[Sequence[str]]) -> Sequence[str]:
+    """Validate a projection (None = every group); raises ValueError on unknown groups."""
+    if not fields:
+        return HISTORY_FIELDS
+    unknown = [f for f in fields if f not in HISTORY_FIELDS]
+    if unknown:
+        raise ValueError(f"Unknown history fields {unknown}; expected any of {list(HISTORY_FIELDS)}")
+    return tuple(fields)
+
+
+def page_limit(limit: Optional[int]) -> int:
+    """Clamp a requested page size to 1..MAX_PAGE_SIZE (None = the default size)."""
+    if not limit:
+        return CONFIG['DEFAULT_PAGE_SIZE']
+    return max(1, min(int(limit), CONFIG['MAX_PAGE_SIZE']))
+
+
+async def read_history_page(
+    graph: Any,
+    thread_id: str,
+    limit: Optional[int] = None,
+    before: Optional[str] = None,
+    fields: Optional[Sequence[str]] = None,
+) -> Dict[str, Any]:
+    """
+    Read one page of a thread's history, newest checkpoints first
+
+    Args:
+        graph: Compiled graph with a checkpointer
+        thread_id: Thread to read
+        limit: Page size (clamped to MAX_PAGE_SIZE)
+        before: Cursor; only checkpoints older than this checkpoint_id are read
+        fields: Field groups to include (None = all)
+
+    Returns:
+        {"steps": [...] in chronological order, "next_cursor": checkpoint_id or None}
+    """
+    fields = parse_fields(fields)
+    limit = page_limit(limit)
+    config = {"configurable": {"thread_id": thread_id}}
+    before_config = {"configurable": {"thread_id": thread_id, "checkpoint_id": before}} if before else None
+
+    snapshots = [
+        snapshot
+        async for snapshot in graph.aget_state_history(config, before=before_config, limit=limit + 1)
+    ]
+    has_more = len(snapshots) > limit
+    snapshots = snapshots[:limit]
+    steps = [serialize_step(snapshot, fields) for snapshot in snapshots]
+    next_cursor = steps[-1]["checkpoint_id"] if has_more and steps else None
+    # Checkpoints come newest first; a page reads chronologically like the full history did
+    steps.reverse()
+    return {"steps": steps, "next_cursor": next_cursor}
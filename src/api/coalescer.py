@@ -0,0 +1,170 @@
+"""
+Idempotent coalescing of duplicate graph runs.
+
+Identical MARGIN_ALERT payloads for the same LP, or client retries after a
+timeout, used to start a new graph run each time. RunCoalescer keys runs by
+the caller's idempotency key (or, for alerts, LP + payload snapshot hash):
+- A request whose key matches a running or recently finished run attaches
+  to it instead of starting another one
+- Non-streaming callers share the run's response
+- Streaming callers replay the SSE events emitted so far, then follow live
+
+Runs execute as detached tasks, so a caller disconnecting does not cancel a
+run that others are attached to. Failed runs are forgotten immediately, so
+a retry after an error starts fresh.
+
+Contains:
+- snapshot_key for alert payloads
+- RunCoalescer and the global run_coalescer
+"""
+
+import os
+import json
+import time
+import asyncio
+import hashlib
+import logging
+from functools import partial
+from typing import Any, AsyncIterator, Awaitable, Callable, Dict, Optional, Tuple
+
+logger = logging.getLogger(__name__)
+
+# Configuration Settings
+CONFIG = {
+    # Finished runs stay attachable for this long (covers client retries after MARGIN_ENDPOINT_TIMEOUT)
+    'RECENT_SECONDS': float(os.getenv("AGENT_COALESCE_SECONDS", "300")),
+    # Hex digits of the payload hash used in alert keys
+    'SNAPSHOT_HASH_LENGTH': 16,
+}
+
+
+def snapshot_key(lp_name: str, payload: Dict[str, Any]) -> str:
+    """Build the coalescing key for an alert: LP plus a hash of its payload snapshot."""
+    digest = hashlib.sha256(json.dumps(payload, sort_keys=True, default=str).encode("utf-8")).hexdigest()
+    return f"{lp_name}:{digest[:CONFIG['SNAPSHOT_HASH_LENGTH']]}"
+
+
+class _CoalescedRun:
+    """One shared execution: its task plus, for streams, the events emitted so far."""
+
+    def __init__(self):
+        self.task: Optional[asyncio.Task] = None
+        self.events: list = []
+        self.done = False
+        self.finished_at: Optional[float] = None
+        self.wakeup = asyncio.Event()
+
+    def publish(self, chunk: Optional[str] = None) -> None:
+        if chunk is not None:
+            self.events.append(chunk)
+        woken, self.wakeup = self.wakeup, asyncio.Event()
+        woken.set()
+
+
+class RunCoalescer:
+    """Registry of in-flight and recent runs by idempotency key (one event loop)."""
+
+    def __init__(self, recent_seconds: float = CONFIG['RECENT_SECONDS']):
+        self.recent_seconds = recent_seconds
+        self._runs: Dict[Tuple[str, str], _CoalescedRun] = {}
+        self._stats = {"runs": 0, "coalesced": 0, "failed": 0}
+
+    def _prune(self) -> None:
+        cutoff = time.monotonic() - self.recent_seconds
+        for key in [k for k, run in self._runs.items() if run.finished_at is not None and run.finished_at < cutoff]:
+            del self._runs[key]
+
+    def _lookup(self, key: Tuple[str, str]) -> Optional[_CoalescedRun]:
+        self._prune()
+        run = self._runs.get(key)
+        if run is not None:
+            self._stats["coalesced"] += 1
+            logger.info(f"Coalescing duplicate {key[0]} run {key[1]}")
+        return run
+
+    def _register(self, key: Tuple[str, str], run: _CoalescedRun, is_failure: Callable[[Any], bool]) -> None:
+        self._runs[key] = run
+        self._stats["runs"] += 1
+        run.task.add_done_callback(partial(self._finished, key, run, is_failure))
+
+    def _finished(self, key, run: _CoalescedRun, is_failure: Callable[[Any], bool], task: asyncio.Task) -> None:
+        run.finished_at = time.monotonic()
+        failed = task.cancelled() or task.exception() is not None or is_failure(task.result())
+        if failed:
+            self._stats["failed"] += 1
+            if self._runs.get(key) is run:
+                del self._runs[key]
+
+    async def run(
+        self,
+        key: str,
+        factory: Callable[[], Awaitable[Dict[str, Any]]],
+        is_failure: Callable[[Any], bool] = lambda result: False,
+    ) -> Tuple[Dict[str, Any], bool]:
+        """
+        Run ``factory`` once per key and share its result
+
+        Args:
+            key: Idempotency key
+            factory: Coroutine function executing the run
+            is_failure: Results it flags are not kept for late callers
+
+        Returns:
+            (result, coalesced) - coalesced is True when another caller's run was reused
+        """
+        run = self._lookup(("invoke", key))
+        if run is not None:
+            return await asyncio.shield(run.task), True
+
+        run = _CoalescedRun()
+        run.task = asyncio.create_task(factory())
+        self._register(("invoke", key), run, is_failure)
+        return await asyncio.shield(run.task), False
+
+    def attach_stream(self, key: str) -> Optional[AsyncIterator[str]]:
+        """Return a replay-then-follow iterator over an existing stream for ``key``, if any."""
+        run = self._lookup(("stream", key))
+        if run is None:
+            return None
+        notice = f"event: coalesced\ndata: {json.dumps({'idempotency_key': key}, ensure_ascii=False)}\n\n"
+        return self._follow(run, notice)
+
+    def start_stream(self, key: str, events: AsyncIterator[str]) -> AsyncIterator[str]:
+        """Run the SSE ``events`` generator detached under ``key`` and return the caller's view of it."""
+        run = _CoalescedRun()
+
+        async def produce():
+            try:
+                async for chunk in events:
+                    run.publish(chunk)
+            finally:
+                run.done = True
+                run.publish()
+
+        run.task = asyncio.create_task(produce())
+        # A stream that emitted an error event is not replayed to later retries
+        self._register(("stream", key), run, lambda _: any(chunk.startswith("event: error") for chunk in run.events))
+        return self._follow(run)
+
+    @staticmethod
+    async def _follow(run: _CoalescedRun, notice: Optional[str] = None) -> AsyncIterator[str]:
+        if notice:
+            yield notice
+        index = 0
+        while True:
+            wakeup = run.wakeup
+            while index < len(run.events):
+                yield run.events[index]
+                index += 1
+            if run.done:
+                return
+            await wakeup.wait()
+
+    def stats(self) -> Dict[str, Any]:
+        """Return started, coalesced and failed run counts and the number of attachable runs."""
+        self._prune()
+        return {**self._stats, "attachable": len(self._runs)}
+
+
+# Global coalescer shared by the agent endpoints
+run_coalescer = RunCoalescer()
@@ -1,32 +1,217 @@
 """API endpoints for chat operations using multi-agent supervisor."""
 
 import logging
-from typing import Optional, List, Dict, Any
+from contextlib import aclosing
+from typing import Any, AsyncIterator, Awaitable, Callable, Dict, List, Optional, Tuple
 from datetime import datetime
 
-from fastapi import APIRouter, HTTPException, Request
+import orjson
+from fastapi import APIRouter, HTTPException, Request, Response, WebSocket, WebSocketDisconnect
 from fastapi.responses import StreamingResponse
 from pydantic import BaseModel, Field
 from langchain_core.messages import HumanMessage
 from langgraph.types import Command
-import json
-import asyncio
+
+from src.agent.instrumentation import RunMetricsCallback, run_metrics_registry
+from src.agent.deadline import run_deadlines, CONFIG as DEADLINE_CONFIG
+from src.api.scheduler import RunRejected, run_scheduler
+from src.api.coalescer import run_coalescer, snapshot_key
+from src.api.checkpoint_history import parse_fields, read_history_page
+from src.api.history_export import export_lines, export_records, gzip_chunks
+from src.api.jobs import run_jobs
+from src.api.thread_streams import thread_streams
+from src.api.streaming import coalesce_tokens, graph_stream_events, sse_frame
 
 logger = logging.getLogger(__name__)
 router = APIRouter(prefix="/agent", tags=["agent"])
 
 
+def run_metadata(metrics: RunMetricsCallback, state: Optional[Dict[str, Any]], deadline_key: Optional[str] = None) -> Dict[str, Any]:
+    """Finish run instrumentation and build the response metadata block (with the deadline's degradations)."""
+    intent_context = (state or {}).get("intentContext")
+    trace_id = getattr(intent_context, "traceId", None)
+    summary = metrics.finish(trace_id=trace_id)
+    metadata = {"trace_id": summary["traceId"], "metrics": summary}
+    deadline = run_deadlines.close(deadline_key)
+    if deadline is not None:
+        metadata["degradations"] = deadline.pop("degradations")
+        metadata["deadline"] = deadline
+    return metadata
+
+
+def request_timeout(request: Request, body: "EventInput") -> Optional[float]:
+    """Deadline budget for a request: ``timeoutSeconds``, else the X-Request-Timeout header, else the default."""
+    if body.timeoutSeconds:
+        return body.timeoutSeconds
+    header = request.headers.get("x-request-timeout")
+    if header:
+        try:
+            return float(header)
+        except ValueError:
+            raise HTTPException(status_code=400, detail="X-Request-Timeout must be a number of seconds")
+    return DEADLINE_CONFIG['DEFAULT_TIMEOUT_SECONDS'] or None
+
+
+def is_failed_response(response: Dict[str, Any]) -> bool:
+    """Failed runs are not shared with later duplicate requests."""
+    return response.get("type") == "error"
+
+
+def overloaded_error(exc: RunRejected) -> HTTPException:
+    """Map a shed run to 429 Too Many Requests with a Retry-After hint."""
+    return HTTPException(status_code=429, detail=str(exc), headers={"Retry-After": str(exc.retry_after)})
+
+
+async def _run_events(
+    request: Optional[Request],
+    graph: Any,
+    graph_input: Any,
+    config: Dict[str, Any],
+    *,
+    thread_id: str,
+    priority: str,
+    metrics: RunMetricsCallback,
+    coalesce_key: Optional[str] = None,
+    deadline_key: Optional[str] = None,
+) -> AsyncIterator[Tuple[str, Dict[str, Any]]]:
+    final_state = None
+    ticket = None
+    try:
+        ticket = await run_scheduler.acquire(priority)
+        async with aclosing(coalesce_tokens(graph_stream_events(graph, graph_input, config))) as events:
+            async for kind, value in events:
+                # Coalesced runs keep going for the other attached callers
+                if request is not None and coalesce_key is None and await request.is_disconnected():
+                    break
+                if kind == "token":
+                    yield "token", {"thread_id": thread_id, "content": value}
+                elif "__interrupt__" in value:
+                    final_state = {**(final_state or {}), **value}
+                else:
+                    final_state = value
+    except Exception as exc:
+        logger.error(f"Streaming error for thread {thread_id}: {exc}")
+        yield "error", {"thread_id": thread_id, "status": "error", "error": str(exc), "metadata": run_metadata(metrics, final_state, deadline_key)}
+    finally:
+        if ticket is not None:
+            run_scheduler.release(ticket)
+        if final_state:
+            if "__interrupt__" in final_state:
+                interrupt_info = final_state["__interrupt__"][0] if final_state["__interrupt__"] else None
+                yield "interrupt", {
+                    "thread_id": thread_id,
+                    "status": "awaiting_approval",
+                    "interrupt_data": getattr(interrupt_info, "value", interrupt_info),
+                    "metadata": run_metadata(metrics, final_state, deadline_key),
+                }
+            else:
+                final_messages = final_state.get("messages") or []
+                final_content = getattr(final_messages[-1], "content", "") if final_messages else ""
+                yield "complete", {
+                    "thread_id": thread_id,
+                    "status": "completed",
+                    "content": final_content,
+                    "metadata": run_metadata(metrics, final_state, deadline_key),
+                }
+        run_deadlines.close(deadline_key)
+        yield "end", {}
+
+
+async def graph_run_events(
+    request: Optional[Request],
+    graph: Any,
+    graph_input: Any,
+    config: Dict[str, Any],
+    *,
+    thread_id: str,
+    **kwargs: Any,
+) -> AsyncIterator[Tuple[str, Dict[str, Any]]]:
+    """
+    Run the graph under a scheduler slot and yield its (event, payload) pairs
+
+    Tokens from the report-writing nodes are coalesced into ``token`` events;
+    the run ends with an ``interrupt`` or ``complete`` event (or ``error``)
+    followed by ``end``. Detached runs (coalesced streams, jobs) ignore client
+    disconnects; jobs pass no request. Every event is also published to the
+    thread's followers.
+    """
+    async with aclosing(_run_events(request, graph, graph_input, config, thread_id=thread_id, **kwargs)) as events:
+        async for event_type, payload in events:
+            thread_streams.publish(thread_id, event_type, payload)
+            yield event_type, payload
+
+
+def publish_result(thread_id: str) -> Callable[[Callable[[], Awaitable[Dict[str, Any]]]], Callable[[], Awaitable[Dict[str, Any]]]]:
+    """Decorate a synchronous run so its final response reaches the thread's followers like a streamed run's."""
+    def decorate(run: Callable[[], Awaitable[Dict[str, Any]]]) -> Callable[[], Awaitable[Dict[str, Any]]]:
+        async def execute() -> Dict[str, Any]:
+            response = await run()
+            payload = {key: value for key, value in response.items() if key != "type"}
+            thread_streams.publish(thread_id, response["type"], payload)
+            thread_streams.publish(thread_id, "end", {})
+            return response
+        return execute
+    return decorate
+
+
+async def stream_graph_run(request: Optional[Request], graph: Any, graph_input: Any, config: Dict[str, Any], **kwargs: Any) -> AsyncIterator[str]:
+    """SSE frames of graph_run_events (same arguments)."""
+    async with aclosing(graph_run_events(request, graph, graph_input, config, **kwargs)) as events:
+        async for event_type, payload in events:
+            yield sse_frame(event_type, payload)
+
+
+def job_accepted(
+    request: Request,
+    response: Response,
+    kind: str,
+    thread_id: str,
+    start: Callable[[], AsyncIterator[Tuple[str, Dict[str, Any]]]],
+    key: Optional[str] = None,
+    deadline_key: Optional[str] = None,
+) -> Dict[str, Any]:
+    """Submit a detached run and build the 202 body pointing at its status, SSE and WebSocket URLs."""
+    job, deduplicated = run_jobs.submit(kind, thread_id, start, key=key)
+    if deduplicated:
+        # This request's own deadline was never used; the existing job's applies
+        run_deadlines.close(deadline_key)
+    status_url = request.app.url_path_for("job_status_endpoint", job_id=job.id)
+    response.status_code = 202
+    response.headers["Location"] = status_url
+    return {
+        **job.describe(),
+        "deduplicated": deduplicated,
+        "status_url": status_url,
+        "events_url": request.app.url_path_for("job_events_endpoint", job_id=job.id),
+        "websocket_url": request.app.url_path_for("job_websocket_endpoint", job_id=job.id),
+    }
+
+
 class EventInput(BaseModel):
     """Event input for margin check operations."""
     messages: Optional[List[Dict[str, Any]]] = Field(default=None, description="Optional messages list")
     thread_id: Optional[str] = Field(default=None, description="Thread ID for conversation continuity")
     eventType: Optional[str] = Field(default=None, description="Event type for automated alerts")
     payload: Optional[Dict[str, Any]] = Field(default=None, description="Event payload data")
+    idempotencyKey: Optional[str] = Field(default=None, description="Duplicate requests with the same key attach to one run")
+    timeoutSeconds: Optional[float] = Field(default=None, description="Time the caller will wait; nodes degrade to cached data or template reports to meet it")
 
 
 class HistoryInput(BaseModel):
     """Input for history retrieval operations."""
     thread_id: str = Field(description="Thread ID to retrieve history for")
+    limit: Optional[int] = Field(default=None, description="Page size (default HISTORY_PAGE_SIZE, capped at HISTORY_MAX_PAGE_SIZE)")
+    before: Optional[str] = Field(default=None, description="Cursor: return checkpoints older than this checkpoint_id (next_cursor of the previous page)")
+    fields: Optional[List[str]] = Field(default=None, description="Field groups to include: metadata, messages, intentContext, values, tasks (default all)")
+
+
+class ExportInput(BaseModel):
+    """Input for history exports (at least one selector is required)."""
+    thread_id: Optional[str] = Field(default=None, description="Export a single thread")
+    thread_ids: Optional[List[str]] = Field(default=None, description="Export these threads")
+    since: Optional[datetime] = Field(default=None, description="Only checkpoints created at or after this time (UTC when no offset)")
+    until: Optional[datetime] = Field(default=None, description="Only checkpoints created before this time (UTC when no offset)")
+    gzip: bool = Field(default=False, description="Compress the NDJSON stream with gzip")
 
 
 class MarginCheckResponse(BaseModel):
@@ -39,8 +224,9 @@ class MarginCheckResponse(BaseModel):
 
 
 @router.post("/margin-check")
-async def margin_check_endpoint(request: Request, body: EventInput, stream: bool = False):
-    """Execute margin check analysis with human-in-the-loop approval."""
+async def margin_check_endpoint(request: Request, response: Response, body: EventInput, stream: bool = False, job: bool = False):
+    """Execute margin check analysis with human-in-the-loop approval (``job=true`` answers 202 and runs detached)."""
+    deadline_key = None
     try:
         graph = request.app.state.graph
         
@@ -65,8 +251,10 @@ async def margin_check_endpoint(request: Request, body: EventInput, stream: bool
             
             initial_state = {
                 "messages": messages,
-                "intentContext": intent_context
+                "intentContext": intent_context,
+                "eventType": "MARGIN_ALERT"
             }
+            priority = "alert"
         else:
             # Regular message processing
             if body.messages:
@@ -80,134 +268,144 @@ async def margin_check_endpoint(request: Request, body: EventInput, stream: bool
                 messages = [HumanMessage(content="请生成当前LP账户的保证金水平报告和建议")]
             
             initial_state = {
-                "messages": messages
+                "messages": messages,
+                "eventType": None
             }
+            priority = "chat"
+        
+        # Duplicate alerts and client retries attach to one run (idempotency key, else LP + payload hash)
+        if body.idempotencyKey:
+            coalesce_key = f"margin-check:{body.idempotencyKey}"
+        elif priority == "alert":
+            coalesce_key = f"alert:{snapshot_key(lp_name, body.payload)}"
+        else:
+            coalesce_key = None
         
         # Use provided thread_id or generate new one
         thread_id = body.thread_id or f"margin_check_{hash(str(messages))}"
-        config = {"configurable": {"thread_id": thread_id}}
+        metrics = RunMetricsCallback(thread_id=thread_id)
+        timeout = request_timeout(request, body)
+        
+        if stream and coalesce_key:
+            attached = run_coalescer.attach_stream(coalesce_key)
+            if attached is not None:
+                return StreamingResponse(attached, media_type="text/event-stream")
+        
+        # The deadline starts now, so time spent queued for a run slot counts against it
+        deadline_key = run_deadlines.open(timeout)
+        config = {"configurable": {
+            "thread_id": thread_id,
+            "idempotency_key": coalesce_key,
+            DEADLINE_CONFIG['CONFIG_KEY']: deadline_key,
+        }, "callbacks": [metrics]}
         
+        if job:
+            # Shed before accepting so overloaded callers get a 429, not a failed job
+            run_scheduler.check_admission(priority)
+            return job_accepted(
+                request, response, "margin-check", thread_id,
+                lambda: graph_run_events(
+                    None, graph, initial_state, config,
+                    thread_id=thread_id, priority=priority, metrics=metrics, deadline_key=deadline_key,
+                ),
+                key=coalesce_key, deadline_key=deadline_key,
+            )
+
         if stream:
-            def format_sse(event_type: str, payload: Dict[str, Any]) -> str:
-                return f"event: {event_type}\ndata: {json.dumps(payload, ensure_ascii=False)}\n\n"
-
-            async def event_generator():
-                final_state = None
-                try:
-                    async for event in graph.astream_events(initial_state, config=config, version="v1"):
-                        if await request.is_disconnected():
-                            break
-
-                        event_type = event.get("event")
-                        data = event.get("data", {})
-
-                        if event_type == "on_chat_model_stream":
-                            chunk = data.get("chunk")
-                            text = ""
-                            if chunk is not None:
-                                # Langchain chunk objects expose content/message/text depending on backend
-                                chunk_content = getattr(chunk, "content", None)
-                                if chunk_content:
-                                    if isinstance(chunk_content, list):
-                                        text = "".join(part.get("text", "") for part in chunk_content if isinstance(part, dict))
-                                    else:
-                                        text = str(chunk_content)
-                                elif getattr(chunk, "message", None) and getattr(chunk.message, "content", None):
-                                    text = chunk.message.content
-                                elif hasattr(chunk, "text"):
-                                    text = str(chunk.text)
-                            if text:
-                                yield format_sse("token", {"thread_id": thread_id, "content": text})
-                        elif event_type == "on_chain_end" and event.get("name") == "graph":
-                            final_state = data.get("output")
-                except Exception as exc:
-                    logger.error(f"Streaming error: {exc}")
-                    yield format_sse("error", {"thread_id": thread_id, "error": str(exc)})
-                finally:
-                    if final_state:
-                        if "__interrupt__" in final_state:
-                            interrupt_info = final_state["__interrupt__"][0] if final_state["__interrupt__"] else None
-                            yield format_sse(
-                                "interrupt",
-                                {
-                                    "thread_id": thread_id,
-                                    "status": "awaiting_approval",
-                                    "interrupt_data": getattr(interrupt_info, "value", interrupt_info),
-                                },
-                            )
-                        else:
-                            final_messages = final_state.get("messages") or []
-                            final_content = ""
-                            if final_messages:
-                                last_msg = final_messages[-1]
-                                final_content = getattr(last_msg, "content", "")
-                            yield format_sse(
-                                "complete",
-                                {
-                                    "thread_id": thread_id,
-                                    "status": "completed",
-                                    "content": final_content,
-                                },
-                            )
-                    yield "event: end\ndata: {}\n\n"
-
-            return StreamingResponse(event_generator(), media_type="text/event-stream")
-
-        # Use ainvoke for simpler implementation
-        try:
-            logger.info(f"Invoking graph with initial_state: {initial_state}")
-            result = await graph.ainvoke(initial_state, config=config)
+            # Shed before the stream opens so overloaded callers get a 429, not an SSE error
+            run_scheduler.check_admission(priority)
+
+            events = stream_graph_run(
+                request, graph, initial_state, config,
+                thread_id=thread_id, priority=priority, metrics=metrics,
+                coalesce_key=coalesce_key, deadline_key=deadline_key,
+            )
+            if coalesce_key:
+                events = run_coalescer.start_stream(coalesce_key, events)
+            return StreamingResponse(events, media_type="text/event-stream")
+
+        @publish_result(thread_id)
+        async def execute_run() -> Dict[str, Any]:
+            # Wait for a run slot (MARGIN_ALERT > recheck > chat); raises RunRejected when shed
+            ticket = await run_scheduler.acquire(priority)
+            try:
+                logger.info(f"Invoking graph with initial_state: {initial_state}")
+                result = await graph.ainvoke(initial_state, config=config)
             
-            # Check if there's an interrupt
-            if "__interrupt__" in result:
-                interrupt_info = result["__interrupt__"][0] if result["__interrupt__"] else None
+                # Check if there's an interrupt
+                if "__interrupt__" in result:
+                    interrupt_info = result["__interrupt__"][0] if result["__interrupt__"] else None
                 
+                    response = {
+                        "type": "interrupt",
+                        "status": "awaiting_approval",
+                        "interrupt_data": interrupt_info.value if interrupt_info else None,
+                        "thread_id": thread_id,
+                        "metadata": run_metadata(metrics, result, deadline_key)
+                    }
+                    return response
+            
+                # Extract final message content
+                final_content = ""
+                if "messages" in result and result["messages"]:
+                    final_content = result["messages"][-1].content if hasattr(result["messages"][-1], 'content') else ""
+            
                 response = {
-                    "type": "interrupt",
-                    "status": "awaiting_approval",
-                    "interrupt_data": interrupt_info.value if interrupt_info else None,
-                    "thread_id": thread_id
+                    "type": "complete",
+                    "status": "completed",
+                    "content": final_content,
+                    "thread_id": thread_id,
+                    "metadata": run_metadata(metrics, result, deadline_key)
                 }
                 return response
             
-            # Extract final message content
-            final_content = ""
-            if "messages" in result and result["messages"]:
-                final_content = result["messages"][-1].content if hasattr(result["messages"][-1], 'content') else ""
-            
-            response = {
-                "type": "complete",
-                "status": "completed",
-                "content": final_content,
-                "thread_id": thread_id
-            }
+            except Exception as e:
+                logger.error(f"Error in graph execution: {e}")
+                return {
+                    "type": "error",
+                    "status": "error",
+                    "error": str(e),
+                    "thread_id": thread_id,
+                    "metadata": run_metadata(metrics, None, deadline_key)
+                }
+            finally:
+                run_scheduler.release(ticket)
+                run_deadlines.close(deadline_key)
+
+        if coalesce_key:
+            response, coalesced = await run_coalescer.run(coalesce_key, execute_run, is_failed_response)
+            if coalesced:
+                # This request's own deadline was never used; the shared run's metadata applies
+                run_deadlines.close(deadline_key)
+                return {**response, "coalesced": True}
             return response
-            
-        except Exception as e:
-            logger.error(f"Error in graph execution: {e}")
-            return {
-                "type": "error",
-                "status": "error",
-                "error": str(e),
-                "thread_id": thread_id
-            }
-        
+        return await execute_run()
         
+    except RunRejected as e:
+        run_deadlines.close(deadline_key)
+        raise overloaded_error(e)
+    except HTTPException:
+        raise
     except Exception as e:
         logger.error(f"Margin check endpoint error: {str(e)}", exc_info=True)
         raise HTTPException(status_code=500, detail=f"Internal server error: {str(e)}")
 
 
 @router.post("/margin-check/recheck")
-async def margin_recheck_endpoint(request: Request, body: EventInput, stream: bool = False):
-    """Resume margin check conversation after human approval."""
+async def margin_recheck_endpoint(request: Request, response: Response, body: EventInput, stream: bool = False, job: bool = False):
+    """Resume margin check conversation after human approval (``job=true`` answers 202 and runs detached)."""
+    deadline_key = None
     try:
         graph = request.app.state.graph
         
         if not body.thread_id:
             raise HTTPException(status_code=400, detail="thread_id is required for recheck")
         
-        config = {"configurable": {"thread_id": body.thread_id}}
+        # Client retries carrying the same idempotency key attach to one run
+        coalesce_key = f"recheck:{body.thread_id}:{body.idempotencyKey}" if body.idempotencyKey else None
+        metrics = RunMetricsCallback(thread_id=body.thread_id)
+        timeout = request_timeout(request, body)
+        priority = "recheck"
         
         # Determine user input for resuming
         user_input = HumanMessage(content="再次生成实时的保证金分析和建议")  # Default prompt to continue analysis
@@ -218,126 +416,177 @@ async def margin_recheck_endpoint(request: Request, body: EventInput, stream: bo
         #             user_input = msg.get("content", "")
         #             break
         
+        if stream and coalesce_key:
+            attached = run_coalescer.attach_stream(coalesce_key)
+            if attached is not None:
+                return StreamingResponse(attached, media_type="text/event-stream")
+        
+        # The deadline starts now, so time spent queued for a run slot counts against it
+        deadline_key = run_deadlines.open(timeout)
+        config = {"configurable": {
+            "thread_id": body.thread_id,
+            "idempotency_key": coalesce_key,
+            DEADLINE_CONFIG['CONFIG_KEY']: deadline_key,
+        }, "callbacks": [metrics]}
+        
+        if job:
+            # Shed before accepting so overloaded callers get a 429, not a failed job
+            run_scheduler.check_admission(priority)
+            return job_accepted(
+                request, response, "recheck", body.thread_id,
+                lambda: graph_run_events(
+                    None, graph, Command(resume=user_input), config,
+                    thread_id=body.thread_id, priority=priority, metrics=metrics, deadline_key=deadline_key,
+                ),
+                key=coalesce_key, deadline_key=deadline_key,
+            )
+
         if stream:
-            def format_sse(event_type: str, payload: Dict[str, Any]) -> str:
-                return f"event: {event_type}\ndata: {json.dumps(payload, ensure_ascii=False)}\n\n"
-
-            async def event_generator():
-                final_state = None
-                try:
-                    async for event in graph.astream_events(Command(resume=user_input), config=config, version="v1"):
-                        if await request.is_disconnected():
-                            break
-
-                        event_type = event.get("event")
-                        data = event.get("data", {})
-
-                        if event_type == "on_chat_model_stream":
-                            chunk = data.get("chunk")
-                            text = ""
-                            if chunk is not None:
-                                chunk_content = getattr(chunk, "content", None)
-                                if chunk_content:
-                                    if isinstance(chunk_content, list):
-                                        text = "".join(part.get("text", "") for part in chunk_content if isinstance(part, dict))
-                                    else:
-                                        text = str(chunk_content)
-                                elif getattr(chunk, "message", None) and getattr(chunk.message, "content", None):
-                                    text = chunk.message.content
-                                elif hasattr(chunk, "text"):
-                                    text = str(chunk.text)
-                            if text:
-                                yield format_sse("token", {"thread_id": body.thread_id, "content": text})
-                        elif event_type == "on_chain_end" and event.get("name") == "graph":
-                            final_state = data.get("output")
-                except Exception as exc:
-                    logger.error(f"Streaming error during recheck: {exc}")
-                    yield format_sse("error", {"thread_id": body.thread_id, "error": str(exc)})
-                finally:
-                    if final_state:
-                        if "__interrupt__" in final_state:
-                            interrupt_info = final_state["__interrupt__"][0] if final_state["__interrupt__"] else None
-                            yield format_sse(
-                                "interrupt",
-                                {
-                                    "thread_id": body.thread_id,
-                                    "status": "awaiting_approval",
-                                    "interrupt_data": getattr(interrupt_info, "value", interrupt_info),
-                                },
-                            )
-                        else:
-                            final_messages = final_state.get("messages") or []
-                            final_content = ""
-                            if final_messages:
-                                last_msg = final_messages[-1]
-                                final_content = getattr(last_msg, "content", "")
-                            yield format_sse(
-                                "complete",
-                                {
-                                    "thread_id": body.thread_id,
-                                    "status": "completed",
-                                    "content": final_content,
-                                },
-                            )
-                    yield "event: end\ndata: {}\n\n"
-
-            return StreamingResponse(event_generator(), media_type="text/event-stream")
-
-        # Use ainvoke for simpler implementation
-        try:
-            result = await graph.ainvoke(Command(resume=user_input), config=config)
+            # Shed before the stream opens so overloaded callers get a 429, not an SSE error
+            run_scheduler.check_admission(priority)
+
+            events = stream_graph_run(
+                request, graph, Command(resume=user_input), config,
+                thread_id=body.thread_id, priority=priority, metrics=metrics,
+                coalesce_key=coalesce_key, deadline_key=deadline_key,
+            )
+            if coalesce_key:
+                events = run_coalescer.start_stream(coalesce_key, events)
+            return StreamingResponse(events, media_type="text/event-stream")
+
+        @publish_result(body.thread_id)
+        async def execute_run() -> Dict[str, Any]:
+            # Wait for a run slot (MARGIN_ALERT > recheck > chat); raises RunRejected when shed
+            ticket = await run_scheduler.acquire(priority)
+            try:
+                result = await graph.ainvoke(Command(resume=user_input), config=config)
             
-            # Check if there's an interrupt
-            # As long as there's an interrupt, we return supervisor 
-            if "__interrupt__" in result:
-                interrupt_info = result["__interrupt__"][0] if result["__interrupt__"] else None
+                # Check if there's an interrupt
+                # As long as there's an interrupt, we return supervisor 
+                if "__interrupt__" in result:
+                    interrupt_info = result["__interrupt__"][0] if result["__interrupt__"] else None
                 
+                    response = {
+                        "type": "interrupt",
+                        "status": "awaiting_approval",
+                        "interrupt_data": interrupt_info.value if interrupt_info else None,
+                        "thread_id": body.thread_id,
+                        "metadata": run_metadata(metrics, result, deadline_key)
+                    }
+                    return response
+            
+                # Extract final message content
+                final_content = ""
+                if "messages" in result and result["messages"]:
+                    final_content = result["messages"][-1].content if hasattr(result["messages"][-1], 'content') else ""
+            
                 response = {
-                    "type": "interrupt",
-                    "status": "awaiting_approval",
-                    "interrupt_data": interrupt_info.value if interrupt_info else None,
-                    "thread_id": body.thread_id
+                    "type": "complete",
+                    "status": "completed",
+                    "content": final_content,
+                    "thread_id": body.thread_id,
+                    "metadata": run_metadata(metrics, result, deadline_key)
                 }
                 return response
             
-            # Extract final message content
-            final_content = ""
-            if "messages" in result and result["messages"]:
-                final_content = result["messages"][-1].content if hasattr(result["messages"][-1], 'content') else ""
-            
-            response = {
-                "type": "complete",
-                "status": "completed",
-                "content": final_content,
-                "thread_id": body.thread_id
-            }
+            except Exception as e:
+                logger.error(f"Error in recheck execution: {e}")
+                return {
+                    "type": "error",
+                    "status": "error",
+                    "error": str(e),
+                    "thread_id": body.thread_id,
+                    "metadata": run_metadata(metrics, None, deadline_key)
+                }
+            finally:
+                run_scheduler.release(ticket)
+                run_deadlines.close(deadline_key)
+
+        if coalesce_key:
+            response, coalesced = await run_coalescer.run(coalesce_key, execute_run, is_failed_response)
+            if coalesced:
+                # This request's own deadline was never used; the shared run's metadata applies
+                run_deadlines.close(deadline_key)
+                return {**response, "coalesced": True}
             return response
-            
-        except Exception as e:
-            logger.error(f"Error in recheck execution: {e}")
-            return {
-                "type": "error",
-                "status": "error",
-                "error": str(e),
-                "thread_id": body.thread_id
-            }
-        
+        return await execute_run()
         
+    except RunRejected as e:
+        run_deadlines.close(deadline_key)
+        raise overloaded_error(e)
+    except HTTPException:
+        raise
     except Exception as e:
         logger.error(f"Margin recheck endpoint error: {str(e)}")
         raise HTTPException(status_code=500, detail=f"Internal server error: {str(e)}")
 
 
+@router.get("/jobs/{job_id}")
+async def job_status_endpoint(job_id: str, wait: float = 0):
+    """Status and, once finished, result of a job; ``wait`` long-polls up to that many seconds."""
+    job = run_jobs.get(job_id)
+    if job is None:
+        raise HTTPException(status_code=404, detail="Job not found or expired")
+    await run_jobs.wait(job, wait)
+    return job.describe()
+
+
+@router.get("/jobs/{job_id}/events")
+async def job_events_endpoint(job_id: str):
+    """SSE replay of a job's events so far, then live until it finishes."""
+    job = run_jobs.get(job_id)
+    if job is None:
+        raise HTTPException(status_code=404, detail="Job not found or expired")
+
+    async def frames() -> AsyncIterator[str]:
+        async for event_type, payload in run_jobs.follow(job):
+            yield sse_frame(event_type, payload)
+
+    return StreamingResponse(frames(), media_type="text/event-stream")
+
+
+@router.websocket("/jobs/{job_id}/ws")
+async def job_websocket_endpoint(websocket: WebSocket, job_id: str):
+    """WebSocket replay of a job's events as {"event", "data"} messages; closes after ``end``."""
+    job = run_jobs.get(job_id)
+    if job is None:
+        await websocket.close(code=4404, reason="Job not found or expired")
+        return
+    await websocket.accept()
+    try:
+        async for event_type, payload in run_jobs.follow(job):
+            await websocket.send_text(orjson.dumps({"event": event_type, "data": payload}, default=str).decode("utf-8"))
+        await websocket.close()
+    except WebSocketDisconnect:
+        # The job keeps running; the client can resubscribe or poll
+        pass
+
+
+@router.get("/threads/{thread_id}/events")
+async def thread_events_endpoint(thread_id: str):
+    """SSE of every run on a thread while connected (token, interrupt, complete, error, end)."""
+
+    async def frames() -> AsyncIterator[str]:
+        async with aclosing(thread_streams.follow(thread_id)) as events:
+            async for event in events:
+                # Idle keepalive so proxies keep the connection and dead clients are noticed
+                yield sse_frame(*event) if event is not None else ": keepalive\n\n"
+
+    return StreamingResponse(frames(), media_type="text/event-stream")
+
+
 @router.post("/margin-check/history")
 async def margin_check_history_endpoint(request: Request, body: HistoryInput):
-    """Retrieve execution history for a margin check thread."""
+    """Retrieve one page of execution history for a margin check thread."""
     try:
         graph = request.app.state.graph
         
         if not body.thread_id:
             raise HTTPException(status_code=400, detail="thread_id is required")
-        
-        config = {"configurable": {"thread_id": body.thread_id}}
+        try:
+            fields = parse_fields(body.fields)
+        except ValueError as e:
+            raise HTTPException(status_code=400, detail=str(e))
         
         # Get the checkpointer from the graph
         checkpointer = graph.checkpointer
@@ -345,169 +594,33 @@ async def margin_check_history_endpoint(request: Request, body: HistoryInput):
             raise HTTPException(status_code=500, detail="Checkpointer not available")
         
         try:
-            # Get checkpoint history using the proper async method
-            history_steps = []
-            
-            # Use graph.aget_state_history() for async access to state history
-            async for state_snapshot in graph.aget_state_history(config):
-                step_data = {
-                    "checkpoint_id": state_snapshot.config.get("configurable", {}).get("checkpoint_id"),
-                    "step": state_snapshot.metadata.get("step", 0),
-                    "source": state_snapshot.metadata.get("source", "unknown"),
-                    "writes": state_snapshot.metadata.get("writes", {}),
-                    "created_at": state_snapshot.created_at.isoformat() if state_snapshot.created_at and hasattr(state_snapshot.created_at, 'isoformat') else str(state_snapshot.created_at) if state_snapshot.created_at else None,
-                    "values": {},
-                    "next": list(state_snapshot.next) if state_snapshot.next else [],
-                    "tasks": [],
-                    "parent_config": state_snapshot.parent_config
-                }
-                
-                # Extract state values
-                if state_snapshot.values:
-                    for key, value in state_snapshot.values.items():
-                        if key == "messages" and value:
-                            # Format messages for readability
-                            messages_data = []
-                            for msg in value:
-                                if hasattr(msg, 'content') and hasattr(msg, 'type'):
-                                    # Parse JSON content for tool messages
-                                    content = msg.content
-                                    parsed_content = None
-                                    if msg.type == "tool" and content:
-                                        try:
-                                            parsed_content = json.loads(content)
-                                        except (json.JSONDecodeError, TypeError):
-                                            parsed_content = None
-                                    
-                                    msg_data = {
-                                        "type": msg.type,
-                                        "content": content[:300] + "..." if len(str(content)) > 300 else content,
-                                        "parsed_content": parsed_content,
-                                        "name": getattr(msg, 'name', None),
-                                        "additional_kwargs": getattr(msg, 'additional_kwargs', {})
-                                    }
-                                    messages_data.append(msg_data)
-                                else:
-                                    messages_data.append(str(msg)[:300] + "..." if len(str(msg)) > 300 else str(msg))
-                            step_data["values"]["messages"] = messages_data
-                        elif key == "intentContext" and value:
-                            # Parse intentContext string into structured data
-                            try:
-                                # Parse the intentContext string format
-                                context_parts = {}
-                                if isinstance(value, str):
-                                    import re
-                                    # Use regex to match key=value pairs, handling quoted values
-                                    pattern = r"(\w+)=('[^']*'|\"[^\"]*\"|[^\s]+)"
-                                    matches = re.findall(pattern, value)
-                                    
-                                    for k, v in matches:
-                                        # Remove quotes
-                                        v = v.strip("'\"")
-                                        
-                                        # Parse values
-                                        if v == 'None':
-                                            v = None
-                                        elif v.lower() == 'true':
-                                            v = True
-                                        elif v.lower() == 'false':
-                                            v = False
-                                        elif v.replace('.', '').replace('-', '').isdigit():
-                                            v = float(v) if '.' in v else int(v)
-                                        elif v.startswith('{') and v.endswith('}'):
-                                            try:
-                                                v = json.loads(v.replace("'", '"'))
-                                            except:
-                                                pass
-                                        
-                                        context_parts[k] = v
-                                
-                                step_data["values"][key] = context_parts if context_parts else value
-                            except Exception:
-                                # Fallback to string if parsing fails
-                                value_str = str(value)
-                                step_data["values"][key] = value_str[:500] + "..." if len(value_str) > 500 else value_str
-                        else:
-                            # For other state values, truncate if too long
-                            value_str = str(value)
-                            step_data["values"][key] = value_str[:500] + "..." if len(value_str) > 500 else value_str
-
-                # Extract task information with detailed interrupt data
-                if state_snapshot.tasks:
-                    for task in state_snapshot.tasks:
-                        task_info = {
-                            "id": task.id,
-                            "name": task.name,
-                            "error": str(task.error) if task.error else None,
-                            "interrupts": []
-                        }
-                        
-                        # Parse interrupt data for better readability
-                        if task.interrupts:
-                            for interrupt in task.interrupts:
-                                # Handle different interrupt object types
-                                if hasattr(interrupt, 'id') and hasattr(interrupt, 'value'):
-                                    interrupt_data = {
-                                        "id": interrupt.id,
-                                        "value": interrupt.value
-                                    }
-                                elif isinstance(interrupt, dict):
-                                    interrupt_data = {
-                                        "id": interrupt.get("id"),
-                                        "value": interrupt.get("value", {})
-                                    }
-                                else:
-                                    # Fallback for unknown interrupt types
-                                    interrupt_data = {
-                                        "id": str(getattr(interrupt, 'id', 'unknown')),
-                                        "value": str(interrupt)
-                                    }
-                                task_info["interrupts"].append(interrupt_data)
-                        
-                        step_data["tasks"].append(task_info)
-                
-                # Extract node information from writes
-                if state_snapshot.metadata.get("writes"):
-                    step_data["executed_nodes"] = list(state_snapshot.metadata["writes"].keys())
-                else:
-                    step_data["executed_nodes"] = []
-                
-                history_steps.append(step_data)
+            # Only this page (limit + 1 rows before the cursor) is read from the checkpointer
+            page = await read_history_page(graph, body.thread_id, limit=body.limit, before=body.before, fields=fields)
+            history_steps = page["steps"]
             
-            # Sort by step number for chronological order (ascending - earliest first)
-            history_steps.sort(key=lambda x: x["step"])
-            
-            # Calculate summary statistics
+            # Summary statistics cover the returned page
             total_steps = len(history_steps)
-            completed_steps = sum(1 for step in history_steps if step["source"] != "input")
-            pending_steps = total_steps - completed_steps
-            
-            # Get executed nodes from all steps
-            all_executed_nodes = []
-            for step in history_steps:
-                if step.get("executed_nodes"):
-                    all_executed_nodes.extend(step["executed_nodes"])
-            
-            # Get latest timestamp
-            latest_timestamp = None
-            if history_steps:
-                latest_step = max(history_steps, key=lambda x: x["step"])
-                latest_timestamp = latest_step.get("created_at")
+            summary = {
+                "total_steps": total_steps,
+                "latest_timestamp": history_steps[-1]["created_at"] if history_steps else None,
+            }
+            if "metadata" in fields:
+                completed_steps = sum(1 for step in history_steps if step["source"] != "input")
+                summary.update({
+                    "completed_steps": completed_steps,
+                    "pending_steps": total_steps - completed_steps,
+                    "executed_nodes": sorted({node for step in history_steps for node in step["executed_nodes"]}),
+                })
             
             return {
                 "thread_id": body.thread_id,
-                "summary": {
-                    "total_steps": total_steps,
-                    "completed_steps": completed_steps,
-                    "pending_steps": pending_steps,
-                    "executed_nodes": list(set(all_executed_nodes)),
-                    "latest_timestamp": latest_timestamp
-                },
+                "summary": summary,
                 "execution_history": history_steps,
+                "next_cursor": page["next_cursor"],
+                "has_more": page["next_cursor"] is not None,
                 "status": "success"
             }
             
-            
         except Exception as e:
             logger.error(f"Error retrieving checkpoint history: {e}")
             return {
@@ -516,6 +629,80 @@ async def margin_check_history_endpoint(request: Request, body: HistoryInput):
                 "status": "error"
             }
         
+    except HTTPException:
+        raise
     except Exception as e:
         logger.error(f"History endpoint error: {str(e)}")
         raise HTTPException(status_code=500, detail=f"Internal server error: {str(e)}")
+
+
+@router.post("/margin-check/export")
+async def margin_check_export_endpoint(request: Request, body: ExportInput):
+    """Stream checkpoints and messages of one thread, a list of threads or a time range as NDJSON."""
+    checkpointer = request.app.state.graph.checkpointer
+    if not checkpointer:
+        raise HTTPException(status_code=500, detail="Checkpointer not available")
+
+    if body.thread_id or body.thread_ids:
+        thread_ids = ([body.thread_id] if body.thread_id else []) + list(body.thread_ids or [])
+    elif body.since or body.until:
+        thread_ids = None  # every thread with checkpoints in the range
+    else:
+        raise HTTPException(status_code=400, detail="thread_id, thread_ids or a since/until range is required")
+
+    content = export_lines(export_records(checkpointer, thread_ids, since=body.since, until=body.until))
+    filename = f"margin-check-history-{datetime.now().strftime('%Y%m%dT%H%M%S')}.ndjson"
+    if body.gzip:
+        return StreamingResponse(
+            gzip_chunks(content),
+            media_type="application/gzip",
+            headers={"Content-Disposition": f'attachment; filename="{filename}.gz"'},
+        )
+    return StreamingResponse(
+        content,
+        media_type="application/x-ndjson",
+        headers={"Content-Disposition": f'attachment; filename="{filename}"'},
+    )
+
+
+@router.get("/stats")
+async def agent_stats_endpoint(request: Request):
+    """Report runtime statistics for the agent pipeline."""
+    from src.agent.intent_router import intent_router
+    from src.agent.llm_registry import ModelRegistry
+    from src.agent.cache import intent_cache, report_cache
+    from src.agent.prefetch import snapshot_prefetcher
+    from src.agent.model_cascade import cascade_stats
+    from src.agent.run_guard import run_guards
+    from src.agent.prompts import prompt_budget_stats
+
+    return {
+        "intent_router": intent_router.stats(),
+        "intent_cache": intent_cache.stats(),
+        "report_cache": report_cache.stats(),
+        "snapshot_prefetch": snapshot_prefetcher.stats(),
+        "llm_registry": ModelRegistry.stats(),
+        "model_cascade": cascade_stats.stats(),
+        "run_guard": run_guards.stats(),
+        "scheduler": run_scheduler.stats(),
+        "coalescer": run_coalescer.stats(),
+        "deadlines": run_deadlines.stats(),
+        "jobs": run_jobs.stats(),
+        "thread_streams": thread_streams.stats(),
+        "prompts": prompt_budget_stats.stats(),
+        "instrumentation": run_metrics_registry.stats(),
+        "startup": getattr(request.app.state, "startup_metrics", None),
+        "status": "success"
+    }
+
+
+@router.get("/metrics")
+async def agent_metrics_endpoint(trace_id: Optional[str] = None, thread_id: Optional[str] = None):
+    """Report per-node latency and token metrics, optionally with the recent runs for a traceId or thread."""
+    response = {
+        "aggregate": run_metrics_registry.stats(),
+        "status": "success"
+    }
+    if trace_id or thread_id:
+        response["runs"] = run_metrics_registry.find(trace_id=trace_id, thread_id=thread_id)
+    return response
@@ -0,0 +1,207 @@
+"""
+Streaming NDJSON (optionally gzip) export of thread histories.
+
+Compliance exports used to mean one history request per thread, each built
+in memory. The export walks the checkpointer directly and writes records as
+they are read:
+- One thread, a list of threads, or every thread with checkpoints in a time
+  range (checkpoint ids are time-ordered UUIDv6, so the range becomes an id
+  range the database can filter on)
+- Checkpoints are read ``EXPORT_PAGE_SIZE`` at a time with ``limit``/``before``
+  (AsyncPostgresSaver fetches whole result sets, so paging is what bounds
+  memory), and encoded lines are flushed in ``EXPORT_CHUNK_BYTES`` chunks
+- Each version of a message is exported once per thread (``message_to_dict``
+  form, full content), from the newest checkpoint that contains it; a message
+  rewritten in place under the same id (e.g. a compacted tool output) is
+  exported both as rewritten and as originally stored
+- State values are exported as full JSON (no display truncation)
+
+Record types (``record`` field): ``checkpoint``, ``message``, ``error``.
+
+Contains:
+- CONFIG, checkpoint_id_at, export_value
+- export_records: record dictionaries for the requested threads
+- export_lines / gzip_chunks: NDJSON encoding and streaming gzip
+"""
+
+import os
+import zlib
+import logging
+from datetime import datetime, timezone
+from typing import Any, AsyncIterator, Dict, Iterable, Optional
+
+import orjson
+from langchain_core.messages import BaseMessage, message_to_dict
+from langgraph.checkpoint.base.id import UUID
+from pydantic import BaseModel
+
+from src.db.checkpoints import list_thread_ids
+
+logger = logging.getLogger(__name__)
+
+# Configuration Settings
+CONFIG = {
+    # Checkpoints read from the checkpointer per query
+    'PAGE_SIZE': int(os.getenv("EXPORT_PAGE_SIZE", "20")),
+    # Encoded output is sent in chunks of about this size
+    'CHUNK_BYTES': int(os.getenv("EXPORT_CHUNK_BYTES", "65536")),
+    # gzip level for ``gzip=true`` exports
+    'GZIP_LEVEL': 6,
+}
+
+# 100-ns intervals between the UUID epoch (1582-10-15) and the Unix epoch
+_UUID_EPOCH_OFFSET = 0x01B21DD213814000
+# Upper bound for open-ended ranges (ids are lowercase hex)
+_MAX_CHECKPOINT_ID = "ffffffff-ffff-ffff-ffff-ffffffffffff"
+
+
+def checkpoint_id_at(moment: datetime) -> str:
+    """Smallest UUIDv6 checkpoint id at ``moment`` (naive datetimes are taken as UTC)."""
+    if moment.tzinfo is None:
+        moment = moment.replace(tzinfo=timezone.utc)
+    timestamp = int(moment.timestamp() * 10_000_000) + _UUID_EPOCH_OFFSET
+    uuid_int = ((timestamp >> 12) & 0xFFFFFFFFFFFF) << 80 | (timestamp & 0x0FFF) << 64
+    return str(UUID(int=uuid_int, version=6))
+
+
+def export_value(value: Any) -> Any:
+    """Full JSON form of a state value (models dumped, messages as ``message_to_dict``, containers recursed)."""
+    if isinstance(value, BaseMessage):
+        return message_to_dict(value)
+    if isinstance(value, BaseModel):
+        return value.model_dump(mode="json")
+    if isinstance(value, dict):
+        return {key: export_value(item) for key, item in value.items()}
+    if isinstance(value, (list, tuple, set)):
+        return [export_value(item) for item in value]
+    # Primitives, datetimes, dataclasses and UUIDs are encoded by orjson (anything else as str)
+    return value
+
+
+def _message_key(message: BaseMessage) -> tuple:
+    """Identity of one stored version of a message: id plus content hash."""
+    return message.id or message.type, hash(orjson.dumps(message.content, default=str))
+
+
+def _checkpoint_record(thread_id: str, item: Any) -> Dict[str, Any]:
+    checkpoint = item.checkpoint
+    metadata = item.metadata or {}
+    channel_values = checkpoint.get("channel_values") or {}
+    parent = (item.parent_config or {}).get("configurable", {})
+    return {
+        "record": "checkpoint",
+        "thread_id": thread_id,
+        "checkpoint_id": checkpoint["id"],
+        "parent_checkpoint_id": parent.get("checkpoint_id"),
+        "created_at": checkpoint.get("ts"),
+        "step": metadata.get("step"),
+        "source": metadata.get("source"),
+        "message_ids": [getattr(m, "id", None) for m in channel_values.get("messages") or ()],
+        "values": {
+            key: export_value(value)
+            for key, value in channel_values.items()
+            if key != "messages" and not key.startswith(("branch:", "__"))
+        },
+    }
+
+
+async def _thread_records(
+    checkpointer: Any,
+    thread_id: str,
+    after_id: Optional[str],
+    before_id: Optional[str],
+) -> AsyncIterator[Dict[str, Any]]:
+    """Records for one thread, newest checkpoint first, one page in memory at a time."""
+    config = {"configurable": {"thread_id": thread_id, "checkpoint_ns": ""}}
+    cursor = before_id
+    seen_messages = set()
+    while True:
+        before = {"configurable": {"checkpoint_id": cursor}} if cursor else None
+        page = [item async for item in checkpointer.alist(config, before=before, limit=CONFIG['PAGE_SIZE'])]
+        for item in page:
+            if after_id and item.checkpoint["id"] < after_id:
+                return
+            record = _checkpoint_record(thread_id, item)
+            yield record
+            for message in (item.checkpoint.get("channel_values") or {}).get("messages") or ():
+                if not isinstance(message, BaseMessage):
+                    continue
+                key = _message_key(message)
+                if key in seen_messages:
+                    continue
+                seen_messages.add(key)
+                yield {
+                    "record": "message",
+                    "thread_id": thread_id,
+                    "checkpoint_id": record["checkpoint_id"],
+                    "message": message_to_dict(message),
+                }
+        if len(page) < CONFIG['PAGE_SIZE']:
+            return
+        cursor = page[-1].checkpoint["id"]
+
+
+async def export_records(
+    checkpointer: Any,
+    thread_ids: Optional[Iterable[str]] = None,
+    since: Optional[datetime] = None,
+    until: Optional[datetime] = None,
+) -> AsyncIterator[Dict[str, Any]]:
+    """
+    Yield export records for the requested threads
+
+    Args:
+        checkpointer: Checkpoint saver of the graph
+        thread_ids: Threads to export; None exports every thread with checkpoints in [since, until)
+        since: Only checkpoints created at or after this time
+        until: Only checkpoints created before this time
+
+    Yields:
+        checkpoint / message records; a failing thread yields an error record and the export continues
+    """
+    after_id = checkpoint_id_at(since) if since else None
+    before_id = checkpoint_id_at(until) if until else None
+    if thread_ids is None:
+        thread_ids = list_thread_ids(
+            checkpointer,
+            after_id or "",
+            before_id or _MAX_CHECKPOINT_ID,
+        )
+
+    async def threads() -> AsyncIterator[str]:
+        if hasattr(thread_ids, "__aiter__"):
+            async for thread_id in thread_ids:
+                yield thread_id
+        else:
+            for thread_id in thread_ids:
+                yield thread_id
+
+    async for thread_id in threads():
+        try:
+            async for record in _thread_records(checkpointer, thread_id, after_id, before_id):
+                yield record
+        except Exception as e:
+            logger.error(f"History export failed for thread {thread_id}: {e}")
+            yield {"record": "error", "thread_id": thread_id, "error": str(e)}
+
+
+async def export_lines(records: AsyncIterator[Dict[str, Any]]) -> AsyncIterator[bytes]:
+    """Encode records as NDJSON, yielding chunks of about EXPORT_CHUNK_BYTES."""
+    chunk = bytearray()
+    async for record in records:
+        chunk += orjson.dumps(record, default=str, option=orjson.OPT_APPEND_NEWLINE | orjson.OPT_NON_STR_KEYS)
+        if len(chunk) >= CONFIG['CHUNK_BYTES']:
+            yield bytes(chunk)
+            chunk.clear()
+    if chunk:
+        yield bytes(chunk)
+
+
+async def gzip_chunks(chunks: AsyncIterator[bytes], level: int = CONFIG['GZIP_LEVEL']) -> AsyncIterator[bytes]:
+    """Compress a byte stream into one gzip member without buffering it."""
+    compressor = zlib.compressobj(level, zlib.DEFLATED, 31)
+    async for chunk in chunks:
+        compressed = compressor.compress(chunk)
+        if compressed:
+            yield compressed
+    yield compressor.flush()
@@ -0,0 +1,208 @@
+"""
+Asynchronous margin-check jobs.
+
+``/agent/margin-check`` holds the HTTP connection for the whole multi-LLM
+run, which is why the alert service waits up to MARGIN_ENDPOINT_TIMEOUT. In
+job mode (``?job=true``) the endpoints answer ``202`` with a job id at once
+and the run continues as a detached task:
+- ``GET /agent/jobs/{id}`` returns the status and, once finished, the same
+  result body the synchronous call would have returned (``?wait=`` long-polls)
+- ``GET /agent/jobs/{id}/events`` (SSE) and ``/agent/jobs/{id}/ws``
+  (WebSocket) replay the progress events emitted so far, then follow live
+- Client disconnects never cancel the job; finished jobs are kept for
+  ``AGENT_JOB_TTL_SECONDS`` and then forgotten
+- Resubmitting with the same idempotency key returns the existing job unless
+  it failed
+
+Contains:
+- Job: status, result and progress events of one run
+- JobRegistry and the global run_jobs
+"""
+
+import os
+import time
+import uuid
+import asyncio
+import logging
+from datetime import datetime
+from typing import Any, AsyncIterator, Callable, Dict, Optional, Tuple
+
+logger = logging.getLogger(__name__)
+
+# Configuration Settings
+CONFIG = {
+    # Finished jobs (status, result, events) are kept this long
+    'RESULT_TTL_SECONDS': float(os.getenv("AGENT_JOB_TTL_SECONDS", "600")),
+    # Retained jobs beyond this evict the oldest finished ones early
+    'MAX_RETAINED': int(os.getenv("AGENT_JOB_MAX_RETAINED", "1000")),
+    # Upper bound for ``?wait=`` long polls
+    'MAX_WAIT_SECONDS': 60.0,
+}
+
+# Events that end a run; their payload becomes the job result
+RESULT_EVENTS = ("interrupt", "complete", "error")
+
+# Job status by result event
+_RESULT_STATUS = {"interrupt": "awaiting_approval", "complete": "completed", "error": "failed"}
+
+
+class Job:
+    """One detached run: its status, final result and the progress events emitted so far."""
+
+    def __init__(self, kind: str, thread_id: str, key: Optional[str] = None):
+        self.id = uuid.uuid4().hex
+        self.kind = kind
+        self.thread_id = thread_id
+        self.key = key
+        self.status = "running"
+        self.result: Optional[Dict[str, Any]] = None
+        self.events: list = []
+        self.created_at = datetime.now().isoformat()
+        self.finished_at: Optional[float] = None
+        self.task: Optional[asyncio.Task] = None
+        self.wakeup = asyncio.Event()
+
+    @property
+    def done(self) -> bool:
+        return self.finished_at is not None
+
+    def publish(self, event: Optional[Tuple[str, Dict[str, Any]]] = None) -> None:
+        if event is not None:
+            self.events.append(event)
+        woken, self.wakeup = self.wakeup, asyncio.Event()
+        woken.set()
+
+    def describe(self) -> Dict[str, Any]:
+        """Status body for polling clients."""
+        return {
+            "job_id": self.id,
+            "kind": self.kind,
+            "thread_id": self.thread_id,
+            "status": self.status,
+            "created_at": self.created_at,
+            "events": len(self.events),
+            "result": self.result,
+        }
+
+
+class JobRegistry:
+    """Registry of running and recently finished jobs (one event loop)."""
+
+    def __init__(
+        self,
+        result_ttl_seconds: float = CONFIG['RESULT_TTL_SECONDS'],
+        max_retained: int = CONFIG['MAX_RETAINED'],
+    ):
+        self.result_ttl_seconds = result_ttl_seconds
+        self.max_retained = max_retained
+        self._jobs: Dict[str, Job] = {}
+        self._by_key: Dict[str, str] = {}
+        self._stats = {"submitted": 0, "deduplicated": 0, "completed": 0, "failed": 0, "expired": 0}
+
+    def _forget(self, job: Job) -> None:
+        self._jobs.pop(job.id, None)
+        if job.key and self._by_key.get(job.key) == job.id:
+            del self._by_key[job.key]
+
+    def _prune(self) -> None:
+        cutoff = time.monotonic() - self.result_ttl_seconds
+        finished = sorted((job for job in self._jobs.values() if job.done), key=lambda job: job.finished_at)
+        overflow = len(self._jobs) - self.max_retained
+        for job in finished:
+            if job.finished_at >= cutoff and overflow <= 0:
+                break
+            self._forget(job)
+            self._stats["expired"] += 1
+            overflow -= 1
+
+    def submit(
+        self,
+        kind: str,
+        thread_id: str,
+        start: Callable[[], AsyncIterator[Tuple[str, Dict[str, Any]]]],
+        key: Optional[str] = None,
+    ) -> Tuple[Job, bool]:
+        """
+        Start a job that drains ``start()`` detached from the caller
+
+        Args:
+            kind: Endpoint kind ("margin-check", "recheck")
+            thread_id: Thread the run belongs to
+            start: Returns the run's (event, payload) pairs (graph_run_events); not called for duplicates
+            key: Idempotency key; a live or successful job with the same key is reused
+
+        Returns:
+            (job, deduplicated) - deduplicated is True when an existing job was returned
+        """
+        self._prune()
+        if key and key in self._by_key:
+            existing = self._jobs[self._by_key[key]]
+            if existing.status != "failed":
+                self._stats["deduplicated"] += 1
+                return existing, True
+
+        job = Job(kind, thread_id, key)
+        self._jobs[job.id] = job
+        if key:
+            self._by_key[key] = job.id
+        self._stats["submitted"] += 1
+        job.task = asyncio.create_task(self._drive(job, start()))
+        logger.info(f"Started {kind} job {job.id} for thread {thread_id}")
+        return job, False
+
+    async def _drive(self, job: Job, events: AsyncIterator[Tuple[str, Dict[str, Any]]]) -> None:
+        try:
+            async for event_type, payload in events:
+                if event_type in RESULT_EVENTS:
+                    job.result = {"type": event_type, **payload}
+                    job.status = _RESULT_STATUS[event_type]
+                job.publish((event_type, payload))
+        except Exception as exc:
+            logger.error(f"Job {job.id} failed: {exc}")
+            job.result = {"type": "error", "status": "error", "error": str(exc), "thread_id": job.thread_id}
+            job.status = "failed"
+        finally:
+            if job.result is None:
+                job.result = {"type": "error", "status": "error", "error": "run ended without a result", "thread_id": job.thread_id}
+                job.status = "failed"
+            self._stats["failed" if job.status == "failed" else "completed"] += 1
+            job.finished_at = time.monotonic()
+            job.publish()
+
+    def get(self, job_id: str) -> Optional[Job]:
+        """Return the job (None when unknown or expired)."""
+        self._prune()
+        return self._jobs.get(job_id)
+
+    async def wait(self, job: Job, timeout: float) -> Job:
+        """Wait up to ``timeout`` seconds (capped at MAX_WAIT_SECONDS) for ``job`` to finish."""
+        timeout = max(0.0, min(timeout, CONFIG['MAX_WAIT_SECONDS']))
+        if not job.done and timeout > 0:
+            try:
+                await asyncio.wait_for(asyncio.shield(job.task), timeout)
+            except TimeoutError:
+                pass
+        return job
+
+    @staticmethod
+    async def follow(job: Job) -> AsyncIterator[Tuple[str, Dict[str, Any]]]:
+        """Replay the job's events so far, then follow live until it finishes."""
+        index = 0
+        while True:
+            wakeup = job.wakeup
+            while index < len(job.events):
+                yield job.events[index]
+                index += 1
+            if job.done:
+                return
+            await wakeup.wait()
+
+    def stats(self) -> Dict[str, Any]:
+        """Return job counters plus running and retained jobs."""
+        self._prune()
+        running = sum(1 for job in self._jobs.values() if not job.done)
+        return {**self._stats, "running": running, "retained": len(self._jobs) - running}
+
+
+# Global job registry shared by the agent endpoints
+run_jobs = JobRegistry()
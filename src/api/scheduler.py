@@ -0,0 +1,196 @@
+"""
+Admission control and priority scheduling for graph runs.
+
+Every /agent/margin-check and /recheck request used to call the graph
+directly, so a burst of chat traffic competed with alert-driven analyses for
+LLM quota, DB pool connections and CPU. RunScheduler sits in front of graph
+execution:
+- At most ``MAX_CONCURRENT_RUNS`` graph runs execute at once
+- Waiting runs are started by priority class: alert > recheck > chat
+  (FIFO within a class)
+- Load shedding by queue depth: a class is rejected once the queue holds its
+  limit, so chat is shed first and alerts last. Rejections carry a
+  Retry-After estimate derived from recent run durations
+
+Contains:
+- RunRejected, raised when a run is shed (mapped to HTTP 429)
+- RunScheduler and the global run_scheduler with queue metrics in stats()
+"""
+
+import os
+import math
+import time
+import heapq
+import asyncio
+import itertools
+import logging
+from collections import defaultdict
+from typing import Any, Dict, Optional
+
+logger = logging.getLogger(__name__)
+
+# Configuration Settings
+CONFIG = {
+    # Graph runs executing concurrently (each holds DB pool connections and LLM quota)
+    'MAX_CONCURRENT_RUNS': int(os.getenv("AGENT_MAX_CONCURRENT_RUNS", "8")),
+    # Priority classes, highest first
+    'PRIORITIES': ("alert", "recheck", "chat"),
+    # A class is shed once this many runs (of any class) are queued
+    'MAX_QUEUE_DEPTH': {
+        "alert": int(os.getenv("AGENT_MAX_QUEUE_ALERT", "100")),
+        "recheck": int(os.getenv("AGENT_MAX_QUEUE_RECHECK", "30")),
+        "chat": int(os.getenv("AGENT_MAX_QUEUE_CHAT", "10")),
+    },
+    # Run duration assumed before any run has finished, and smoothing for the moving average
+    'INITIAL_RUN_SECONDS': 10.0,
+    'RUN_SECONDS_SMOOTHING': 0.2,
+    # Bounds for the Retry-After hint (seconds)
+    'MIN_RETRY_AFTER': 1,
+    'MAX_RETRY_AFTER': 120,
+}
+
+
+class RunRejected(Exception):
+    """Raised when a run is shed because its priority class's queue is full."""
+
+    def __init__(self, priority: str, retry_after: int, queued: int):
+        self.priority = priority
+        self.retry_after = retry_after
+        self.queued = queued
+        super().__init__(f"Agent is overloaded ({queued} runs queued); retry {priority} request after {retry_after}s")
+
+
+class RunScheduler:
+    """Bounded-concurrency, priority-ordered admission for graph runs (one event loop)."""
+
+    def __init__(
+        self,
+        max_concurrent: int = CONFIG['MAX_CONCURRENT_RUNS'],
+        max_queue_depth: Optional[Dict[str, int]] = None,
+    ):
+        self.max_concurrent = max(1, int(max_concurrent))
+        self.max_queue_depth = dict(max_queue_depth or CONFIG['MAX_QUEUE_DEPTH'])
+        self._rank = {name: rank for rank, name in enumerate(CONFIG['PRIORITIES'])}
+        self._waiters: list = []  # heap of (rank, seq, priority, future)
+        self._seq = itertools.count()
+        self._running: Dict[str, int] = defaultdict(int)
+        self._queued: Dict[str, int] = defaultdict(int)
+        self._admitted: Dict[str, int] = defaultdict(int)
+        self._rejected: Dict[str, int] = defaultdict(int)
+        self._wait_seconds: Dict[str, float] = defaultdict(float)
+        self._max_wait_seconds: Dict[str, float] = defaultdict(float)
+        self._run_seconds = CONFIG['INITIAL_RUN_SECONDS']
+
+    def _priority(self, priority: str) -> str:
+        return priority if priority in self._rank else CONFIG['PRIORITIES'][-1]
+
+    @property
+    def running(self) -> int:
+        return sum(self._running.values())
+
+    @property
+    def queued(self) -> int:
+        return sum(self._queued.values())
+
+    def retry_after(self) -> int:
+        """Estimate seconds until the queue ahead of a new request drains."""
+        estimate = self._run_seconds * (self.queued + 1) / self.max_concurrent
+        return int(min(CONFIG['MAX_RETRY_AFTER'], max(CONFIG['MIN_RETRY_AFTER'], math.ceil(estimate))))
+
+    def check_admission(self, priority: str) -> None:
+        """Raise RunRejected if a run of this class would be shed right now."""
+        priority = self._priority(priority)
+        if self.running < self.max_concurrent and not self._waiters:
+            return
+        if self.queued >= self.max_queue_depth.get(priority, 0):
+            self._rejected[priority] += 1
+            retry_after = self.retry_after()
+            logger.warning(f"Shedding {priority} run: {self.queued} queued, {self.running} running")
+            raise RunRejected(priority, retry_after, self.queued)
+
+    async def acquire(self, priority: str) -> Dict[str, Any]:
+        """
+        Wait for a run slot
+
+        Args:
+            priority: "alert", "recheck" or "chat" (unknown classes are treated as chat)
+
+        Returns:
+            Ticket to hand back to release()
+
+        Raises:
+            RunRejected: the class's queue is full
+        """
+        priority = self._priority(priority)
+        self.check_admission(priority)
+        enqueued_at = time.perf_counter()
+
+        if self.running < self.max_concurrent and not self._waiters:
+            self._running[priority] += 1
+        else:
+            future = asyncio.get_running_loop().create_future()
+            heapq.heappush(self._waiters, (self._rank[priority], next(self._seq), priority, future))
+            self._queued[priority] += 1
+            try:
+                await future
+            except asyncio.CancelledError:
+                if future.done() and not future.cancelled():
+                    # The slot was handed over just as the caller went away; pass it on
+                    self._release_slot(priority)
+                else:
+                    self._queued[priority] -= 1
+                    self._waiters = [waiter for waiter in self._waiters if waiter[3] is not future]
+                    heapq.heapify(self._waiters)
+                raise
+            # release() moved this waiter from queued to running
+
+        waited = time.perf_counter() - enqueued_at
+        self._admitted[priority] += 1
+        self._wait_seconds[priority] += waited
+        self._max_wait_seconds[priority] = max(self._max_wait_seconds[priority], waited)
+        return {"priority": priority, "started_at": time.perf_counter(), "wait_seconds": waited}
+
+    def release(self, ticket: Dict[str, Any]) -> None:
+        """Return a slot and start the highest-priority waiter, if any."""
+        elapsed = time.perf_counter() - ticket["started_at"]
+        smoothing = CONFIG['RUN_SECONDS_SMOOTHING']
+        self._run_seconds = (1 - smoothing) * self._run_seconds + smoothing * elapsed
+        self._release_slot(ticket["priority"])
+
+    def _release_slot(self, priority: str) -> None:
+        self._running[priority] -= 1
+        while self._waiters:
+            _, _, waiter_priority, future = heapq.heappop(self._waiters)
+            if future.cancelled():
+                continue
+            self._queued[waiter_priority] -= 1
+            self._running[waiter_priority] += 1
+            future.set_result(None)
+            return
+
+    def stats(self) -> Dict[str, Any]:
+        """Return running/queued counts, admissions, rejections and wait times per class."""
+        classes = {}
+        for priority in CONFIG['PRIORITIES']:
+            admitted = self._admitted[priority]
+            classes[priority] = {
+                "running": self._running[priority],
+                "queued": self._queued[priority],
+                "admitted": admitted,
+                "rejected": self._rejected[priority],
+                "avg_wait_seconds": round(self._wait_seconds[priority] / admitted, 4) if admitted else 0.0,
+                "max_wait_seconds": round(self._max_wait_seconds[priority], 4),
+                "max_queue_depth": self.max_queue_depth.get(priority, 0),
+            }
+        return {
+            "max_concurrent": self.max_concurrent,
+            "running": self.running,
+            "queued": self.queued,
+            "avg_run_seconds": round(self._run_seconds, 4),
+            "retry_after": self.retry_after(),
+            "classes": classes,
+        }
+
+
+# Global scheduler shared by the agent endpoints
+run_scheduler = RunScheduler()
@@ -0,0 +1,181 @@
+"""
+Filtered, coalesced SSE streaming of graph runs.
+
+The streaming endpoints used to consume ``astream_events`` unfiltered: an
+event for every nested runnable (prompts, routers, tools, hooks) was built
+and inspected, and each token went out as its own SSE frame encoded with
+the stdlib json module. Streams now:
+- Read only token chunks and root state from ``graph.astream`` (``messages``
+  and ``values`` modes, including subgraphs), and keep tokens only from the
+  report-writing nodes (``SSE_STREAM_NODES``)
+- Coalesce consecutive tokens into one frame, flushed once the oldest
+  buffered token is ``SSE_FLUSH_INTERVAL_MS`` old or the buffer reaches
+  ``SSE_FLUSH_BYTES``
+- Encode frames with orjson
+
+Contains:
+- sse_frame, chunk_text
+- graph_stream_events: ("token", text) / ("state", values) items from a graph run
+- coalesce_tokens: time/size-bounded token batching over those items
+"""
+
+import os
+import asyncio
+import logging
+from contextlib import aclosing, suppress
+from typing import Any, AsyncIterator, Dict, Iterable, Optional, Sequence, Tuple
+
+import orjson
+from langchain_core.messages import AIMessageChunk
+
+logger = logging.getLogger(__name__)
+
+# Configuration Settings
+CONFIG = {
+    # A token frame is sent at most this long after its first token was produced
+    'FLUSH_INTERVAL_SECONDS': float(os.getenv("SSE_FLUSH_INTERVAL_MS", "50")) / 1000,
+    # ... or as soon as this many UTF-8 bytes are buffered
+    'FLUSH_BYTES': int(os.getenv("SSE_FLUSH_BYTES", "512")),
+    # Graph nodes / subgraphs whose model tokens reach the client (routing and classification are internal)
+    'STREAM_NODES': tuple(
+        name.strip()
+        for name in os.getenv("SSE_STREAM_NODES", "ai_responder,lp_report_branch,supervisor").split(",")
+        if name.strip()
+    ),
+}
+
+
+def sse_frame(event_type: str, payload: Dict[str, Any]) -> str:
+    """Encode one SSE frame with orjson (non-ASCII kept as-is, unknown types stringified)."""
+    data = orjson.dumps(payload, default=str, option=orjson.OPT_NON_STR_KEYS).decode("utf-8")
+    return f"event: {event_type}\ndata: {data}\n\n"
+
+
+def chunk_text(chunk: Any) -> str:
+    """Extract the text of a streamed model chunk (string or content-block list)."""
+    content = getattr(chunk, "content", None)
+    if isinstance(content, list):
+        return "".join(part.get("text", "") for part in content if isinstance(part, dict))
+    return str(content) if content else ""
+
+
+def is_streamed_node(namespace: Sequence[str], metadata: Dict[str, Any], nodes: Iterable[str]) -> bool:
+    """Return True when a token comes from one of ``nodes`` (at any subgraph depth)."""
+    nodes = set(nodes)
+    if metadata.get("langgraph_node") in nodes:
+        return True
+    return any(segment.split(":", 1)[0] in nodes for segment in namespace)
+
+
+async def graph_stream_events(
+    graph: Any,
+    graph_input: Any,
+    config: Dict[str, Any],
+    nodes: Sequence[str] = CONFIG['STREAM_NODES'],
+) -> AsyncIterator[Tuple[str, Any]]:
+    """
+    Run the graph and yield only what the SSE endpoints send
+
+    Args:
+        graph: Compiled graph
+        graph_input: Initial state or Command(resume=...)
+        config: Run config
+        nodes: Nodes whose tokens are forwarded
+
+    Yields:
+        ("token", text) for model tokens from ``nodes`` and ("state", values)
+        for root graph states (an interrupt arrives as ``{"__interrupt__": ...}``)
+    """
+    async for namespace, mode, chunk in graph.astream(
+        graph_input, config=config, stream_mode=["messages", "values"], subgraphs=True
+    ):
+        if mode == "messages":
+            message, metadata = chunk
+            if isinstance(message, AIMessageChunk) and is_streamed_node(namespace, metadata, nodes):
+                text = chunk_text(message)
+                if text:
+                    yield "token", text
+        elif not namespace:
+            yield "state", chunk
+
+
+async def coalesce_tokens(
+    events: AsyncIterator[Tuple[str, Any]],
+    flush_interval: float = CONFIG['FLUSH_INTERVAL_SECONDS'],
+    flush_bytes: int = CONFIG['FLUSH_BYTES'],
+) -> AsyncIterator[Tuple[str, Any]]:
+    """
+    Merge consecutive ("token", text) items; other items pass through in order
+
+    Buffered tokens are flushed when the buffer reaches ``flush_bytes``, when
+    ``flush_interval`` has passed since its first token (even if the model
+    stalls), and before any other item.
+
+    Args:
+        events: Items from graph_stream_events
+        flush_interval: Maximum seconds a token waits in the buffer
+        flush_bytes: Buffer size (UTF-8 bytes) that triggers an immediate flush
+
+    Yields:
+        The same items with runs of tokens joined
+    """
+    loop = asyncio.get_running_loop()
+    # One producer task drives the source, so the graph run keeps a single context
+    queue: asyncio.Queue = asyncio.Queue()
+    done = object()
+
+    async def produce():
+        try:
+            async with aclosing(events) as source:
+                async for item in source:
+                    queue.put_nowait(item)
+        except BaseException as exc:
+            queue.put_nowait(exc)
+            raise
+        else:
+            queue.put_nowait(done)
+
+    producer = asyncio.ensure_future(produce())
+    buffer: list = []
+    buffered_bytes = 0
+    flush_at: Optional[float] = None
+
+    def drain() -> Tuple[str, str]:
+        nonlocal buffer, buffered_bytes, flush_at
+        text = "".join(buffer)
+        buffer, buffered_bytes, flush_at = [], 0, None
+        return "token", text
+
+    try:
+        while True:
+            timeout = None if flush_at is None else max(0.0, flush_at - loop.time())
+            try:
+                item = await asyncio.wait_for(queue.get(), timeout)
+            except TimeoutError:
+                yield drain()
+                continue
+
+            if item is done:
+                break
+            if isinstance(item, BaseException):
+                raise item
+            kind, value = item
+            if kind != "token":
+                if buffer:
+                    yield drain()
+                yield kind, value
+                continue
+
+            buffer.append(value)
+            buffered_bytes += len(value.encode("utf-8"))
+            if flush_at is None:
+                flush_at = loop.time() + flush_interval
+            if buffered_bytes >= flush_bytes:
+                yield drain()
+        if buffer:
+            yield drain()
+    finally:
+        if not producer.done():
+            producer.cancel()
+        with suppress(asyncio.CancelledError, Exception):
+            await producer
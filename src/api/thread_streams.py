@@ -0,0 +1,128 @@
+"""
+Live event broadcast per conversation thread.
+
+Dashboards follow the runs of a thread (an alert card's margin check, then
+its rechecks) rather than a single request. Every graph run publishes its
+events here by thread_id (streamed and job runs every event, synchronous
+runs their final ``interrupt``/``complete``/``error`` and ``end``), and
+``GET /agent/threads/{thread_id}/events`` streams them to any number of
+followers:
+- Publishing is a dictionary lookup when nobody follows the thread
+- Each follower has a bounded queue; a slow follower loses its oldest token
+  events, never the ``interrupt``/``complete``/``error``/``end`` events
+- There is no replay: followers see the runs that happen while they are
+  connected (finished results live in checkpoints, jobs and alert cards)
+
+Contains:
+- ThreadStreamHub and the global thread_streams
+"""
+
+import os
+import asyncio
+import logging
+from collections import defaultdict
+from typing import Any, AsyncIterator, Dict, Optional, Set, Tuple
+
+logger = logging.getLogger(__name__)
+
+# Configuration Settings
+CONFIG = {
+    # Events buffered per follower before its oldest token events are dropped
+    'QUEUE_SIZE': int(os.getenv("THREAD_STREAM_QUEUE_SIZE", "256")),
+    # Idle followers get an SSE comment this often so dead connections are noticed
+    'KEEPALIVE_SECONDS': float(os.getenv("THREAD_STREAM_KEEPALIVE_SECONDS", "15")),
+}
+
+# Events a follower always receives, even when it is behind
+ESSENTIAL_EVENTS = ("interrupt", "complete", "error", "end")
+
+
+class _Follower:
+    """Bounded buffer of one follower; overflow drops the oldest non-essential event."""
+
+    def __init__(self, size: int):
+        self.size = size
+        self.events: list = []
+        self.dropped = 0
+        self.ready = asyncio.Event()
+
+    def offer(self, event: Tuple[str, Dict[str, Any]]) -> None:
+        if len(self.events) >= self.size:
+            index = next((i for i, (kind, _) in enumerate(self.events) if kind not in ESSENTIAL_EVENTS), None)
+            if index is not None:
+                del self.events[index]
+                self.dropped += 1
+            elif event[0] not in ESSENTIAL_EVENTS:
+                self.dropped += 1
+                return
+        self.events.append(event)
+        self.ready.set()
+
+    async def get(self, timeout: Optional[float] = None) -> Optional[Tuple[str, Dict[str, Any]]]:
+        if not self.events:
+            self.ready.clear()
+            try:
+                await asyncio.wait_for(self.ready.wait(), timeout)
+            except TimeoutError:
+                return None
+        return self.events.pop(0)
+
+
+class ThreadStreamHub:
+    """Fan-out of graph run events to the followers of each thread (one event loop)."""
+
+    def __init__(self, queue_size: int = CONFIG['QUEUE_SIZE']):
+        self.queue_size = queue_size
+        self._followers: Dict[str, Set[_Follower]] = defaultdict(set)
+        self._stats = {"published": 0, "delivered": 0, "dropped": 0}
+
+    def publish(self, thread_id: str, event_type: str, payload: Dict[str, Any]) -> None:
+        """Deliver one event to the thread's followers (no-op without followers)."""
+        followers = self._followers.get(thread_id)
+        if not followers:
+            return
+        self._stats["published"] += 1
+        for follower in followers:
+            before = follower.dropped
+            follower.offer((event_type, payload))
+            self._stats["dropped"] += follower.dropped - before
+            self._stats["delivered"] += 1
+
+    async def follow(
+        self,
+        thread_id: str,
+        keepalive: Optional[float] = CONFIG['KEEPALIVE_SECONDS'],
+    ) -> AsyncIterator[Optional[Tuple[str, Dict[str, Any]]]]:
+        """
+        Yield the thread's events until the caller stops iterating
+
+        Args:
+            thread_id: Thread to follow
+            keepalive: Seconds of silence after which None is yielded (None = never)
+
+        Yields:
+            (event, payload) pairs, or None after ``keepalive`` idle seconds
+        """
+        follower = _Follower(self.queue_size)
+        self._followers[thread_id].add(follower)
+        try:
+            while True:
+                yield await follower.get(keepalive)
+        finally:
+            followers = self._followers.get(thread_id)
+            if followers is not None:
+                followers.discard(follower)
+                if not followers:
+                    del self._followers[thread_id]
+
+    def stats(self) -> Dict[str, Any]:
+        """Return event counters and followed threads."""
+        return {
+            **self._stats,
+            "threads": len(self._followers),
+            "followers": sum(len(followers) for followers in self._followers.values()),
+        }
+
+
+# Global thread stream hub shared by the agent endpoints
+thread_streams = ThreadStreamHub()
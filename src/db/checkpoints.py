@@ -1,6 +1,6 @@
 """checkpointer.py"""
 
-from typing import Optional, cast, Any
+from typing import AsyncIterator, Optional, cast, Any
 from langgraph.checkpoint.postgres.aio import AsyncPostgresSaver
 import logging
 from .database import DatabaseManager
@@ -85,3 +85,62 @@ class CheckpointerManager:
             except Exception as e:
                 logger.error(f"Error closing checkpointer: {str(e)}")
                 raise
+
+
+# Distinct root-namespace threads with a checkpoint in [after_id, before_id), one keyset page at a time
+THREAD_IDS_SQL = """
+SELECT DISTINCT thread_id FROM checkpoints
+WHERE checkpoint_ns = '' AND checkpoint_id >= %s AND checkpoint_id < %s AND thread_id > %s
+ORDER BY thread_id
+LIMIT %s
+"""
+
+
+async def list_thread_ids(
+    checkpointer: Any,
+    after_id: str,
+    before_id: str,
+    page_size: int = 500,
+) -> AsyncIterator[str]:
+    """
+    Yield the threads that have a checkpoint with an id in [after_id, before_id)
+
+    Checkpoint ids are time-ordered UUIDv6 strings, so an id range is a time
+    range. Postgres answers with DISTINCT over keyset pages; other savers
+    (in-memory, tests) are scanned with alist.
+
+    Args:
+        checkpointer: Checkpoint saver of the graph
+        after_id: Inclusive lower checkpoint id bound
+        before_id: Exclusive upper checkpoint id bound
+        page_size: Thread ids fetched per query
+
+    Yields:
+        Thread ids (sorted for Postgres)
+    """
+    if isinstance(checkpointer, AsyncPostgresSaver):
+        last = ""
+        while True:
+            conn_or_pool = checkpointer.conn
+            if hasattr(conn_or_pool, "connection"):
+                async with conn_or_pool.connection() as conn, conn.cursor() as cur:
+                    await cur.execute(THREAD_IDS_SQL, (after_id, before_id, last, page_size))
+                    rows = await cur.fetchall()
+            else:
+                async with conn_or_pool.cursor() as cur:
+                    await cur.execute(THREAD_IDS_SQL, (after_id, before_id, last, page_size))
+                    rows = await cur.fetchall()
+            for row in rows:
+                last = row["thread_id"] if isinstance(row, dict) else row[0]
+                yield last
+            if len(rows) < page_size:
+                return
+
+    seen = set()
+    async for item in checkpointer.alist(None):
+        configurable = item.config["configurable"]
+        thread_id = configurable["thread_id"]
+        if (configurable.get("checkpoint_ns", "") == "" and thread_id not in seen
+                and after_id <= configurable["checkpoint_id"] < before_id):
+            seen.add(thread_id)
+            yield thread_id
@@ -0,0 +1,55 @@
+"""Shared fixtures: the agent graph and API router running on offline models and a canned gateway snapshot."""
+
+import pytest
+from fastapi import FastAPI
+from langgraph.checkpoint.memory import InMemorySaver
+
+from src.agent import graph as graph_module
+from src.agent import llm_registry, margin_tools
+from src.agent.cache import report_cache
+from src.api import graph as api_graph
+from src.api.coalescer import RunCoalescer
+from src.api.jobs import JobRegistry
+from src.api.scheduler import RunScheduler
+from src.api.thread_streams import ThreadStreamHub
+
+CFH = "[CFH] MAJESTIC FIN TRADE"
+
+
+def _snapshot(lp_name=None, api_client=None):
+    return {
+        "success": True,
+        "lp_name": lp_name,
+        "accounts": [{"LP": CFH, "Equity": 100000, "Margin": 90000, "Free Margin": 10000, "Margin Utilization %": 90.0}],
+        "positions": [{"LP": CFH, "Symbol": "XAUUSD", "Position": 10, "Margin": 90000}],
+    }
+
+
+@pytest.fixture
+def cfh_snapshot():
+    """The gateway snapshot served offline: one CFH account at 90% margin utilisation."""
+    return _snapshot
+
+
+@pytest.fixture
+def offline_graph(monkeypatch, cfh_snapshot):
+    """The main graph on offline models and the canned snapshot, compiled with an InMemorySaver."""
+    monkeypatch.setitem(llm_registry.CONFIG, "BACKEND", "offline")
+    monkeypatch.setattr(margin_tools, "fetch_lp_snapshot", cfh_snapshot)
+    report_cache.clear()
+    supervisor = graph_module.create_supervisor_subgraph()
+    monkeypatch.setattr(graph_module, "get_supervisor_subgraph", lambda configurable=None: supervisor)
+    return graph_module.get_graph().compile(checkpointer=InMemorySaver())
+
+
+@pytest.fixture
+def offline_app(monkeypatch, offline_graph):
+    """A FastAPI app serving the agent router on ``offline_graph``, with fresh run scheduling state."""
+    monkeypatch.setattr(api_graph, "run_scheduler", RunScheduler(max_concurrent=4))
+    monkeypatch.setattr(api_graph, "run_coalescer", RunCoalescer(recent_seconds=60))
+    monkeypatch.setattr(api_graph, "run_jobs", JobRegistry(result_ttl_seconds=60))
+    monkeypatch.setattr(api_graph, "thread_streams", ThreadStreamHub())
+    app = FastAPI()
+    app.include_router(api_graph.router)
+    app.state.graph = offline_graph
+    return app
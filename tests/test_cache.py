@@ -0,0 +1,127 @@
+import asyncio
+import time
+
+from langchain_core.messages import HumanMessage
+
+from src.agent import graph as graph_module
+from src.agent.cache import TTLCache, intent_cache, normalize_user_text
+from src.agent.schemas import IntentClassification, IntentScope
+
+
+def test_ttl_cache_lru_eviction_and_stats():
+    cache = TTLCache(max_entries=2, ttl_seconds=60)
+    cache.set("a", 1)
+    cache.set("b", 2)
+    assert cache.get("a") == 1  # "a" becomes most recently used
+    cache.set("c", 3)  # evicts "b"
+
+    assert cache.get("b") is None
+    assert cache.get("c") == 3
+    stats = cache.stats()
+    assert stats["size"] == 2
+    assert stats["hits"] == 2
+    assert stats["misses"] == 1
+    assert stats["evictions"] == 1
+
+
+def test_ttl_cache_expiry():
+    cache = TTLCache(max_entries=4, ttl_seconds=0.01)
+    cache.set("a", 1)
+    time.sleep(0.02)
+    assert cache.get("a") is None
+    assert cache.stats()["expirations"] == 1
+
+
+def test_normalize_user_text_folds_case_space_and_punctuation():
+    assert normalize_user_text("  Margin   REPORT!! ") == "margin report"
+    assert normalize_user_text("查一下ＣＦＨ保证金？") == normalize_user_text("查一下cfh保证金")
+
+
+class _CountingModel:
+    def __init__(self):
+        self.calls = 0
+
+    def with_structured_output(self, schema):
+        return self
+
+    async def ainvoke(self, messages):
+        self.calls += 1
+        return IntentClassification(
+            intent="general_conversation",
+            confidence=0.8,
+            slots=IntentScope(),
+        )
+
+
+def test_classify_intent_reuses_cached_llm_result(monkeypatch):
+    model = _CountingModel()
+    monkeypatch.setattr(graph_module, "get_model", lambda *args, **kwargs: model)
+    intent_cache.clear()
+    config = {"configurable": {"intent_fast_path": False}}
+
+    async def classify(text):
+        state = {"messages": [HumanMessage(content=text)]}
+        return (await graph_module.classify_intent(state, config))["intentContext"]
+
+    first = asyncio.run(classify("Tell me a joke"))
+    second = asyncio.run(classify("  tell me a JOKE! "))
+
+    assert model.calls == 1
+    assert second.intent == first.intent == "general_conversation"
+    assert second.traceId != first.traceId
+    assert intent_cache.stats()["hits"] == 1
+
+
+class _FakeResponder:
+    def __init__(self):
+        self.calls = 0
+
+    async def ainvoke(self, state, config=None):
+        from langchain_core.messages import AIMessage
+
+        self.calls += 1
+        return {"messages": list(state["messages"]) + [AIMessage(content=f"report #{self.calls}", name="ai_responder")]}
+
+
+def _margin_turn(analysis):
+    import json
+
+    from langchain_core.messages import ToolMessage
+
+    return {"messages": [
+        HumanMessage(content="margin report"),
+        ToolMessage(content=json.dumps(analysis), name="get_lp_margin_check", tool_call_id="call-1"),
+    ]}
+
+
+def test_ai_responder_reuses_report_for_unchanged_snapshot():
+    from src.agent.cache import report_cache
+
+    report_cache.clear()
+    agent = _FakeResponder()
+    responder = graph_module.create_cached_ai_responder(agent)
+    analysis = {"status": "ok", "perLP": [{"lp": "[CFH] MAJESTIC FIN TRADE", "marginLevel": 40.0}], "traceId": "a"}
+
+    first = asyncio.run(responder.ainvoke(_margin_turn(analysis)))
+    # Same snapshot, new traceId -> served from cache
+    second = asyncio.run(responder.ainvoke(_margin_turn({**analysis, "traceId": "b"})))
+    # Changed snapshot -> new report
+    changed = {**analysis, "perLP": [{"lp": "[CFH] MAJESTIC FIN TRADE", "marginLevel": 85.0}]}
+    third = asyncio.run(responder.ainvoke(_margin_turn(changed)))
+
+    assert agent.calls == 2
+    assert first["messages"][-1].content == "report #1"
+    assert second["messages"][-1].content == "report #1"
+    assert second["messages"][-1].response_metadata["report_cache"] == "hit"
+    assert third["messages"][-1].content == "report #2"
+
+
+def test_follow_up_question_bypasses_report_cache():
+    agent = _FakeResponder()
+    responder = graph_module.create_cached_ai_responder(agent)
+    state = _margin_turn({"status": "ok", "perLP": []})
+    state["messages"].append(HumanMessage(content="why is CFH critical?"))
+
+    asyncio.run(responder.ainvoke(state))
+    asyncio.run(responder.ainvoke(state))
+    assert agent.calls == 2
@@ -0,0 +1,83 @@
+import asyncio
+import time
+
+import httpx
+from langgraph.checkpoint.memory import InMemorySaver
+
+from src.agent import graph as graph_module
+
+
+class _CountingSaver(InMemorySaver):
+    """Counts the checkpoints the history endpoint reads."""
+
+    def __init__(self):
+        super().__init__()
+        self.listed = 0
+
+    async def alist(self, config, **kwargs):
+        async for item in super().alist(config, **kwargs):
+            self.listed += 1
+            yield item
+
+
+def _run_history(app, scenario):
+    """Run one margin check on a fresh thread, then ``scenario(history)`` against its history."""
+    saver = _CountingSaver()
+    app.state.graph = graph_module.get_graph().compile(checkpointer=saver)
+    thread_id = f"history-{time.time()}"
+
+    async def main():
+        async with httpx.AsyncClient(transport=httpx.ASGITransport(app=app), base_url="http://test") as client:
+            await client.post("/agent/margin-check", json={
+                "messages": [{"role": "user", "content": "check CFH margin"}], "thread_id": thread_id,
+            })
+
+            async def history(**body):
+                saver.listed = 0
+                response = await client.post("/agent/margin-check/history", json={"thread_id": thread_id, **body})
+                return response.status_code, response.json(), saver.listed
+
+            return await scenario(history)
+
+    return asyncio.run(main())
+
+
+def test_history_pages_follow_the_cursor_and_read_only_the_page(offline_app):
+    async def scenario(history):
+        _, full, _ = await history(limit=500)
+        _, first, first_read = await history(limit=2)
+        _, second, second_read = await history(limit=2, before=first["next_cursor"])
+        return full, first, first_read, second, second_read
+
+    full, first, first_read, second, second_read = _run_history(offline_app, scenario)
+    steps = [s["checkpoint_id"] for s in full["execution_history"]]
+
+    assert len(steps) == 4 and not full["has_more"]
+    assert first_read == 3  # the page plus one row to detect an older page
+    assert [s["checkpoint_id"] for s in first["execution_history"]] == steps[2:]
+    assert first["has_more"] and first["next_cursor"] == steps[2]
+    assert second_read == 2
+    assert [s["checkpoint_id"] for s in second["execution_history"]] == steps[:2]
+    assert not second["has_more"] and second["next_cursor"] is None
+
+
+def test_history_projection_and_structured_intent_context(offline_app):
+    async def scenario(history):
+        return (
+            await history(limit=1, fields=["metadata"]),
+            await history(limit=1, fields=["intentContext", "tasks"]),
+            await history(fields=["bogus"]),
+        )
+
+    (_, metadata_only, _), (_, intent, _), (bad_status, _, _) = _run_history(offline_app, scenario)
+
+    [step] = metadata_only["execution_history"]
+    assert "values" not in step and "tasks" not in step
+    assert step["next"] == ["human_approval"]
+
+    [step] = intent["execution_history"]
+    assert set(step["values"]) == {"intentContext"}
+    assert step["values"]["intentContext"]["intent"] == "lp_margin_check_report"
+    assert isinstance(step["values"]["intentContext"]["confidence"], float)
+    assert step["tasks"][0]["interrupts"][0]["value"]["report"]
+    assert bad_status == 400
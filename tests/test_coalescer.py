@@ -0,0 +1,99 @@
+import asyncio
+
+import httpx
+from fastapi import FastAPI
+from langchain_core.messages import AIMessage, AIMessageChunk
+
+from src.api import graph as api_graph
+from src.api.coalescer import RunCoalescer
+from src.api.scheduler import RunScheduler
+
+
+class _SlowGraph:
+    def __init__(self, fail=False):
+        self.runs = 0
+        self.fail = fail
+
+    async def ainvoke(self, state, config=None):
+        self.runs += 1
+        await asyncio.sleep(0.1)
+        if self.fail:
+            raise RuntimeError("gateway down")
+        return {"messages": [AIMessage(content=f"report #{self.runs}")]}
+
+    async def astream(self, state, config=None, stream_mode=None, subgraphs=False):
+        self.runs += 1
+        for delay, token in ((0.05, "mar"), (0.15, "gin")):
+            await asyncio.sleep(delay)
+            yield (), "messages", (AIMessageChunk(content=token), {"langgraph_node": "ai_responder"})
+        yield (), "values", {"messages": [AIMessage(content="margin")]}
+
+
+def _client(monkeypatch, graph):
+    monkeypatch.setattr(api_graph, "run_scheduler", RunScheduler(max_concurrent=4))
+    monkeypatch.setattr(api_graph, "run_coalescer", RunCoalescer(recent_seconds=60))
+    app = FastAPI()
+    app.include_router(api_graph.router)
+    app.state.graph = graph
+    return httpx.AsyncClient(transport=httpx.ASGITransport(app=app), base_url="http://test")
+
+
+ALERT = {"eventType": "MARGIN_ALERT", "payload": {"lp": "[CFH] MAJESTIC FIN TRADE", "marginLevel": 0.91, "threshold": 0.8}}
+
+
+def test_duplicate_requests_share_one_run(monkeypatch):
+    graph = _SlowGraph()
+
+    async def scenario():
+        async with _client(monkeypatch, graph) as client:
+            first, second = await asyncio.gather(
+                client.post("/agent/margin-check", json={**ALERT}),
+                client.post("/agent/margin-check", json={**ALERT}),
+            )
+            # A retry after the run finished still gets its result
+            retry = await client.post("/agent/margin-check", json={**ALERT})
+            keyed = await client.post("/agent/margin-check", json={**ALERT, "idempotencyKey": "k1"})
+        return first.json(), second.json(), retry.json(), keyed.json()
+
+    first, second, retry, keyed = asyncio.run(scenario())
+    assert graph.runs == 2  # one per distinct key
+    assert first["content"] == second["content"] == retry["content"] == "report #1"
+    assert "coalesced" not in first
+    assert second["coalesced"] and retry["coalesced"]
+    assert keyed["content"] == "report #2"
+
+
+def test_failed_runs_are_not_reused(monkeypatch):
+    graph = _SlowGraph(fail=True)
+
+    async def scenario():
+        async with _client(monkeypatch, graph) as client:
+            first = await client.post("/agent/margin-check", json={**ALERT})
+            retry = await client.post("/agent/margin-check", json={**ALERT})
+        return first.json(), retry.json()
+
+    first, retry = asyncio.run(scenario())
+    assert first["type"] == retry["type"] == "error"
+    assert graph.runs == 2
+
+
+def test_late_stream_caller_replays_and_follows(monkeypatch):
+    graph = _SlowGraph()
+    body = {"thread_id": "t1", "idempotencyKey": "retry-1"}
+
+    async def scenario():
+        async with _client(monkeypatch, graph) as client:
+            async def read():
+                return (await client.post("/agent/margin-check/recheck?stream=true", json=body)).text
+
+            leader = asyncio.create_task(read())
+            await asyncio.sleep(0.15)  # the first token frame has been flushed
+            follower = await read()
+            return await leader, follower
+
+    leader, follower = asyncio.run(scenario())
+    assert graph.runs == 1
+    assert follower.startswith("event: coalesced")
+    assert follower.split("\n\n", 1)[1] == leader
+    assert leader.count("event: token") == 2
+    assert "event: complete" in leader
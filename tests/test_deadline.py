@@ -0,0 +1,66 @@
+import asyncio
+import time
+
+import httpx
+
+from src.agent import deadline as deadline_module
+from src.agent import margin_tools
+from src.agent.cache import snapshot_cache
+from src.agent.deadline import RunDeadline, run_deadlines
+
+CFH = "[CFH] MAJESTIC FIN TRADE"
+
+
+def _post(app, **kwargs):
+    async def scenario():
+        async with httpx.AsyncClient(transport=httpx.ASGITransport(app=app), base_url="http://test") as client:
+            return (await client.post("/agent/margin-check", **kwargs)).json()
+
+    return asyncio.run(scenario())
+
+
+def test_short_deadline_answers_with_the_template_report(offline_app):
+    body = {"messages": [{"role": "user", "content": "check CFH margin"}], "thread_id": f"deadline-{time.time()}"}
+
+    response = _post(offline_app, json=body, headers={"X-Request-Timeout": "15"})
+
+    assert response["type"] == "interrupt"
+    assert response["interrupt_data"]["source"] == "template"
+    assert CFH in response["interrupt_data"]["report"]
+    assert [d["degradation"] for d in response["metadata"]["degradations"]] == ["template_report"]
+    assert response["metadata"]["deadline"]["timeout_seconds"] == 15
+    assert run_deadlines.stats()["open"] == 0
+
+
+def test_ample_deadline_runs_the_supervisor_without_degradations(offline_app):
+    body = {
+        "messages": [{"role": "user", "content": "check CFH margin"}],
+        "thread_id": f"deadline-ok-{time.time()}",
+        "timeoutSeconds": 100,
+    }
+
+    response = _post(offline_app, json=body)
+
+    assert response["interrupt_data"]["source"] == "llm"
+    assert response["metadata"]["degradations"] == []
+
+
+def test_gateway_falls_back_to_the_last_good_snapshot(monkeypatch, cfh_snapshot):
+    calls = []
+
+    def fetch(lp_name=None, api_client=None):
+        calls.append(lp_name)
+        return cfh_snapshot(lp_name)
+
+    monkeypatch.setattr(margin_tools, "fetch_lp_snapshot", fetch)
+    snapshot_cache.clear()
+    fresh = margin_tools.fetch_lp_snapshot_within_deadline(CFH)
+
+    # Less time left than a gateway round trip needs
+    deadline = RunDeadline(deadline_module.CONFIG["SAFETY_MARGIN_SECONDS"] + 0.5)
+    cached = margin_tools.fetch_lp_snapshot_within_deadline(CFH, deadline)
+
+    assert calls == [CFH]
+    assert cached["accounts"] == fresh["accounts"]
+    [degradation] = deadline.summary()["degradations"]
+    assert degradation["degradation"] == "cached_snapshot" and degradation["lp"] == CFH
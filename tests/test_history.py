@@ -0,0 +1,70 @@
+import asyncio
+import json
+
+from langchain_core.messages import AIMessage, HumanMessage, ToolMessage
+
+from src.agent import graph as graph_module
+from src.agent.history import compact_history, split_turns
+from src.agent.schemas import IntentContext
+
+ANALYSIS = {
+    "status": "critical",
+    "metrics": {"avgMarginLevel": 85.0, "lpCount": 1},
+    "perLP": [{"lp": "[CFH] MAJESTIC FIN TRADE", "marginLevel": 85.0, "padding": "x" * 4000}],
+    "recommendations": [{"id": "REC-001"}],
+    "crossCandidates": [],
+}
+
+
+def _turn(i):
+    call_id = f"call-{i}"
+    return [
+        HumanMessage(content=f"recheck {i}", id=f"h{i}"),
+        AIMessage(content="", id=f"a{i}", tool_calls=[{"name": "get_lp_margin_check", "args": {}, "id": call_id}]),
+        ToolMessage(content=json.dumps(ANALYSIS), name="get_lp_margin_check", tool_call_id=call_id, id=f"t{i}"),
+        AIMessage(content=f"report {i}", id=f"r{i}"),
+    ]
+
+
+def test_compact_history_summarizes_older_tool_outputs():
+    messages = [m for i in range(4) for m in _turn(i)]
+    compacted = compact_history(messages, keep_turns=2, max_tokens=0)
+
+    assert [m.id for m in compacted] == [m.id for m in messages]
+    assert compacted[2].content.startswith("[compacted] margin snapshot")
+    assert "[CFH] MAJESTIC FIN TRADE=85.0%" in compacted[2].content
+    assert compacted[2].tool_call_id == "call-0"
+    assert compacted[-2].content == messages[-2].content  # recent turns stay verbatim
+    assert messages[2].content == json.dumps(ANALYSIS)  # input is not mutated
+
+
+def test_compact_history_drops_oldest_turns_over_budget():
+    messages = [m for i in range(4) for m in _turn(i)]
+    compacted = compact_history(messages, keep_turns=1, max_tokens=1200)
+
+    turns = split_turns(compacted)
+    assert turns[-1][0].id == "h3"
+    assert len(turns) < 4
+    assert all(isinstance(turn[0], HumanMessage) for turn in turns)
+
+
+def test_call_supervisor_sends_compacted_history(monkeypatch):
+    received = {}
+
+    class _FakeSupervisor:
+        async def ainvoke(self, state, config=None):
+            received["messages"] = state["messages"]
+            return {"messages": state["messages"] + [AIMessage(content="ok")]}
+
+    monkeypatch.setattr(graph_module, "get_supervisor_subgraph", lambda configurable=None: _FakeSupervisor())
+    state = {
+        "messages": [m for i in range(3) for m in _turn(i)],
+        "intentContext": IntentContext(intent="lp_margin_check_report"),
+    }
+    config = {"configurable": {"history_keep_turns": 1, "history_max_tokens": 0}}
+
+    asyncio.run(graph_module.call_supervisor(state, config))
+
+    tool_contents = [m.content for m in received["messages"] if isinstance(m, ToolMessage)]
+    assert tool_contents[0].startswith("[compacted]")
+    assert tool_contents[-1] == json.dumps(ANALYSIS)
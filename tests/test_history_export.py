@@ -0,0 +1,130 @@
+import asyncio
+import gzip
+import time
+from datetime import datetime, timedelta, timezone
+
+import httpx
+import orjson
+from langchain_core.messages import AIMessage, ToolMessage
+from langgraph.checkpoint.base.id import uuid6
+from langgraph.checkpoint.memory import InMemorySaver
+from langgraph.graph import END, START, MessagesState, StateGraph
+
+from src.api import history_export
+from src.api.history_export import checkpoint_id_at
+
+CFH = "[CFH] MAJESTIC FIN TRADE"
+
+
+def _export(app, monkeypatch, *exports):
+    """Run margin checks on two threads, then POST each export body and return the responses."""
+    monkeypatch.setitem(history_export.CONFIG, "PAGE_SIZE", 2)
+    monkeypatch.setitem(history_export.CONFIG, "CHUNK_BYTES", 256)
+    threads = [f"export-{i}-{time.time()}" for i in range(2)]
+
+    async def main():
+        async with httpx.AsyncClient(transport=httpx.ASGITransport(app=app), base_url="http://test") as client:
+            for thread_id in threads:
+                await client.post("/agent/margin-check", json={
+                    "messages": [{"role": "user", "content": "check CFH margin"}], "thread_id": thread_id,
+                })
+            responses = []
+            for body in exports:
+                response = await client.post("/agent/margin-check/export", json=body(threads))
+                responses.append(response)
+            return responses
+
+    return threads, asyncio.run(main())
+
+
+def _records(content):
+    return [orjson.loads(line) for line in content.splitlines()]
+
+
+def test_export_streams_checkpoints_and_messages_for_listed_threads(offline_app, monkeypatch):
+    threads, [plain, zipped] = _export(
+        offline_app,
+        monkeypatch,
+        lambda threads: {"thread_ids": threads},
+        lambda threads: {"thread_id": threads[0], "gzip": True},
+    )
+
+    assert plain.headers["content-type"] == "application/x-ndjson"
+    records = _records(plain.content)
+    checkpoints = [r for r in records if r["record"] == "checkpoint"]
+    messages = [r for r in records if r["record"] == "message"]
+    assert {r["thread_id"] for r in checkpoints} == set(threads)
+    assert len(checkpoints) == 8  # every checkpoint, read two at a time
+    assert checkpoints[0]["values"]["intentContext"]["intent"] == "lp_margin_check_report"
+    # Each message once per thread, in full
+    for thread_id in threads:
+        ids = [r["message"]["data"]["id"] for r in messages if r["thread_id"] == thread_id]
+        assert len(ids) == len(set(ids)) > 0
+    assert any(r["message"]["type"] == "human" and r["message"]["data"]["content"] == "check CFH margin" for r in messages)
+
+    assert zipped.headers["content-type"] == "application/gzip"
+    unzipped = _records(gzip.decompress(zipped.content))
+    assert unzipped == [r for r in records if r["thread_id"] == threads[0]]
+
+
+def test_export_by_time_range_finds_threads_and_skips_outside_the_range(offline_app, monkeypatch):
+    now = datetime.now(timezone.utc)
+    threads, [in_range, past, missing] = _export(
+        offline_app,
+        monkeypatch,
+        lambda threads: {"since": (now - timedelta(minutes=1)).isoformat()},
+        lambda threads: {"until": (now - timedelta(minutes=1)).isoformat()},
+        lambda threads: {},
+    )
+
+    assert {r["thread_id"] for r in _records(in_range.content)} == set(threads)
+    assert past.content == b""
+    assert missing.status_code == 400
+
+
+def test_checkpoint_id_at_orders_like_generated_ids():
+    before = checkpoint_id_at(datetime.now(timezone.utc) - timedelta(seconds=1))
+    generated = str(uuid6(clock_seq=3))
+    after = checkpoint_id_at(datetime.now(timezone.utc) + timedelta(seconds=1))
+
+    assert before < generated < after
+
+
+def test_export_keeps_original_versions_of_rewritten_messages_and_full_values():
+    class State(MessagesState):
+        analysis: dict
+
+    tool_output = orjson.dumps({"perLP": [{"lp": CFH, "rows": list(range(200))}]}).decode()
+
+    def fetch(state):
+        return {
+            "messages": [
+                AIMessage(content="", tool_calls=[{"name": "get_lp_margin_check", "args": {}, "id": "call-1"}], id="ai-1"),
+                ToolMessage(content=tool_output, tool_call_id="call-1", id="tool-1"),
+            ],
+            "analysis": {"rows": list(range(300))},
+        }
+
+    def compact(state):
+        # Same id, new content: what compact_history does to older tool outputs
+        return {"messages": [ToolMessage(content="[compacted] CFH", tool_call_id="call-1", id="tool-1")]}
+
+    builder = StateGraph(State)
+    builder.add_node("fetch", fetch)
+    builder.add_node("compact", compact)
+    builder.add_edge(START, "fetch")
+    builder.add_edge("fetch", "compact")
+    builder.add_edge("compact", END)
+    checkpointer = InMemorySaver()
+    graph = builder.compile(checkpointer=checkpointer)
+
+    async def scenario():
+        await graph.ainvoke({"messages": [("user", "check CFH margin")]}, {"configurable": {"thread_id": "compacted"}})
+        return [record async for record in history_export.export_records(checkpointer, ["compacted"])]
+
+    records = asyncio.run(scenario())
+
+    tool_versions = [r["message"]["data"]["content"] for r in records if r["record"] == "message" and r["message"]["data"]["id"] == "tool-1"]
+    assert tool_versions == ["[compacted] CFH", tool_output]
+    values = [r["values"]["analysis"] for r in records if r["record"] == "checkpoint" and "analysis" in r["values"]]
+    assert values and all(value == {"rows": list(range(300))} for value in values)
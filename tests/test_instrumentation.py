@@ -0,0 +1,74 @@
+import asyncio
+
+from langchain_core.language_models.fake_chat_models import FakeMessagesListChatModel
+from langchain_core.messages import AIMessage, HumanMessage
+from langgraph.checkpoint.memory import InMemorySaver
+from langgraph.graph import END, START, MessagesState, StateGraph
+
+from src.agent import graph as graph_module
+from src.agent import margin_tools
+from src.agent.instrumentation import RunMetricsCallback, node_path, run_metrics_registry
+from src.agent.schemas import IntentContext
+
+
+def test_node_path_from_metadata():
+    assert node_path({"langgraph_node": "classify_intent"}) == "classify_intent"
+    assert node_path({"langgraph_node": "agent", "checkpoint_ns": "call_supervisor:1|supervisor:2"}) == "call_supervisor/supervisor/agent"
+    assert node_path({"langgraph_node": "supervisor", "checkpoint_ns": "call_supervisor:1|supervisor:2"}) == "call_supervisor/supervisor"
+    assert node_path({}) is None
+
+
+def test_callback_records_llm_tokens_per_nested_node():
+    usage = {"input_tokens": 11, "output_tokens": 4, "total_tokens": 15}
+    model = FakeMessagesListChatModel(responses=[AIMessage(content="hi", usage_metadata=usage)])
+
+    async def respond(state):
+        return {"messages": [await model.ainvoke(state["messages"])]}
+
+    inner = StateGraph(MessagesState)
+    inner.add_node("respond", respond)
+    inner.add_edge(START, "respond")
+    inner.add_edge("respond", END)
+    subgraph = inner.compile()
+
+    async def outer_node(state, config):
+        return {"messages": (await subgraph.ainvoke(state, config))["messages"]}
+
+    outer = StateGraph(MessagesState)
+    outer.add_node("outer", outer_node)
+    outer.add_edge(START, "outer")
+    outer.add_edge("outer", END)
+
+    metrics = RunMetricsCallback(thread_id="t-1")
+    asyncio.run(outer.compile().ainvoke({"messages": [HumanMessage(content="x")]}, {"callbacks": [metrics]}))
+    summary = metrics.summary()
+
+    assert summary["nodes"]["outer"]["calls"] == 1
+    assert summary["nodes"]["outer/respond"]["llm_calls"] == 1
+    assert summary["nodes"]["outer/respond"]["prompt_tokens"] == 11
+    assert summary["completion_tokens"] == 4
+    assert summary["thread_id"] == "t-1"
+
+
+def test_alert_run_records_tool_time_and_trace_id(monkeypatch):
+    monkeypatch.setattr(
+        margin_tools, "fetch_lp_snapshot",
+        lambda lp_name=None, api_client=None: {"success": True, "lp_name": lp_name, "accounts": [], "positions": []},
+    )
+    run_metrics_registry.reset()
+    graph = graph_module.get_graph().compile(checkpointer=InMemorySaver())
+    metrics = RunMetricsCallback(thread_id="alert-metrics")
+    state = {
+        "messages": [HumanMessage(content="MARGIN ALERT")],
+        "intentContext": IntentContext(intent="lp_margin_check_report", confidence=1.0, traceId="trace-42"),
+        "eventType": "MARGIN_ALERT",
+    }
+    asyncio.run(graph.ainvoke(state, {"configurable": {"thread_id": "alert-metrics"}, "callbacks": [metrics]}))
+
+    summary = metrics.finish(trace_id="trace-42")
+    assert summary["nodes"]["template_report"]["tool_calls"] == 1
+    assert summary["nodes"]["template_report"]["wall_seconds"] >= summary["nodes"]["template_report"]["tool_seconds"]
+    assert run_metrics_registry.find(trace_id="trace-42")[0]["thread_id"] == "alert-metrics"
+    assert run_metrics_registry.stats()["runs"] == 1
+    metrics.finish()  # idempotent
+    assert run_metrics_registry.stats()["runs"] == 1
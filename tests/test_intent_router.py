@@ -0,0 +1,59 @@
+from src.agent.intent_router import IntentRouter, derive_lp_aliases
+
+LP_NAMES = ["[CFH] MAJESTIC FIN TRADE", "[GBEGlobal]GBEGlobal1"]
+
+
+def test_aliases_derived_from_lp_mapping():
+    aliases = derive_lp_aliases(LP_NAMES)
+    assert aliases["cfh"] == "[CFH] MAJESTIC FIN TRADE"
+    assert aliases["majestic"] == "[CFH] MAJESTIC FIN TRADE"
+    assert aliases["gbe"] == "[GBEGlobal]GBEGlobal1"
+    assert aliases["gbeglobal1"] == "[GBEGlobal]GBEGlobal1"
+    # Generic words never become aliases
+    assert "global" not in aliases
+    assert "fin" not in aliases
+
+
+def test_margin_request_with_lp_is_routed():
+    router = IntentRouter(LP_NAMES)
+    context = router.route("查查cfh的保证金")
+    assert context is not None
+    assert context.intent == "lp_margin_check_report"
+    assert context.slots["lp"] == "[CFH] MAJESTIC FIN TRADE"
+
+    context = router.route("GBE账户的保证金水平怎么样")
+    assert context.slots["lp"] == "[GBEGlobal]GBEGlobal1"
+
+
+def test_margin_request_without_lp_queries_all():
+    router = IntentRouter(LP_NAMES)
+    context = router.route("Check my LP margin report")
+    assert context.intent == "lp_margin_check_report"
+    assert context.slots["lp"] is None
+
+
+def test_greeting_is_general_conversation():
+    router = IntentRouter(LP_NAMES)
+    context = router.route("Hello, how are you?")
+    assert context.intent == "general_conversation"
+
+
+def test_ambiguous_input_falls_back_to_llm():
+    router = IntentRouter(LP_NAMES)
+    assert router.route("Can you help me with my homework?") is None
+    # Two LPs in one request is left to the LLM
+    assert router.route("compare CFH and GBE margin") is None
+    # Alias inside another word does not match
+    assert router.match_lps("cfhx report") == []
+
+
+def test_stats_report_hit_rate():
+    router = IntentRouter(LP_NAMES)
+    router.route("margin report")
+    router.route("tell me a story")
+    stats = router.stats()
+    assert stats["total"] == 2
+    assert stats["hits"] == 1
+    assert stats["fallbacks"] == 1
+    assert stats["hit_rate"] == 0.5
+    assert stats["by_intent"] == {"lp_margin_check_report": 1}
@@ -0,0 +1,75 @@
+import asyncio
+import time
+
+import httpx
+import orjson
+from fastapi.testclient import TestClient
+
+from src.api.jobs import JobRegistry
+
+CFH = "[CFH] MAJESTIC FIN TRADE"
+
+
+def _body(**extra):
+    return {"messages": [{"role": "user", "content": "check CFH margin"}], "thread_id": f"job-{time.time()}", **extra}
+
+
+def test_job_is_accepted_then_polled_and_replayed_over_sse(offline_app):
+    async def scenario():
+        async with httpx.AsyncClient(transport=httpx.ASGITransport(app=offline_app), base_url="http://test") as client:
+            accepted = await client.post("/agent/margin-check", params={"job": "true"}, json=_body(idempotencyKey="job-1"))
+            duplicate = await client.post("/agent/margin-check", params={"job": "true"}, json=_body(idempotencyKey="job-1"))
+            status = await client.get(accepted.headers["location"], params={"wait": 10})
+            events = await client.get(accepted.json()["events_url"])
+            return accepted, duplicate, status.json(), events.text
+
+    accepted, duplicate, status, events = asyncio.run(scenario())
+
+    assert accepted.status_code == 202
+    assert accepted.json()["status"] == "running" and accepted.json()["result"] is None
+    assert duplicate.json()["deduplicated"] and duplicate.json()["job_id"] == accepted.json()["job_id"]
+    assert status["status"] == "awaiting_approval"
+    assert status["result"]["type"] == "interrupt"
+    assert CFH in status["result"]["interrupt_data"]["report"]
+    kinds = [frame.split("\n", 1)[0] for frame in events.split("\n\n") if frame]
+    assert "event: token" in kinds and kinds[-2:] == ["event: interrupt", "event: end"]
+
+
+def test_job_outlives_a_websocket_client_that_disconnects(offline_app):
+    with TestClient(offline_app) as client:
+        accepted = client.post("/agent/margin-check", params={"job": "true"}, json=_body()).json()
+        with client.websocket_connect(accepted["websocket_url"]) as websocket:
+            first = orjson.loads(websocket.receive_text())
+        # Disconnected after one message; the job still finishes
+        status = client.get(accepted["status_url"], params={"wait": 10}).json()
+        with client.websocket_connect(accepted["websocket_url"]) as websocket:
+            replayed = [orjson.loads(websocket.receive_text())["event"] for _ in range(status["events"])]
+
+    assert first["event"] == "token"
+    assert status["status"] == "awaiting_approval"
+    assert replayed[-2:] == ["interrupt", "end"]
+
+
+def test_finished_jobs_expire_after_the_ttl():
+    async def run():
+        yield "token", {"content": "margin"}
+        await asyncio.sleep(0.05)
+        yield "complete", {"status": "completed", "content": "margin ok"}
+        yield "end", {}
+
+    async def scenario():
+        jobs = JobRegistry(result_ttl_seconds=0.1)
+        job, _ = jobs.submit("margin-check", "t-1", run, key="k")
+        follower = jobs.follow(job)
+        assert await follower.__anext__() == ("token", {"content": "margin"})
+        await follower.aclose()  # a subscriber leaving does not cancel the job
+        await jobs.wait(job, 5)
+        kept = jobs.get(job.id)
+        await asyncio.sleep(0.15)
+        return job, kept, jobs.get(job.id), jobs.stats()
+
+    job, kept, expired, stats = asyncio.run(scenario())
+
+    assert kept is job and job.result == {"type": "complete", "status": "completed", "content": "margin ok"}
+    assert expired is None
+    assert stats["completed"] == 1 and stats["expired"] == 1
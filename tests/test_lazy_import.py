@@ -0,0 +1,39 @@
+import json
+import os
+import subprocess
+import sys
+from pathlib import Path
+
+PROJECT_ROOT = Path(__file__).resolve().parent.parent
+
+IMPORT_PROBE = """
+import json, sys, time
+started = time.perf_counter()
+import src.agent.graph as graph_module
+elapsed = time.perf_counter() - started
+print(json.dumps({
+    "elapsed": elapsed,
+    "build_timings": graph_module.BUILD_TIMINGS,
+    "langchain_openai": "langchain_openai" in sys.modules,
+    "langgraph_supervisor": "langgraph_supervisor" in sys.modules,
+}))
+"""
+
+
+def test_importing_graph_builds_nothing():
+    env = {k: v for k, v in os.environ.items() if k != "DASHSCOPE_API_KEY"}
+    result = subprocess.run(
+        [sys.executable, "-c", IMPORT_PROBE],
+        cwd=PROJECT_ROOT,
+        env=env,
+        capture_output=True,
+        text=True,
+        check=True,
+    )
+    probe = json.loads(result.stdout.strip().splitlines()[-1])
+
+    # No model, supervisor or graph is constructed and no API key is required
+    assert probe["build_timings"] == {}
+    assert probe["langchain_openai"] is False
+    assert probe["langgraph_supervisor"] is False
+    assert probe["elapsed"] > 0
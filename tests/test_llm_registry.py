@@ -0,0 +1,55 @@
+import asyncio
+
+import httpx
+
+from src.agent import llm_registry
+from src.agent.llm_registry import ModelRegistry
+
+
+def test_models_are_reused_per_parameters():
+    first = ModelRegistry.get_model("qwen-test", temperature=0.5, api_key="test-key")
+    again = ModelRegistry.get_model("qwen-test", temperature=0.5, api_key="test-key")
+    other = ModelRegistry.get_model("qwen-test", temperature=0.0, api_key="test-key")
+
+    assert first is again
+    assert first is not other
+    # Every model for the same endpoint shares one connection pool
+    assert first.http_async_client is other.http_async_client
+
+
+def test_concurrency_limit_is_enforced(monkeypatch):
+    monkeypatch.setitem(llm_registry.CONFIG, "BACKEND", "dashscope")
+    base_url = "http://fake-llm.test/v1"
+    peak = 0
+    active = 0
+
+    async def handler(request):
+        nonlocal peak, active
+        active += 1
+        peak = max(peak, active)
+        await asyncio.sleep(0.02)
+        active -= 1
+        return httpx.Response(200, json={
+            "id": "cmpl-1", "object": "chat.completion", "created": 0, "model": "qwen-limited",
+            "choices": [{"index": 0, "message": {"role": "assistant", "content": "ok"}, "finish_reason": "stop"}],
+            "usage": {"prompt_tokens": 3, "completion_tokens": 1, "total_tokens": 4},
+        })
+
+    monkeypatch.setitem(
+        ModelRegistry._async_http_clients, base_url, httpx.AsyncClient(transport=httpx.MockTransport(handler))
+    )
+    ModelRegistry.set_concurrency_limit("qwen-limited", 2)
+    model = ModelRegistry.get_model("qwen-limited", base_url=base_url, api_key="test-key")
+    in_flight = []
+
+    async def run():
+        calls = [asyncio.create_task(model.ainvoke("margin?")) for _ in range(6)]
+        await asyncio.sleep(0.01)
+        in_flight.append(ModelRegistry.stats()["concurrency"]["qwen-limited"]["in_flight"])
+        return await asyncio.gather(*calls)
+
+    replies = asyncio.run(run())
+
+    assert [reply.content for reply in replies] == ["ok"] * 6
+    assert peak == 2 and in_flight == [2]
+    assert ModelRegistry.stats()["concurrency"]["qwen-limited"] == {"limit": 2, "in_flight": 0}
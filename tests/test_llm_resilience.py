@@ -0,0 +1,100 @@
+import asyncio
+import time
+
+import httpx
+from langchain_core.messages import HumanMessage
+
+from src.agent import llm_resilience
+from src.agent.llm_registry import pooled_chat_model_class
+from src.agent.llm_resilience import LLMCallPolicy, RateBudget, llm_call_policy
+
+
+def _completion(content):
+    return {
+        "id": "chatcmpl-test",
+        "object": "chat.completion",
+        "created": 0,
+        "model": "qwen-test",
+        "choices": [{"index": 0, "message": {"role": "assistant", "content": content}, "finish_reason": "stop"}],
+        "usage": {"prompt_tokens": 12, "completion_tokens": 3, "total_tokens": 15},
+    }
+
+
+def test_rate_limited_and_failing_calls_are_retried_after_the_requested_delay():
+    responses = [
+        httpx.Response(429, headers={"retry-after-ms": "150"}, json={"error": {"message": "rate limited"}}),
+        httpx.Response(503, json={"error": {"message": "overloaded"}}),
+        httpx.Response(200, json=_completion("margin ok")),
+    ]
+    requests = []
+
+    def handler(request):
+        requests.append(time.perf_counter())
+        return responses[len(requests) - 1]
+
+    model = pooled_chat_model_class()(
+        model="qwen-retry-test",
+        api_key="test-key",
+        base_url="http://llm.test/v1",
+        max_retries=0,
+        http_async_client=httpx.AsyncClient(transport=httpx.MockTransport(handler)),
+    )
+
+    message = asyncio.run(model.ainvoke([HumanMessage(content="check CFH margin")]))
+
+    assert message.content == "margin ok"
+    assert len(requests) == 3
+    assert requests[1] - requests[0] >= 0.15  # Retry-After honoured
+    stats = llm_call_policy.stats()["qwen-retry-test"]
+    assert stats["retries"] == 2 and stats["rate_limited"] == 1
+    assert stats["budget"]["tokens"] == 15  # reservation settled to the reported usage
+
+
+def test_slow_call_is_hedged_past_the_p95_delay(monkeypatch):
+    monkeypatch.setitem(llm_resilience.CONFIG, "HEDGE_MIN_DELAY_SECONDS", 0.01)
+    policy = LLMCallPolicy(hedge_enabled=True)
+    attempts = 0
+
+    async def attempt():
+        nonlocal attempts
+        attempts += 1
+        # The first attempt of the last call stalls; every other attempt is quick
+        await asyncio.sleep(5 if attempts == 21 else 0.02)
+        return f"attempt {attempts}"
+
+    async def scenario():
+        for _ in range(20):
+            await policy.call("qwen-hedge", attempt, 10)
+        started = time.perf_counter()
+        result = await policy.call("qwen-hedge", attempt, 10)
+        return result, time.perf_counter() - started
+
+    result, elapsed = asyncio.run(scenario())
+    assert result == "attempt 22"
+    assert elapsed < 1
+    stats = policy.stats()["qwen-hedge"]
+    assert stats["hedged"] == 1 and stats["hedge_wins"] == 1
+    assert 0.01 <= stats["hedge_delay_seconds"] < 0.2
+
+
+def test_requests_and_tokens_per_minute_budget_delays_calls():
+    async def scenario():
+        rpm = RateBudget(rpm=2, window=0.2)
+        tpm = RateBudget(tpm=100, window=0.2)
+        started = time.perf_counter()
+        for _ in range(3):
+            await rpm.reserve(1)
+        rpm_elapsed = time.perf_counter() - started
+
+        started = time.perf_counter()
+        entry = await tpm.reserve(80)
+        tpm.settle(entry, 20)  # actual usage was lower, which frees room
+        await tpm.reserve(70)
+        quick = time.perf_counter() - started
+        await tpm.reserve(70)
+        return rpm_elapsed, quick, time.perf_counter() - started
+
+    rpm_elapsed, quick, tpm_elapsed = asyncio.run(scenario())
+    assert rpm_elapsed >= 0.19
+    assert quick < 0.05
+    assert tpm_elapsed >= 0.19
@@ -0,0 +1,110 @@
+import asyncio
+import time
+
+from langchain_core.messages import AIMessage, HumanMessage
+from langgraph.checkpoint.memory import InMemorySaver
+
+from src.agent import graph as graph_module
+from src.agent import margin_tools
+from src.agent.cache import report_cache
+from src.agent.prompts import AI_RESPONDER_PROMPT
+
+CFH = "[CFH] MAJESTIC FIN TRADE"
+GBE = "[GBEGlobal]GBEGlobal1"
+
+SNAPSHOTS = {
+    CFH: {
+        "accounts": [{"LP": CFH, "Equity": 100000, "Margin": 90000, "Free Margin": 10000, "Margin Utilization %": 90.0}],
+        "positions": [{"LP": CFH, "Symbol": "XAUUSD", "Position": 10, "Margin": 90000}],
+    },
+    GBE: {
+        "accounts": [{"LP": GBE, "Equity": 200000, "Margin": 40000, "Free Margin": 160000, "Margin Utilization %": 20.0}],
+        "positions": [{"LP": GBE, "Symbol": "XAUUSD", "Position": -6, "Margin": 40000}],
+    },
+}
+
+
+class _SlowNarrator:
+    def __init__(self):
+        self.calls = 0
+        self.prompts = []
+
+    async def ainvoke(self, messages):
+        self.calls += 1
+        self.prompts.append(messages[0].content)
+        await asyncio.sleep(0.3)
+        return AIMessage(content=f"narrative #{self.calls}")
+
+
+def _fetch(lp_name=None, api_client=None):
+    time.sleep(0.2)
+    return {"success": True, "lp_name": lp_name, **SNAPSHOTS[lp_name]}
+
+
+def _run(monkeypatch, fetch, narrator=None):
+    narrator = narrator or _SlowNarrator()
+    monkeypatch.setattr(margin_tools, "fetch_lp_snapshot", fetch)
+    monkeypatch.setattr(graph_module, "get_model", lambda *args, **kwargs: narrator)
+    graph = graph_module.get_graph().compile(checkpointer=InMemorySaver())
+    config = {"configurable": {"thread_id": f"fanout-{time.time()}"}}
+    # "margin report" names no LP: the unscoped report covers every LP and fans out
+
+    started = time.perf_counter()
+    result = asyncio.run(graph.ainvoke({"messages": [HumanMessage(content="margin report")]}, config))
+    return result, time.perf_counter() - started, narrator
+
+
+def test_multi_lp_report_fans_out_and_merges(monkeypatch):
+    report_cache.clear()
+    result, elapsed, narrator = _run(monkeypatch, _fetch)
+
+    payload = result["__interrupt__"][0].value
+    assert payload["source"] == "fanout"
+    assert narrator.calls == 2
+    # Branches run in parallel: one fetch + one narrative, not two of each
+    assert elapsed < 0.9
+    report = payload["report"]
+    assert report.index(f"### {CFH}") < report.index(f"### {GBE}")
+    assert "P0 - 对冲清理 XAUUSD" in report  # cross-LP netting from the merged portfolio
+    assert result["lpReports"] == []
+
+
+def test_branches_use_the_ai_responder_prompt_and_report_cache(monkeypatch):
+    report_cache.clear()
+    narrator = _SlowNarrator()
+    first, _, _ = _run(monkeypatch, _fetch, narrator)
+    second, _, _ = _run(monkeypatch, _fetch, narrator)
+
+    # Sections are written like ai_responder reports and reused for unchanged snapshots
+    assert narrator.prompts == [AI_RESPONDER_PROMPT, AI_RESPONDER_PROMPT]
+    assert second["__interrupt__"][0].value["report"] == first["__interrupt__"][0].value["report"]
+
+
+def test_failed_branch_is_reported(monkeypatch):
+    report_cache.clear()
+
+    def fetch(lp_name=None, api_client=None):
+        if lp_name == GBE:
+            return {"success": False, "error": "❌ gateway down"}
+        return _fetch(lp_name)
+
+    result, _, narrator = _run(monkeypatch, fetch)
+
+    report = result["__interrupt__"][0].value["report"]
+    assert narrator.calls == 1
+    assert f"### {GBE}\n⚠️ ❌ gateway down" in report
+
+
+def test_model_timeout_without_a_deadline_falls_back_to_the_template(monkeypatch):
+    class _TimingOutNarrator(_SlowNarrator):
+        async def ainvoke(self, messages):
+            await super().ainvoke(messages)
+            raise asyncio.TimeoutError()
+
+    report_cache.clear()
+    result, _, narrator = _run(monkeypatch, _fetch, _TimingOutNarrator())
+
+    report = result["__interrupt__"][0].value["report"]
+    assert narrator.calls == 2
+    assert f"### {CFH}\n" in report and f"### {GBE}\n" in report
+    assert "⚠️" not in report.split("<LP_NARRATIVES>")[1]
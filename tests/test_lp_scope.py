@@ -0,0 +1,65 @@
+import json
+
+from src.agent import margin_tools
+from src.agent.intent_router import intent_router
+
+CFH = "[CFH] MAJESTIC FIN TRADE"
+GBE = "[GBEGlobal]GBEGlobal1"
+
+
+def _account(lp, level):
+    return {"LP": lp, "Equity": 1000, "Margin": 10 * level, "Free Margin": 100, "Margin Utilization %": level}
+
+
+def _fake_gateway(calls):
+    data = {CFH: _account(CFH, 90.0), GBE: _account(GBE, 20.0)}
+
+    def fetch(lp_name=None, api_client=None):
+        calls.append(lp_name)
+        accounts = [data[lp_name]] if lp_name else list(data.values())
+        return {"success": True, "lp_name": lp_name, "accounts": accounts, "positions": []}
+
+    return fetch
+
+
+def test_resolve_lp_scope_accepts_names_and_aliases():
+    assert intent_router.resolve_lp_scope({"lp": CFH}) == [CFH]
+    assert intent_router.resolve_lp_scope({"lp": "cfh"}) == [CFH]
+    assert intent_router.resolve_lp_scope({"lp": None, "lps": ["GBE", CFH, "CFH"]}) == [GBE, CFH]
+    assert intent_router.resolve_lp_scope({"lp": "unknown broker"}) == []
+    assert intent_router.resolve_lp_scope(None) == []
+
+
+def test_binding_scope_overrides_tool_argument(monkeypatch):
+    calls = []
+    monkeypatch.setattr(margin_tools, "fetch_lp_snapshot", _fake_gateway(calls))
+
+    result = margin_tools.get_lp_margin_check.invoke({}, config={"configurable": {"lp_scope": [CFH]}})
+
+    assert calls == [CFH]
+    assert [lp["lp"] for lp in json.loads(result)["perLP"]] == [CFH]
+
+
+def test_multi_lp_scope_fetches_each_lp(monkeypatch):
+    calls = []
+    monkeypatch.setattr(margin_tools, "fetch_lp_snapshot", _fake_gateway(calls))
+
+    result = margin_tools.get_lp_margin_check.invoke(
+        {"lp_name": CFH}, config={"configurable": {"lp_scope": [CFH, GBE]}}
+    )
+
+    assert calls == [CFH, GBE]
+    assert json.loads(result)["metrics"]["lpCount"] == 2
+
+
+def test_restrict_snapshot_to_scope_drops_other_lps():
+    snapshot = {
+        "success": True,
+        "accounts": [_account(CFH, 90.0), _account(GBE, 20.0)],
+        "positions": [{"LP": GBE, "Symbol": "EURUSD", "Position": 1}],
+    }
+    restricted = margin_tools.restrict_snapshot_to_scope(snapshot, [CFH])
+    assert [a["LP"] for a in restricted["accounts"]] == [CFH]
+    assert restricted["positions"] == []
+    # Unrecognised gateway labels: keep the (already lp_id filtered) response
+    assert margin_tools.restrict_snapshot_to_scope(snapshot, ["other"]) is snapshot
@@ -0,0 +1,71 @@
+import asyncio
+import json
+import time
+
+from src.agent import data_gateway, margin_tools
+from src.agent.data_gateway import EigenFlowAPI
+
+
+def _slow_snapshot(lp_name=None, api_client=None):
+    time.sleep(0.3)
+    return {"success": True, "lp_name": lp_name, "accounts": [], "positions": []}
+
+
+def test_async_tool_does_not_block_event_loop(monkeypatch):
+    monkeypatch.setattr(margin_tools, "fetch_lp_snapshot", _slow_snapshot)
+
+    async def scenario():
+        ticks = 0
+
+        async def ticker():
+            nonlocal ticks
+            while True:
+                await asyncio.sleep(0.01)
+                ticks += 1
+
+        ticker_task = asyncio.create_task(ticker())
+        result = await margin_tools.get_lp_margin_check.ainvoke({})
+        ticker_task.cancel()
+        return result, ticks
+
+    result, ticks = asyncio.run(scenario())
+    assert json.loads(result)["schemaVer"]
+    assert ticks >= 10  # the loop kept serving other work during the 0.3s fetch
+
+
+def test_async_tool_receives_config(monkeypatch):
+    def fail_fetch(*args, **kwargs):
+        raise AssertionError("prefetched snapshot should be used")
+
+    monkeypatch.setattr(margin_tools, "fetch_lp_snapshot", fail_fetch)
+    key = margin_tools.snapshot_prefetcher.start(None, _slow_snapshot)
+
+    result = asyncio.run(
+        margin_tools.get_lp_margin_check.ainvoke({}, config={"configurable": {"prefetch_key": key}})
+    )
+    assert json.loads(result)["schemaVer"]
+
+
+class _Response:
+    status_code = 200
+
+    def __init__(self, payload):
+        self._payload = payload
+
+    def json(self):
+        return self._payload
+
+
+def test_gateway_client_builds_headers_per_request(monkeypatch):
+    sent = []
+    monkeypatch.setattr(data_gateway.requests, "post", lambda *a, **k: _Response({"access_token": "t1"}))
+    monkeypatch.setattr(
+        data_gateway.requests, "get", lambda *a, **k: sent.append(k["headers"]) or _Response([])
+    )
+
+    client = EigenFlowAPI()
+    assert client.authenticate("a@b.c", "pw", "broker")["success"]
+    client.get_lp_account()
+
+    assert "Authorization" not in client.headers  # shared base headers are never mutated
+    assert sent[0]["Authorization"] == "Bearer t1"
@@ -0,0 +1,153 @@
+import asyncio
+
+from langchain_core.language_models.fake_chat_models import FakeMessagesListChatModel
+from langchain_core.messages import AIMessage, HumanMessage
+from langchain_core.tools import tool
+from langgraph.graph import END, START, MessagesState, StateGraph
+
+from src.agent import graph as graph_module
+from src.agent.configuration import Configuration
+from src.agent.instrumentation import RunMetricsCallback
+from src.agent.model_cascade import CascadeChatModel, cascade_stats, invoke_structured_with_escalation
+from src.agent.schemas import IntentClassification, IntentScope
+
+
+class _StructuredModel:
+    def __init__(self, confidence=None, error=None):
+        self.confidence = confidence
+        self.error = error
+        self.calls = 0
+
+    def with_structured_output(self, schema):
+        return self
+
+    async def ainvoke(self, messages):
+        self.calls += 1
+        if self.error:
+            raise self.error
+        return IntentClassification(intent="lp_margin_check_report", confidence=self.confidence, slots=IntentScope())
+
+
+def _classify(small, large):
+    return asyncio.run(invoke_structured_with_escalation(
+        small, large, IntentClassification, [HumanMessage(content="x")], min_confidence=0.7, stage="test_classify",
+    ))
+
+
+def test_structured_cascade_escalates_on_low_confidence_and_parse_error():
+    cascade_stats.reset()
+    large = _StructuredModel(confidence=0.95)
+
+    assert _classify(_StructuredModel(confidence=0.9), large).confidence == 0.9
+    assert _classify(_StructuredModel(confidence=0.4), large).confidence == 0.95
+    assert _classify(_StructuredModel(error=ValueError("bad json")), large).confidence == 0.95
+
+    stats = cascade_stats.stats()["test_classify"]
+    assert large.calls == 2
+    assert stats["calls"] == 3
+    assert stats["reasons"] == {"low_confidence": 1, "parse_error": 1}
+    assert stats["escalation_rate"] == round(2 / 3, 4)
+
+
+class _ToolFakeModel(FakeMessagesListChatModel):
+    def bind_tools(self, tools, **kwargs):
+        return self
+
+
+@tool
+def lookup(lp_name: str) -> str:
+    """Look up an LP."""
+    return lp_name
+
+
+def test_tool_cascade_escalates_on_unknown_tool():
+    cascade_stats.reset()
+    small = _ToolFakeModel(responses=[
+        AIMessage(content="", tool_calls=[{"name": "lookup", "args": {"lp_name": "CFH"}, "id": "1"}]),
+        AIMessage(content="", tool_calls=[{"name": "made_up", "args": {}, "id": "2"}]),
+    ])
+    large = _ToolFakeModel(responses=[
+        AIMessage(content="", tool_calls=[{"name": "lookup", "args": {"lp_name": "GBE"}, "id": "3"}]),
+    ])
+    model = CascadeChatModel(primary=small, fallback=large, stage="test_supervisor").bind_tools([lookup])
+
+    first = asyncio.run(model.ainvoke([HumanMessage(content="x")]))
+    second = asyncio.run(model.ainvoke([HumanMessage(content="y")]))
+
+    assert first.tool_calls[0]["args"] == {"lp_name": "CFH"}
+    assert first.response_metadata["cascade"]["escalated"] is False
+    assert second.tool_calls[0]["args"] == {"lp_name": "GBE"}
+    assert second.response_metadata["cascade"]["reason"] == "unknown_tool"
+    assert cascade_stats.stats()["test_supervisor"]["escalations"] == 1
+
+
+def test_supervisor_subgraph_builds_with_cascade(monkeypatch):
+    monkeypatch.setenv("DASHSCOPE_API_KEY", "test-key")
+    assert graph_module.create_supervisor_subgraph() is not None
+
+
+def _metrics_for_cascade_call(small, large):
+    model = CascadeChatModel(primary=small, fallback=large, stage="test_metrics").bind_tools([lookup])
+
+    async def route(state):
+        return {"messages": [await model.ainvoke(state["messages"])]}
+
+    builder = StateGraph(MessagesState)
+    builder.add_node("route", route)
+    builder.add_edge(START, "route")
+    builder.add_edge("route", END)
+    metrics = RunMetricsCallback()
+    asyncio.run(builder.compile().ainvoke({"messages": [HumanMessage(content="x")]}, {"callbacks": [metrics]}))
+    return metrics.summary()["nodes"]["route"]
+
+
+def test_cascade_call_is_counted_once_in_run_metrics():
+    def reply(tool_name, input_tokens, output_tokens):
+        usage = {"input_tokens": input_tokens, "output_tokens": output_tokens, "total_tokens": input_tokens + output_tokens}
+        return AIMessage(content="", tool_calls=[{"name": tool_name, "args": {}, "id": "1"}], usage_metadata=usage)
+
+    direct = _metrics_for_cascade_call(_ToolFakeModel(responses=[reply("lookup", 11, 4)]), _ToolFakeModel(responses=[]))
+    escalated = _metrics_for_cascade_call(
+        _ToolFakeModel(responses=[reply("made_up", 11, 4)]), _ToolFakeModel(responses=[reply("lookup", 20, 6)]),
+    )
+
+    assert (direct["llm_calls"], direct["prompt_tokens"], direct["completion_tokens"]) == (1, 11, 4)
+    assert direct["prompt_static_tokens"] + direct["prompt_dynamic_tokens"] > 0
+    # One cascade call whose usage includes the discarded small-model attempt
+    assert (escalated["llm_calls"], escalated["prompt_tokens"], escalated["completion_tokens"]) == (1, 31, 10)
+    assert escalated["prompt_static_tokens"] == direct["prompt_static_tokens"]
+
+
+def test_model_choices_default_to_model_name_and_follow_run_config(monkeypatch):
+    monkeypatch.setenv("DASHSCOPE_API_KEY", "test-key")
+    monkeypatch.setenv("MODEL_NAME", "qwen-plus-latest")
+    single = Configuration.from_runnable_config()
+    per_run = Configuration.from_runnable_config({"configurable": {"supervisor_model": "qwen-turbo-latest"}})
+
+    assert {single.model, single.classifier_model, single.supervisor_model, single.report_model} == {"qwen-plus-latest"}
+    assert per_run.supervisor_model == "qwen-turbo-latest" and per_run.model == "qwen-plus-latest"
+    # One compiled supervisor per model selection
+    assert graph_module.get_supervisor_subgraph(per_run) is graph_module.get_supervisor_subgraph(per_run)
+    assert graph_module.get_supervisor_subgraph(per_run) is not graph_module.get_supervisor_subgraph(single)
+
+
+class _SpyToolModel(FakeMessagesListChatModel):
+    bind_calls: list = []
+
+    def bind_tools(self, tools, **kwargs):
+        self.bind_calls.append(kwargs)
+        return self
+
+
+def test_supervisor_tiers_keep_parallel_tool_calls_disabled(monkeypatch):
+    small = _SpyToolModel(bind_calls=[], responses=[AIMessage(content="", tool_calls=[{"name": "made_up", "args": {}, "id": "1"}])])
+    large = _SpyToolModel(bind_calls=[], responses=[AIMessage(content="done")])
+    models = {"small-model": small, "large-model": large, "report-model": _SpyToolModel(bind_calls=[], responses=[])}
+    monkeypatch.setattr(graph_module, "get_model", lambda name=None: models[name])
+    configurable = Configuration(supervisor_model="small-model", model="large-model", report_model="report-model")
+
+    supervisor = graph_module.create_supervisor_subgraph(configurable)
+    result = asyncio.run(supervisor.ainvoke({"messages": [HumanMessage(content="x")]}))
+
+    assert result["messages"][-1].content == "done"
+    assert small.bind_calls == large.bind_calls == [{"parallel_tool_calls": False}]
@@ -0,0 +1,68 @@
+import asyncio
+import json
+import random
+import time
+
+from langchain_core.messages import HumanMessage
+
+from src.agent import llm_registry
+from src.agent.llm_registry import ModelRegistry
+from src.agent.offline_llm import OfflineChatModel, parse_latency
+from src.agent.schemas import IntentClassification
+
+CFH = "[CFH] MAJESTIC FIN TRADE"
+
+
+def test_registry_serves_offline_models(monkeypatch):
+    monkeypatch.setitem(llm_registry.CONFIG, "BACKEND", "offline")
+    model = ModelRegistry.get_model("qwen-plus-latest")
+
+    assert isinstance(model, OfflineChatModel)
+    assert model is ModelRegistry.get_model("qwen-plus-latest")
+    result = asyncio.run(model.with_structured_output(IntentClassification).ainvoke(
+        [HumanMessage(content="User input: 看看CFH的保证金")]
+    ))
+    assert result.intent == "lp_margin_check_report" and result.slots.lp == CFH
+
+
+def test_full_graph_runs_offline(offline_graph):
+    config = {"configurable": {"thread_id": f"offline-{time.time()}"}}
+
+    result = asyncio.run(offline_graph.ainvoke({"messages": [HumanMessage(content="check CFH margin")]}, config))
+
+    payload = result["__interrupt__"][0].value
+    assert payload["type"] == "margin_check_approval"
+    assert "<HEALTH_STATUS>" in payload["report"] and CFH in payload["report"]
+    assert [m.name for m in result["messages"] if m.type == "tool"][0] == "get_lp_margin_check"
+
+
+def test_report_tokens_stream_through_astream_events(offline_graph):
+    config = {"configurable": {"thread_id": f"offline-stream-{time.time()}"}}
+
+    async def collect():
+        tokens = []
+        async for event in offline_graph.astream_events({"messages": [HumanMessage(content="check CFH margin")]}, config, version="v2"):
+            if event["event"] == "on_chat_model_stream" and event["data"]["chunk"].content:
+                tokens.append(event["data"]["chunk"].content)
+        return tokens
+
+    tokens = asyncio.run(collect())
+    assert len(tokens) > 20
+    assert "<HEALTH_STATUS>" in "".join(tokens)
+
+
+def test_scripted_responses_and_latency(tmp_path):
+    script = tmp_path / "script.json"
+    script.write_text(json.dumps({"text": [{"content": "first"}, {"content": "second"}]}))
+    model = OfflineChatModel(script=json.loads(script.read_text()), latency="fixed:0.05")
+
+    started = time.perf_counter()
+    replies = [model.invoke("hi").content for _ in range(3)]
+    assert replies == ["first", "second", "first"]
+    assert time.perf_counter() - started >= 0.15
+
+    sample = parse_latency("uniform:0.1,0.2")
+    rng = random.Random(7)
+    draws = [sample(rng) for _ in range(5)]
+    assert all(0.1 <= d <= 0.2 for d in draws)
+    assert draws == [parse_latency("uniform:0.1,0.2")(r) for r in [random.Random(7)] for _ in range(5)]
@@ -0,0 +1,55 @@
+import json
+import threading
+
+from src.agent import margin_tools
+from src.agent.prefetch import SnapshotPrefetcher, snapshot_prefetcher
+
+
+def _snapshot(lp_name=None):
+    return {"success": True, "lp_name": lp_name, "accounts": [], "positions": []}
+
+
+def test_take_returns_snapshot_for_matching_scope():
+    prefetcher = SnapshotPrefetcher(max_workers=1)
+    key = prefetcher.start("[CFH] MAJESTIC FIN TRADE", lambda: _snapshot("[CFH] MAJESTIC FIN TRADE"))
+
+    assert prefetcher.take(key, "[CFH] MAJESTIC FIN TRADE")["lp_name"] == "[CFH] MAJESTIC FIN TRADE"
+    assert prefetcher.take(key, "[CFH] MAJESTIC FIN TRADE") is None  # single use
+    assert prefetcher.stats()["used"] == 1
+
+
+def test_take_rejects_scope_mismatch_and_failures():
+    prefetcher = SnapshotPrefetcher(max_workers=1)
+    key = prefetcher.start(None, _snapshot)
+    assert prefetcher.take(key, "[GBEGlobal]GBEGlobal1") is None
+
+    key = prefetcher.start(None, lambda: {"success": False, "error": "boom"})
+    assert prefetcher.take(key, None) is None
+
+    stats = prefetcher.stats()
+    assert stats["scope_mismatch"] == 1
+    assert stats["failed"] == 1
+    assert stats["pending"] == 0
+
+
+def test_discard_drops_pending_prefetch():
+    prefetcher = SnapshotPrefetcher(max_workers=1)
+    release = threading.Event()
+    key = prefetcher.start(None, lambda: release.wait(1) and _snapshot())
+    prefetcher.discard(key)
+    release.set()
+
+    assert prefetcher.take(key, None) is None
+    assert prefetcher.stats()["discarded"] == 1
+
+
+def test_margin_tool_uses_prefetched_snapshot(monkeypatch):
+    def fail_fetch(*args, **kwargs):
+        raise AssertionError("tool should not fetch when a prefetched snapshot matches")
+
+    monkeypatch.setattr(margin_tools, "fetch_lp_snapshot", fail_fetch)
+    key = snapshot_prefetcher.start(None, _snapshot)
+
+    result = margin_tools.get_lp_margin_check.invoke({}, config={"configurable": {"prefetch_key": key}})
+
+    assert json.loads(result)["schemaVer"]
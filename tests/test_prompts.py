@@ -0,0 +1,51 @@
+import asyncio
+
+from langchain_core.language_models.fake_chat_models import FakeMessagesListChatModel
+from langchain_core.messages import AIMessage, HumanMessage, SystemMessage
+
+from src.agent.data_gateway import get_lp_mapping_string
+from src.agent.instrumentation import RunMetricsCallback
+from src.agent.prompts import (
+    PROMPT_TOKEN_BUDGETS,
+    build_intent_classification_messages,
+    prompt_budget_stats,
+    prompt_token_split,
+)
+
+
+def test_intent_prompt_prefix_is_byte_identical_and_excludes_user_input():
+    first = build_intent_classification_messages("check CFH margin", get_lp_mapping_string())
+    second = build_intent_classification_messages("hello there", get_lp_mapping_string())
+
+    assert isinstance(first[0], SystemMessage)
+    assert first[0].content == second[0].content
+    assert "check CFH margin" not in first[0].content
+    assert '"[CFH] MAJESTIC FIN TRADE"->143' in first[0].content
+    assert first[1].content == "User input: check CFH margin"
+
+
+def test_oversized_user_input_is_trimmed_to_the_budget():
+    prompt_budget_stats.reset()
+    user_input = "START " + "margin " * 5000 + " END"
+
+    messages = build_intent_classification_messages(user_input, get_lp_mapping_string())
+    split = prompt_token_split(messages)
+
+    assert split["total_tokens"] <= PROMPT_TOKEN_BUDGETS["intent_classification"]
+    assert messages[1].content.startswith("User input: START") and messages[1].content.endswith("END")
+    stats = prompt_budget_stats.stats()["intent_classification"]
+    assert stats["trimmed"] == 1 and stats["over_budget"] == 0
+
+
+def test_run_metrics_report_static_and_dynamic_prompt_tokens():
+    usage = {"input_tokens": 50, "output_tokens": 5, "total_tokens": 55, "input_token_details": {"cache_read": 40}}
+    model = FakeMessagesListChatModel(responses=[AIMessage(content="ok", usage_metadata=usage)])
+    messages = [SystemMessage(content="static " * 100), HumanMessage(content="dynamic")]
+    metrics = RunMetricsCallback()
+
+    asyncio.run(model.ainvoke(messages, {"callbacks": [metrics], "metadata": {"langgraph_node": "classify_intent"}}))
+    node = metrics.summary()["nodes"]["classify_intent"]
+
+    split = prompt_token_split(messages)
+    assert node["prompt_static_tokens"] == split["static_tokens"] > node["prompt_dynamic_tokens"] == split["dynamic_tokens"]
+    assert node["cached_prompt_tokens"] == 40
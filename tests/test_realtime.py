@@ -0,0 +1,172 @@
+import asyncio
+import json
+import time
+from datetime import datetime
+
+import httpx
+import pytest
+from fastapi import FastAPI
+from fastapi.testclient import TestClient
+
+from alert_service import api as alert_api
+from alert_service.realtime import Connection, RealtimeHub, SlowConsumer, Subscription
+from src.api import graph as api_graph
+
+CFH = "[CFH] MAJESTIC FIN TRADE"
+
+
+def _subscription(sub_id, policy, channel="cards"):
+    return Subscription(sub_id, channel, policy, set(), set(), None)
+
+
+def test_connection_buffer_applies_drop_policies():
+    async def scenario():
+        connection = Connection(queue_size=3)
+        cards = _subscription("c", "latest")
+        tokens = _subscription("t", "drop_oldest", "agent")
+        beats = _subscription("h", "drop_newest", "heartbeat")
+
+        connection.offer({"card": 1, "v": 1}, cards, key=1)
+        connection.offer({"card": 1, "v": 2}, cards, key=1)  # replaces the pending update
+        connection.offer({"token": "a"}, tokens)
+        connection.offer({"token": "b"}, tokens)
+        connection.offer({"beat": 1}, beats)  # buffer full: heartbeat discarded
+        connection.offer({"token": "c"}, tokens)  # buffer full: oldest (card update) evicted
+        connection.offer({"event": "interrupt"}, tokens, essential=True)  # never dropped
+        return [await connection.next_message() for _ in range(4)], cards.dropped, beats.dropped
+
+    messages, card_drops, beat_drops = asyncio.run(scenario())
+
+    assert messages == [{"token": "a"}, {"token": "b"}, {"token": "c"}, {"event": "interrupt"}]
+    assert card_drops == 2 and beat_drops == 1  # reported on the subscription's next delivery
+
+
+def test_disconnect_policy_closes_a_slow_consumer():
+    async def scenario():
+        connection = Connection(queue_size=1)
+        strict = _subscription("s", "disconnect", "agent")
+        connection.offer({"token": "a"}, strict)
+        with pytest.raises(SlowConsumer):
+            connection.offer({"token": "b"}, strict)
+        with pytest.raises(SlowConsumer):
+            await connection.next_message()
+
+    asyncio.run(scenario())
+
+
+def _card(card_id, lp):
+    now = datetime.utcnow()
+    return alert_api.AlertCard(
+        id=card_id, lp_name=lp, threshold=30, hysteresis_threshold=25, created_at=now, updated_at=now,
+        status=alert_api.AlertStatus.AWAITING_HITL, margin_level=92.0, last_margin_snapshot={},
+    )
+
+
+def test_websocket_multiplexes_cards_agent_streams_and_heartbeats(monkeypatch):
+    async def agent_events(thread_id):
+        await asyncio.sleep(0.2)  # subscribed before the run starts
+        yield "token", {"thread_id": thread_id, "content": "保证金"}
+        yield "interrupt", {"thread_id": thread_id, "status": "awaiting_approval"}
+        await asyncio.sleep(60)
+
+    hub = RealtimeHub(agent_events=agent_events)
+    service = alert_api.MonitoringService()
+    service.cards = {"card-cfh": _card("card-cfh", CFH), "card-other": _card("card-other", "OTHER")}
+    monkeypatch.setattr(alert_api, "realtime_hub", hub)
+    monkeypatch.setattr(alert_api, "monitoring_service", service)
+    app = FastAPI()
+    app.include_router(alert_api.router)
+
+    with TestClient(app) as client, client.websocket_connect("/alert/ws") as websocket:
+        def receive():
+            return json.loads(websocket.receive_text())
+
+        websocket.send_text(json.dumps({"op": "subscribe", "id": "c1", "channel": "cards", "lp": CFH}))
+        assert receive()["type"] == "subscribed"
+        snapshot = receive()
+        assert snapshot["snapshot"] and snapshot["data"]["id"] == "card-cfh"
+
+        client.post("/alert/cards/card-other/override", json={"status": "completed"})
+        client.post("/alert/cards/card-cfh/override", json={"status": "completed", "reason": "hedged"})
+        change = receive()
+        assert change["channel"] == "cards" and change["data"]["id"] == "card-cfh"
+        assert change["data"]["status"] == "completed"
+
+        websocket.send_text(json.dumps({"op": "subscribe", "id": "a1", "channel": "agent", "thread_id": "t-1"}))
+        assert receive()["type"] == "subscribed"
+        assert [receive()["event"] for _ in range(2)] == ["token", "interrupt"]
+        assert hub.snapshot()["agent_relays"] == ["t-1"]
+
+        websocket.send_text(json.dumps({"op": "subscribe", "id": "h1", "channel": "heartbeat"}))
+        assert receive()["type"] == "subscribed"
+        assert receive()["data"]["cards_by_status"] == {"completed": 2}
+
+        websocket.send_text(json.dumps({"op": "unsubscribe", "id": "a1"}))
+        assert receive() == {"type": "unsubscribed", "id": "a1", "found": True}
+        websocket.send_text(json.dumps({"op": "subscribe", "id": "x", "channel": "nope"}))
+        assert receive()["type"] == "error"
+
+        # The test client cancels the app right after a client close; let the server wind down first
+        websocket.close()
+        deadline = time.monotonic() + 5
+        while hub.snapshot()["open_connections"] and time.monotonic() < deadline:
+            time.sleep(0.01)
+
+    assert hub.snapshot()["agent_relays"] == []
+    assert hub.snapshot()["open_connections"] == 0
+
+
+def test_alert_thread_id_is_pushed_before_the_initial_report_runs(monkeypatch):
+    hub = RealtimeHub()
+    service = alert_api.MonitoringService()
+    service.cards = {"card-cfh": _card("card-cfh", CFH)}
+    monkeypatch.setattr(alert_api, "realtime_hub", hub)
+    seen = {}
+
+    async def call_margin_endpoint(url, payload):
+        seen["payload"] = payload
+        seen["pushed"] = await connection.next_message(keepalive=0.1)
+        return {"type": "interrupt", "status": "awaiting_approval", "thread_id": payload["thread_id"]}
+
+    monkeypatch.setattr(service, "_call_margin_endpoint", call_margin_endpoint)
+
+    async def scenario():
+        hub.subscribe(connection, {"op": "subscribe", "id": "c1", "channel": "cards"})
+        await service._trigger_margin_check("card-cfh", 92.0)
+        return await service.submit_hitl_feedback("card-cfh", "approve", None)
+
+    connection = hub.connect()
+    card = asyncio.run(scenario())
+
+    # Dashboards learn the thread while the report is still being written
+    assert seen["pushed"]["data"]["thread_id"] == seen["payload"]["thread_id"] == "margin_alert_card-cfh"
+    assert card["thread_id"] == "margin_alert_card-cfh" and card["status"] == "pending_recheck"
+
+
+def test_thread_followers_receive_every_run_on_the_thread(offline_app):
+    hub = api_graph.thread_streams
+    streamed, synchronous = f"follow-stream-{time.time()}", f"follow-sync-{time.time()}"
+
+    async def scenario():
+        async def follow(thread_id):
+            received = []
+            async for event in hub.follow(thread_id, keepalive=None):
+                received.append(event[0])
+                if event[0] == "end":
+                    return received
+
+        followers = [asyncio.create_task(follow(thread_id)) for thread_id in (streamed, synchronous)]
+        await asyncio.sleep(0)
+        async with httpx.AsyncClient(transport=httpx.ASGITransport(app=offline_app), base_url="http://test") as client:
+            for thread_id, params in ((streamed, {"stream": "true"}), (synchronous, {})):
+                await client.post("/agent/margin-check", params=params, json={
+                    "messages": [{"role": "user", "content": "check CFH margin"}], "thread_id": thread_id,
+                })
+        return await asyncio.wait_for(asyncio.gather(*followers), 5), hub.stats()
+
+    (streamed_events, synchronous_events), stats = asyncio.run(scenario())
+
+    assert streamed_events[0] == "token" and streamed_events[-2:] == ["interrupt", "end"]
+    # Synchronous runs publish their final event too
+    assert synchronous_events == ["interrupt", "end"]
+    assert stats["threads"] == 0
@@ -0,0 +1,82 @@
+import asyncio
+import json
+
+from langchain_core.messages import HumanMessage
+from langgraph.checkpoint.memory import InMemorySaver
+
+from src.agent import graph as graph_module
+from src.agent import margin_tools
+from src.agent.margin_tools import generate_margin_analysis
+from src.agent.report_templates import render_margin_report
+from src.agent.schemas import IntentContext
+
+CFH = "[CFH] MAJESTIC FIN TRADE"
+GBE = "[GBEGlobal]GBEGlobal1"
+
+
+def _analysis():
+    accounts = [
+        {"LP": CFH, "Equity": 100000, "Margin": 90000, "Free Margin": 10000, "Margin Utilization %": 90.0,
+         "updated_at": "2025-01-01 10:00:00"},
+        {"LP": GBE, "Equity": 200000, "Margin": 40000, "Free Margin": 160000, "Margin Utilization %": 20.0,
+         "updated_at": "2025-01-01 10:00:05"},
+    ]
+    positions = [
+        {"LP": CFH, "Symbol": "XAUUSD", "Position": 10, "Margin": 90000},
+        {"LP": GBE, "Symbol": "XAUUSD", "Position": -6, "Margin": 40000},
+    ]
+    return generate_margin_analysis(accounts, positions)
+
+
+def test_render_margin_report_sections_and_determinism():
+    analysis = _analysis()
+    report = render_margin_report(analysis, "zh")
+
+    for tag in ("HEALTH_STATUS", "SUMMARY_METRICS", "CRITICAL_ALERTS", "PRIORITY_RECOMMENDATIONS", "DETAILED_ANALYSIS"):
+        assert f"<{tag}>" in report and f"</{tag}>" in report
+    assert f"🔴 {CFH}: 90.0%" in report
+    assert "P0 - 对冲清理 XAUUSD" in report
+    assert "2025-01-01 10:00:05" in report
+    assert report == render_margin_report({**analysis, "traceId": "other"}, "zh")
+
+
+def test_render_margin_report_english_healthy():
+    analysis = _analysis()
+    for lp in analysis["perLP"]:
+        lp["marginLevel"] = 10.0
+    analysis["status"] = "ok"
+    analysis["recommendations"] = []
+
+    report = render_margin_report(analysis, "en")
+    assert "OK - all LPs are below" in report
+    assert "None - margin usage is within the safe range" in report
+
+
+def test_margin_alert_uses_template_route_without_llm(monkeypatch):
+    snapshot_calls = []
+
+    def fake_snapshot(lp_name=None, api_client=None):
+        snapshot_calls.append(lp_name)
+        return {"success": True, "lp_name": lp_name, "accounts": [], "positions": []}
+
+    def fail(*args, **kwargs):
+        raise AssertionError("alert route must not call the LLM pipeline")
+
+    monkeypatch.setattr(margin_tools, "fetch_lp_snapshot", fake_snapshot)
+    monkeypatch.setattr(graph_module, "classify_with_llm", fail)
+    monkeypatch.setattr(graph_module, "get_supervisor_subgraph", fail)
+
+    graph = graph_module.get_graph().compile(checkpointer=InMemorySaver())
+    state = {
+        "messages": [HumanMessage(content="MARGIN ALERT")],
+        "intentContext": IntentContext(intent="lp_margin_check_report", confidence=1.0, slots={"lp": CFH}),
+        "eventType": "MARGIN_ALERT",
+    }
+    result = asyncio.run(graph.ainvoke(state, config={"configurable": {"thread_id": "alert-1"}}))
+
+    payload = result["__interrupt__"][0].value
+    assert payload["source"] == "template"
+    assert "<HEALTH_STATUS>" in payload["report"]
+    assert snapshot_calls == [CFH]
+    assert json.loads(result["messages"][-2].content)["schemaVer"]
+    assert result.get("eventType") is None
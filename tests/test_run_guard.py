@@ -0,0 +1,112 @@
+import asyncio
+import json
+import uuid
+
+from langchain_core.language_models.chat_models import BaseChatModel
+from langchain_core.messages import AIMessage, HumanMessage
+from langchain_core.outputs import ChatGeneration, ChatResult
+from langchain_core.utils.function_calling import convert_to_openai_tool
+
+from src.agent import graph as graph_module
+from src.agent import margin_tools
+from src.agent.run_guard import run_guards
+from src.agent.schemas import IntentContext
+
+CFH = "[CFH] MAJESTIC FIN TRADE"
+
+
+class _Fetches:
+    def __init__(self):
+        self.calls = 0
+
+    def __call__(self, lp_name=None, api_client=None):
+        self.calls += 1
+        return {
+            "success": True,
+            "lp_name": lp_name,
+            "accounts": [{"LP": CFH, "Equity": 100000, "Margin": 50000, "Margin Utilization %": 50.0}],
+            "positions": [],
+        }
+
+
+class _LoopingModel(BaseChatModel):
+    """Keeps calling get_lp_margin_check whenever it is bound; otherwise writes a report."""
+
+    tool_names: list = []
+
+    @property
+    def _llm_type(self) -> str:
+        return "looping"
+
+    def bind_tools(self, tools, **kwargs):
+        return self.model_copy(update={"tool_names": [convert_to_openai_tool(t)["function"]["name"] for t in tools]})
+
+    def _generate(self, messages, stop=None, run_manager=None, **kwargs):
+        if "get_lp_margin_check" in self.tool_names:
+            message = AIMessage(content="", tool_calls=[
+                {"name": "get_lp_margin_check", "args": {}, "id": f"call_{uuid.uuid4().hex}"}
+            ])
+        else:
+            message = AIMessage(content="margin report")
+        return ChatResult(generations=[ChatGeneration(message=message)])
+
+
+def test_repeated_tool_calls_reuse_the_run_result(monkeypatch):
+    fetches = _Fetches()
+    monkeypatch.setattr(margin_tools, "fetch_lp_snapshot", fetches)
+    key = run_guards.open(max_tool_calls=4, max_llm_iterations=6)
+    config = {"configurable": {"run_guard_key": key, "lp_scope": [CFH]}}
+
+    first = margin_tools.get_lp_margin_check.invoke({}, config)
+    second = margin_tools.get_lp_margin_check.invoke({"lp_name": CFH}, config)
+    summary = run_guards.close(key)
+
+    assert first == second
+    assert json.loads(first)["perLP"][0]["lp"] == CFH
+    assert fetches.calls == 1
+    assert summary == {"tool_calls": 2, "cache_hits": 1, "llm_iterations": 0, "tripped": None}
+    # Outside a run, nothing is cached
+    margin_tools.get_lp_margin_check.invoke({}, {"configurable": {"lp_scope": [CFH]}})
+    assert fetches.calls == 2
+
+
+def test_over_budget_calls_never_return_another_lps_analysis(monkeypatch):
+    fetches = _Fetches()
+    monkeypatch.setattr(margin_tools, "fetch_lp_snapshot", fetches)
+    key = run_guards.open(max_tool_calls=1, max_llm_iterations=6)
+    config = {"configurable": {"run_guard_key": key}}
+
+    first = margin_tools.get_lp_margin_check.invoke({"lp_name": CFH}, config)
+    other = margin_tools.get_lp_margin_check.invoke({"lp_name": "[GBEGlobal]GBEGlobal1"}, config)
+    repeat = margin_tools.get_lp_margin_check.invoke({"lp_name": CFH}, config)
+    run_guards.close(key)
+
+    assert fetches.calls == 1
+    assert other.startswith("Tool call budget exhausted") and CFH not in other
+    assert repeat == first  # the same arguments still get their own cached result
+
+def test_looping_supervisor_is_short_circuited_to_the_report_writer(monkeypatch):
+    fetches = _Fetches()
+    monkeypatch.setattr(margin_tools, "fetch_lp_snapshot", fetches)
+    monkeypatch.setattr(graph_module, "get_model", lambda *args, **kwargs: _LoopingModel())
+    supervisor = graph_module.create_supervisor_subgraph()
+    monkeypatch.setattr(graph_module, "get_supervisor_subgraph", lambda configurable=None: supervisor)
+    run_guards.reset()
+
+    state = {
+        "messages": [HumanMessage(content="check CFH margin")],
+        "intentContext": IntentContext(intent="lp_margin_check_report", slots={"lp": CFH}),
+    }
+    config = {"configurable": {"thread_id": "guard", "max_tool_calls_per_run": 2, "max_llm_iterations_per_run": 10}}
+    result = asyncio.run(graph_module.call_supervisor(state, config))
+
+    tool_results = [m for m in result["messages"] if getattr(m, "name", None) == "get_lp_margin_check"]
+    assert fetches.calls == 1
+    assert len(tool_results) == 3  # two within budget, the third answered from the run cache
+    final = result["messages"][-1]
+    assert final.name == "human_approval" and final.content
+
+    stats = run_guards.stats()
+    assert stats["runs"] == 1 and stats["open"] == 0
+    assert stats["tripped"] == {"max_tool_calls": 1}
+    assert stats["llm_iterations"] == 5  # 3 tool calls, forced handoff, forced forward
@@ -0,0 +1,82 @@
+import asyncio
+
+import httpx
+import pytest
+from fastapi import FastAPI
+
+from src.api import graph as api_graph
+from src.api.scheduler import RunRejected, RunScheduler
+
+
+def test_waiting_runs_start_in_priority_order():
+    async def scenario():
+        scheduler = RunScheduler(max_concurrent=1)
+        started = []
+        first = await scheduler.acquire("chat")
+
+        async def run(priority):
+            ticket = await scheduler.acquire(priority)
+            started.append(priority)
+            scheduler.release(ticket)
+
+        tasks = [asyncio.create_task(run(p)) for p in ("chat", "recheck", "alert")]
+        await asyncio.sleep(0)
+        assert scheduler.stats()["queued"] == 3
+        scheduler.release(first)
+        await asyncio.gather(*tasks)
+        return started, scheduler.stats()
+
+    started, stats = asyncio.run(scenario())
+    assert started == ["alert", "recheck", "chat"]
+    assert stats["running"] == 0 and stats["queued"] == 0
+    assert stats["classes"]["chat"]["admitted"] == 2
+
+
+def test_queue_depth_sheds_low_priority_first():
+    async def scenario():
+        scheduler = RunScheduler(max_concurrent=1, max_queue_depth={"alert": 5, "recheck": 2, "chat": 1})
+        running = await scheduler.acquire("alert")
+        waiting = asyncio.create_task(scheduler.acquire("chat"))
+        await asyncio.sleep(0)
+
+        with pytest.raises(RunRejected) as rejected:
+            await scheduler.acquire("chat")
+        alert = asyncio.create_task(scheduler.acquire("alert"))
+        await asyncio.sleep(0)
+        queued = scheduler.queued
+
+        # A cancelled waiter gives its place back
+        waiting.cancel()
+        await asyncio.gather(waiting, return_exceptions=True)
+        scheduler.release(running)
+        scheduler.release(await alert)
+        return rejected.value, queued, scheduler.stats()
+
+    rejected, queued, stats = asyncio.run(scenario())
+    assert rejected.retry_after >= 1
+    assert queued == 2
+    assert stats["classes"]["chat"]["rejected"] == 1
+    assert stats["running"] == 0 and stats["queued"] == 0
+
+
+def test_overloaded_endpoint_returns_429(monkeypatch):
+    async def scenario():
+        scheduler = RunScheduler(max_concurrent=1, max_queue_depth={"alert": 1, "recheck": 0, "chat": 0})
+        monkeypatch.setattr(api_graph, "run_scheduler", scheduler)
+        ticket = await scheduler.acquire("alert")
+
+        app = FastAPI()
+        app.include_router(api_graph.router)
+        app.state.graph = object()
+        async with httpx.AsyncClient(transport=httpx.ASGITransport(app=app), base_url="http://test") as client:
+            response = await client.post("/agent/margin-check", json={"messages": [{"role": "user", "content": "hi"}]})
+            stream_response = await client.post(
+                "/agent/margin-check/recheck?stream=true", json={"thread_id": "t1"}
+            )
+        scheduler.release(ticket)
+        return response, stream_response
+
+    response, stream_response = asyncio.run(scenario())
+    assert response.status_code == 429
+    assert int(response.headers["Retry-After"]) >= 1
+    assert stream_response.status_code == 429
@@ -0,0 +1,59 @@
+import asyncio
+import time
+
+import httpx
+import orjson
+
+from src.api.streaming import coalesce_tokens, sse_frame
+
+CFH = "[CFH] MAJESTIC FIN TRADE"
+
+
+async def _items(script):
+    for delay, item in script:
+        await asyncio.sleep(delay)
+        yield item
+
+
+def _collect(script, **kwargs):
+    async def scenario():
+        return [item async for item in coalesce_tokens(_items(script), **kwargs)]
+
+    return asyncio.run(scenario())
+
+
+def test_tokens_are_flushed_by_size_interval_and_before_state():
+    script = [(0, ("token", "ab")), (0, ("token", "cd")), (0, ("token", "e")), (0, ("token", "f")),
+              (0.1, ("token", "g")), (0, ("state", {"done": True})), (0, ("token", "h"))]
+
+    items = _collect(script, flush_interval=0.03, flush_bytes=4)
+
+    assert items == [("token", "abcd"), ("token", "ef"), ("token", "g"), ("state", {"done": True}), ("token", "h")]
+
+
+def test_sse_frame_keeps_non_ascii_text():
+    frame = sse_frame("token", {"content": "保证金 92%", "at": time.struct_time((2026, 1, 1, 0, 0, 0, 0, 1, 0))})
+
+    assert frame.startswith("event: token\ndata: ")
+    assert frame.endswith("\n\n")
+    assert orjson.loads(frame.split("data: ", 1)[1])["content"] == "保证金 92%"
+
+
+def test_stream_sends_report_tokens_in_batches_and_ends_with_the_interrupt(offline_app):
+    body = {"messages": [{"role": "user", "content": "check CFH margin"}], "thread_id": f"stream-{time.time()}"}
+
+    async def scenario():
+        transport = httpx.ASGITransport(app=offline_app)
+        async with httpx.AsyncClient(transport=transport, base_url="http://test") as client:
+            response = await client.post("/agent/margin-check", params={"stream": "true"}, json=body)
+            return response.text
+
+    text = asyncio.run(scenario())
+    frames = [frame for frame in text.split("\n\n") if frame]
+    kinds = [frame.split("\n", 1)[0].removeprefix("event: ") for frame in frames]
+    tokens = [orjson.loads(frame.split("data: ", 1)[1])["content"] for frame in frames if frame.startswith("event: token")]
+
+    assert kinds[-2:] == ["interrupt", "end"]
+    assert 0 < len(tokens) < len("".join(tokens)) // 4  # tokens are coalesced into larger frames
+    interrupt = orjson.loads(frames[-2].split("data: ", 1)[1])
+    assert CFH in interrupt["interrupt_data"]["report"]